@@ -0,0 +1,80 @@
+"""Eviction check: a stabilized output linked into the stabilization cache must actually be freed"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from gyroflow.stabilization_cache import StabilizationCache
+from utils.storage_manager import StorageManager
+
+
+def write_file(path, size, age_s=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    then = time.time() - age_s
+    os.utime(path, (then, then))
+    return path
+
+
+def make_recording(base_path, name, size, age_s):
+    """A finished recording whose stabilized output is held by the cache, as run_gyroflow leaves it."""
+    folder = os.path.join(base_path, name)
+    write_file(os.path.join(folder, f"{name}.MP4"), size, age_s)
+    write_file(os.path.join(folder, "clips", f"{name}_clips.json"), 2, age_s)
+    stabilized = write_file(os.path.join(folder, f"{name}_stabilized.mp4"), size, age_s)
+    return stabilized
+
+
+def check(work_dir, size):
+    """Returns the failures found; an empty list means the check passed."""
+    base_path = os.path.join(work_dir, "camera")
+    cache = StabilizationCache(os.path.join(work_dir, "stabilization"), max_bytes=100 * size)
+
+    stabilized = make_recording(base_path, "Runcam6_0001", size, age_s=7200)
+    cache.store("a" * 64, {"stabilized.mp4": stabilized})
+    # A link the cache does not own: deleting it would free nothing
+    pinned = make_recording(base_path, "Runcam6_0002", size, age_s=3600)
+    os.link(pinned, os.path.join(work_dir, "elsewhere.mp4"))
+
+    failures = []
+    if os.stat(stabilized).st_nlink != 2:
+        failures.append(f"expected the cache to hard-link {stabilized}")
+
+    manager = StorageManager(os.path.join(work_dir, "storage.db"), base_path, budget_bytes=size,
+                             high_watermark=None, low_watermark=None, min_idle_hours=0, cache=cache)
+    manager.scan()
+    dry = manager.evict(dry_run=True)
+    if stabilized not in dry:
+        failures.append(f"dry run would not evict the cached output: {dry}")
+    if cache.total_size() == 0:
+        failures.append("dry run dropped the cache entry")
+
+    evicted = manager.evict()
+    if stabilized not in evicted or os.path.exists(stabilized):
+        failures.append(f"cached stabilized output not evicted: {evicted}")
+    if cache.keys_linked_to(stabilized) or cache.total_size() != 0:
+        failures.append("cache entry still holds the evicted output")
+    if any(f == "stabilized.mp4" for _, _, files in os.walk(cache.cache_dir) for f in files):
+        failures.append("cache still has a link of the evicted output on disk")
+    if pinned in evicted or not os.path.exists(pinned):
+        failures.append("evicted a file with a hard link outside the cache")
+    if not manager.is_retired(stabilized):
+        failures.append("evicted output not remembered as retired")
+    return failures
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that evicting a cached stabilized output frees its space.")
+    parser.add_argument("--size", type=int, default=1024 * 1024, help="Bytes per synthetic video.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="tiktok_evict_") as work_dir:
+        failures = check(work_dir, args.size)
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("✅ Cached stabilized output was freed; other hard links were left alone.")
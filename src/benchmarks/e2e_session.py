@@ -0,0 +1,138 @@
+"""End-to-end benchmark of a recording session using a simulated camera"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from benchmarks.synthetic import generate_gcsv, generate_video
+from utils.config_manager import ConfigManager
+from utils.camera import Camera
+from utils.camera_backends import SimulatedBackend
+from utils.pipeline import Pipeline, TaskStore
+from utils.stages import add_ingest_tasks, add_recording_tasks, stage_workers
+
+config = ConfigManager()
+
+
+def build_card(card_dir, recordings, minutes, rate_hz=200, fps=30, size="1280x720"):
+    """Fills card_dir/DCIM the way a Runcam does: one video and one GCSV per recording."""
+    dcim = os.path.join(card_dir, "DCIM", "100RUNCAM")
+    for i in range(recordings):
+        name = f"Runcam6_{i + 1:04d}"
+        video = generate_video(os.path.join(dcim, f"{name}.MP4"), minutes * 60, fps, size)
+        generate_gcsv(os.path.join(dcim, f"{name}.gcsv"), rate_hz, minutes * 60, seed=i,
+                      video_name=os.path.basename(video))
+        print(f"  Generated {name} ({minutes} min)")
+
+
+def _size_of(paths):
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+# Statuses of tasks that did not produce their outputs
+INCOMPLETE = ("failed", "blocked")
+
+
+def _stage_report(results, wall_clock, input_bytes):
+    """Wall clock and task counts; MB/s only when every task produced its outputs."""
+    counts = {}
+    for status, _ in results.values():
+        counts[status] = counts.get(status, 0) + 1
+    complete = not any(counts.get(s) for s in INCOMPLETE)
+    return {
+        "wall_clock_s": wall_clock,
+        "tasks": counts,
+        "input_mb": input_bytes / 1024**2,
+        "mb_per_s": input_bytes / 1024**2 / wall_clock if complete and wall_clock > 0 else None,
+    }
+
+
+def run_session(work_dir, card_dir, stages, workers):
+    """Replays one camera session through the pipeline and times every stage."""
+    # The simulated card uses the first configured serial, so Camera() sees a known device
+    serials = list(config.config.get("cameras") or ["SIMULATED"])
+    library = os.path.join(work_dir, "library")
+    store = TaskStore(os.path.join(work_dir, "pipeline.db"))
+    report = {}
+    session_start = time.perf_counter()
+
+    # --- Ingest, through the same Camera code paths as a real device ---
+    start = time.perf_counter()
+    camera = Camera(backend=SimulatedBackend(card_dir, serial=serials[0]), known_serials=serials)
+    camera.mount(os.path.join(work_dir, "mount"))
+    pipeline = Pipeline(store)
+    ingest_tasks = add_ingest_tasks(pipeline, camera, library)
+    results = pipeline.run(stages=["ingest"], workers=workers)
+    camera.unmount()
+    ingested = _size_of(p for t in ingest_tasks for p in t.outputs)
+    report["ingest"] = _stage_report(results, time.perf_counter() - start, ingested)
+
+    videos = sorted(
+        p for t in ingest_tasks for p in t.outputs if not p.lower().endswith(".gcsv")
+    )
+    video_bytes = _size_of(videos)
+
+    # --- Processing stages, one pipeline run each so they can be timed apart ---
+    pipeline = Pipeline(store)
+    for video in videos:
+        add_recording_tasks(pipeline, video, stages)
+    for stage in stages:
+        start = time.perf_counter()
+        results = pipeline.run(stages=[stage], workers=workers)
+        wall = time.perf_counter() - start
+        input_bytes = sum(_size_of(pipeline.tasks[name].inputs) for name in results)
+        report[stage] = _stage_report(results, wall, input_bytes)
+
+    report["session_wall_clock_s"] = time.perf_counter() - session_start
+    report["video_mb"] = video_bytes / 1024**2
+    return report
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a simulated camera session through the whole pipeline.")
+    parser.add_argument("--recordings", type=int, default=4, help="Number of recordings on the fake card.")
+    parser.add_argument("--minutes", type=float, default=2, help="Length of each recording in minutes.")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--gcsv-rate", type=int, default=200)
+    parser.add_argument("--stages", default="audio,peaks,clips,reel",
+                        help="Stages run after ingest (add 'stabilize' when gyroflow is installed).")
+    parser.add_argument("--workers", action="append", metavar="STAGE=N",
+                        help="Worker count for a stage (repeatable).")
+    parser.add_argument("--output", default="e2e_results.json")
+    args = parser.parse_args()
+
+    overrides = {}
+    for value in args.workers or []:
+        stage, _, count = value.partition("=")
+        overrides[stage.strip()] = int(count)
+    workers = stage_workers(overrides)
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="tiktok_e2e_") as work_dir:
+        card_dir = os.path.join(work_dir, "card")
+        print(f"Generating fake card with {args.recordings} recordings...")
+        build_card(card_dir, args.recordings, args.minutes, args.gcsv_rate, args.fps, args.size)
+        report = run_session(work_dir, card_dir, stages, workers)
+
+    report["params"] = vars(args)
+    report["machine"] = {"node": platform.node(), "python": platform.python_version(), "cpus": os.cpu_count()}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'stage':<10} {'wall (s)':>10} {'MB/s':>10}  tasks")
+    for stage in ["ingest"] + stages:
+        entry = report[stage]
+        rate = f"{entry['mb_per_s']:.1f}" if entry["mb_per_s"] else "-"
+        tasks = ", ".join(f"{s}: {n}" for s, n in sorted(entry["tasks"].items()))
+        print(f"{stage:<10} {entry['wall_clock_s']:>10.2f} {rate:>10}  {tasks}")
+    print(f"Session wall clock: {report['session_wall_clock_s']:.2f}s")
+
+    incomplete = [stage for stage in ["ingest"] + stages
+                  if any(report[stage]["tasks"].get(s) for s in INCOMPLETE)]
+    if incomplete:
+        print(f"❌ Failed or blocked tasks in: {', '.join(incomplete)}")
+        sys.exit(1)
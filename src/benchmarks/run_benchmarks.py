@@ -0,0 +1,180 @@
+"""Benchmarks of the pipeline hot paths, with comparison against a stored baseline"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.synthetic import generate_gcsv, generate_video
+from utils.config_manager import ConfigManager
+from utils.manage_csv import CSVManager, load_binary
+from utils.edit_video import get_interval_clip, create_highlight_clips
+from utils.extract_audio_wav import extract_audio_ffmpeg
+from gyroflow.interpolate_gcsv import read_and_prepare_gcsv_data, interpolate_data_for_frames
+
+config = ConfigManager()
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silences whatever the benchmarked code prints."""
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+
+def measure(fn, repeat=5, setup=None):
+    """
+    Times fn() repeat times, silencing whatever it prints.
+
+    :param setup: Optional callable run before each repetition, not timed
+    :return: Dict with the median, min and max duration in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with quiet():
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "max_s": max(timings),
+        "repeat": repeat,
+    }
+
+
+def run_suite(work_dir, gcsv_rate=200, gcsv_duration=600, video_duration=20, repeat=5, media=True):
+    """Generates the inputs in work_dir and benchmarks every hot path."""
+    results = {}
+
+    gcsv_path = generate_gcsv(os.path.join(work_dir, "bench.gcsv"), gcsv_rate, gcsv_duration)
+    params = {"rate_hz": gcsv_rate, "duration_s": gcsv_duration}
+
+    # The binary GCSV cache goes to work_dir, not the operator's, and is emptied
+    # before each parse so create_dataframe times the text parser, not a cache hit
+    gcsv_cache = os.path.join(work_dir, "gcsv_cache")
+    cache_config = config.config.setdefault("cache", {})
+    saved = cache_config.get("gcsv")
+    cache_config["gcsv"] = {"path": gcsv_cache, "max_bytes": None}
+    try:
+        results["gcsv.create_dataframe"] = measure(
+            lambda: CSVManager(gcsv_path), repeat, setup=lambda: shutil.rmtree(gcsv_cache, ignore_errors=True))
+        with quiet():
+            CSVManager(gcsv_path)
+        results["gcsv.load_binary"] = measure(lambda: load_binary(gcsv_path), repeat)
+    finally:
+        if saved is None:
+            cache_config.pop("gcsv", None)
+        else:
+            cache_config["gcsv"] = saved
+    results["gcsv.read_and_prepare_gcsv_data"] = measure(lambda: read_and_prepare_gcsv_data(gcsv_path), repeat)
+
+    with quiet():
+        manager = CSVManager(gcsv_path)
+        gcsv_data = read_and_prepare_gcsv_data(gcsv_path)
+    results["peaks.detect_peaks"] = measure(
+        lambda: manager.detect_peaks(kind='acceleration', top_n=5, plot=False), repeat)
+
+    fps = 30
+    frame_count = int(gcsv_duration * fps)
+    results["interpolate.interpolate_data_for_frames"] = measure(
+        lambda: interpolate_data_for_frames(gcsv_data, fps, frame_count), repeat)
+
+    peak_times = list(np.random.default_rng(0).uniform(0, gcsv_duration, 5000))
+    results["clips.get_interval_clip"] = measure(lambda: get_interval_clip(peak_times), repeat)
+
+    for name in results:
+        results[name]["params"] = params
+
+    if media:
+        video_path = generate_video(os.path.join(work_dir, "bench.mp4"), video_duration)
+        media_params = {"video_duration_s": video_duration}
+        clips_dir = os.path.join(work_dir, "clips")
+        intervals = [(1.0, 3.0), (video_duration / 2, video_duration / 2 + 2.0)]
+        results["clips.export"] = measure(
+            lambda: create_highlight_clips(video_path, intervals, clips_dir), repeat=max(1, repeat // 2))
+        results["clips.export"]["params"] = media_params
+
+        wav_path = os.path.join(work_dir, "bench.wav")
+        results["audio.extract_audio_ffmpeg"] = measure(
+            lambda: extract_audio_ffmpeg(video_path, wav_path), repeat)
+        results["audio.extract_audio_ffmpeg"]["params"] = media_params
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Lists benchmarks whose median got slower than the baseline by more
+    than tolerance (a fraction, 0.2 = 20%).
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = result["median_s"] / base["median_s"] if base["median_s"] else float("inf")
+        result["baseline_median_s"] = base["median_s"]
+        result["ratio"] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark GCSV parsing, peak detection, clipping and audio extraction.")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the results as JSON.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before failing (0.2 = 20%%).")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--gcsv-rate", type=int, default=200, help="Synthetic IMU rate in Hz.")
+    parser.add_argument("--gcsv-duration", type=float, default=600, help="Synthetic log length in seconds.")
+    parser.add_argument("--video-duration", type=float, default=20, help="Synthetic video length in seconds.")
+    parser.add_argument("--no-media", action="store_true", help="Skip the ffmpeg based benchmarks.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="tiktok_bench_") as work_dir:
+        results = run_suite(work_dir, args.gcsv_rate, args.gcsv_duration, args.video_duration,
+                            args.repeat, media=not args.no_media)
+
+    report = {
+        "created": time.time(),
+        "machine": {"node": platform.node(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in results.items():
+        line = f"{name:<42} {result['median_s'] * 1000:10.2f} ms"
+        if "ratio" in result:
+            line += f"  ({result['ratio']:.2f}x baseline)"
+        print(line)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions:
+        for name, ratio in regressions:
+            print(f"❌ Regression: {name} is {ratio:.2f}x slower than the baseline", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,119 @@
+"""Soak check: repeated clip exports must not leak memory, file descriptors or ffmpeg processes"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+from benchmarks.run_benchmarks import quiet
+from benchmarks.synthetic import generate_video
+from utils.edit_video import create_highlight_clips
+from utils.media_readers import readers
+
+
+def rss_mb():
+    """Resident memory of this process in MB, from /proc."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def fd_count():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def child_count():
+    """Live child processes (ffmpeg readers) of this process."""
+    pid = str(os.getpid())
+    count = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[1] == pid:
+                    count += 1
+        except (OSError, IndexError):
+            continue
+    return count
+
+
+def sample():
+    gc.collect()
+    return {"rss_mb": rss_mb(), "fds": fd_count(), "children": child_count()}
+
+
+def soak(work_dir, iterations=50, warmup=5, videos=2, duration_s=6):
+    """
+    Exports clips from a few synthetic videos over and over, closing the
+    pool between rounds like main.py does between sessions, and records
+    resource usage after each iteration.
+    """
+    sources = [
+        generate_video(os.path.join(work_dir, f"soak_{i}.mp4"), duration_s=duration_s, size="320x240")
+        for i in range(videos)
+    ]
+    windows = [(0.5, 1.5), (2.0, 3.0), (4.0, 5.0)]
+    out_dir = os.path.join(work_dir, "clips")
+
+    samples = []
+    for i in range(warmup + iterations):
+        with quiet():
+            for video in sources:
+                create_highlight_clips(video, windows, out_dir)
+        if i % 5 == 4:
+            readers.close_all()
+        if i >= warmup:
+            samples.append(sample())
+    readers.close_all()
+    final = sample()
+    return samples, final
+
+
+def check(samples, final, max_rss_growth_mb, max_fd_growth):
+    """Compares the first and last samples; returns a list of failures."""
+    first, last = samples[0], samples[-1]
+    failures = []
+    if last["rss_mb"] - first["rss_mb"] > max_rss_growth_mb:
+        failures.append(f"RSS grew {last['rss_mb'] - first['rss_mb']:.1f} MB")
+    if last["fds"] - first["fds"] > max_fd_growth:
+        failures.append(f"open fds grew from {first['fds']} to {last['fds']}")
+    # Each idle reader holds two ffmpeg processes: video and audio
+    if max(s["children"] for s in samples) > 2 * readers.max_idle:
+        failures.append(f"up to {max(s['children'] for s in samples)} reader processes alive at once")
+    if final["children"]:
+        failures.append(f"{final['children']} reader processes left after close_all()")
+    return failures
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that clip exports keep memory, fds and processes flat.")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=50.0)
+    parser.add_argument("--max-fd-growth", type=int, default=2)
+    parser.add_argument("--output", help="Write every sample as JSON.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="tiktok_soak_") as work_dir:
+        samples, final = soak(work_dir, args.iterations, args.warmup)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"samples": samples, "final": final}, f, indent=2)
+
+    first, last = samples[0], samples[-1]
+    print(f"RSS: {first['rss_mb']:.1f} -> {last['rss_mb']:.1f} MB")
+    print(f"fds: {first['fds']} -> {last['fds']}")
+    print(f"reader processes: max {max(s['children'] for s in samples)}, {final['children']} after close_all()")
+    print(f"readers opened: {readers.opened}, reused: {readers.reused}")
+
+    failures = check(samples, final, args.max_rss_growth_mb, args.max_fd_growth)
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("✅ Resource usage stayed flat.")
@@ -0,0 +1,107 @@
+"""Generators of synthetic GCSV logs and test videos for benchmarking"""
+import argparse
+import os
+import subprocess
+import numpy as np
+from utils.extract_audio_wav import ffmpeg_command
+
+
+def find_ffmpeg():
+    """ffmpeg from the PATH, or the binary bundled with imageio-ffmpeg; the same one the audio stage runs."""
+    return ffmpeg_command()
+
+
+def generate_gcsv(path, rate_hz=200, duration_s=60, events=10, seed=0, video_name=None):
+    """
+    Writes a GCSV log with gyro noise, slow camera motion and a few hard
+    braking events, in the layout the Runcam cameras produce.
+
+    :param path: Output .gcsv path
+    :param rate_hz: Sample rate of the IMU
+    :param duration_s: Length of the log in seconds
+    :param events: Number of braking events spread over the log
+    :param seed: Seed of the random generator, for reproducible files
+    :param video_name: Value of the videofilename metadata line
+    :return: Path of the written file
+    """
+    rng = np.random.default_rng(seed)
+    tscale = 0.001
+    gscale = 0.00122173047
+    ascale = 0.00048828125
+
+    n = int(rate_hz * duration_s)
+    t = np.arange(n) / rate_hz
+    gyro = rng.normal(0, 2.0, (n, 3)) + 10 * np.sin(2 * np.pi * 0.2 * t)[:, None]
+    accel = rng.normal(0, 0.05, (n, 3))
+    accel[:, 1] += 1.0  # gravity
+
+    # Braking events: half-second negative pulses on every axis
+    for center in rng.uniform(1, max(duration_s - 1, 1.5), events):
+        window = np.abs(t - center) < 0.25
+        accel[window] -= rng.uniform(0.5, 1.5)
+
+    raw_t = np.round(t / tscale).astype(np.int64)
+    raw_gyro = np.round(np.deg2rad(gyro) / gscale).astype(np.int64)
+    raw_accel = np.round(accel / ascale).astype(np.int64)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write("GYROFLOW IMU LOG\n")
+        f.write("version,1.3\n")
+        f.write("id,synthetic\n")
+        f.write("orientation,xYz\n")
+        if video_name:
+            f.write(f"videofilename,{video_name}\n")
+        f.write(f"tscale,{tscale}\n")
+        f.write(f"gscale,{gscale}\n")
+        f.write(f"ascale,{ascale}\n")
+        f.write("t,rx,ry,rz,ax,ay,az\n")
+        rows = np.column_stack([raw_t, raw_gyro, raw_accel])
+        np.savetxt(f, rows, fmt="%d", delimiter=",")
+    return path
+
+
+def generate_video(path, duration_s=10, fps=30, size="1280x720", audio=True):
+    """
+    Renders a test video from the ffmpeg lavfi sources (testsrc2 pattern and
+    a sine tone).
+
+    :return: Path of the written file
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    command = [
+        find_ffmpeg(), "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}:duration={duration_s}",
+    ]
+    if audio:
+        command += ["-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration_s}",
+                    "-c:a", "aac", "-shortest"]
+    command += ["-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", path]
+    subprocess.run(command, check=True)
+    return path
+
+
+def generate_recording(base_dir, name, duration_s=60, rate_hz=200, fps=30, size="1280x720"):
+    """Creates a recording folder with a matching video and GCSV, as the camera download does."""
+    rec_dir = os.path.join(base_dir, name)
+    video_path = generate_video(os.path.join(rec_dir, f"{name}.MP4"), duration_s, fps, size)
+    gcsv_path = generate_gcsv(os.path.join(rec_dir, f"{name}.gcsv"), rate_hz, duration_s,
+                              video_name=os.path.basename(video_path))
+    return video_path, gcsv_path
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic recordings (video + GCSV).")
+    parser.add_argument("output_dir", help="Directory where the recording folders are created.")
+    parser.add_argument("--count", type=int, default=1, help="Number of recordings.")
+    parser.add_argument("--duration", type=float, default=60, help="Length of each recording in seconds.")
+    parser.add_argument("--rate", type=int, default=200, help="IMU sample rate in Hz.")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--size", default="1280x720")
+    args = parser.parse_args()
+
+    for i in range(args.count):
+        video, gcsv = generate_recording(args.output_dir, f"Synthetic_{i:04d}",
+                                         args.duration, args.rate, args.fps, args.size)
+        print(f"Generated {video} and {gcsv}")
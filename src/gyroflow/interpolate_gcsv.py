@@ -5,23 +5,24 @@ import argparse
 import os
 import sys
 import csv
-import cv2  # OpenCV for video processing
 import numpy as np
+from utils.media_probe import probe
+from utils.sync_offset import load_offset
 
 def get_video_properties(video_path):
-    """Gets FPS and frame count from a video file."""
+    """Gets FPS and frame count from a video file (cached by utils.media_probe)."""
     if not os.path.isfile(video_path):
         print(f"Error: Video file not found: {video_path}", file=sys.stderr)
         return None, None
 
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"Error: Could not open video file: {video_path}", file=sys.stderr)
+    try:
+        info = probe(video_path)
+    except Exception as e:
+        print(f"Error: Could not probe video file {video_path}: {e}", file=sys.stderr)
         return None, None
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    cap.release()
+    fps = info["fps"]
+    frame_count = info["frame_count"]
 
     if fps is None or frame_count is None or fps <= 0 or frame_count <= 0:
          print(f"Error: Could not read valid FPS or frame count from: {video_path}", file=sys.stderr)
@@ -115,8 +116,11 @@ def read_and_prepare_gcsv_data(gcsv_path):
         return None
 
 
-def interpolate_data_for_frames(gcsv_data, fps, frame_count):
-    """Interpolates GCSV data at each video frame timestamp."""
+def interpolate_data_for_frames(gcsv_data, fps, frame_count, offset_s=0.0):
+    """
+    Interpolates GCSV data at each video frame timestamp.
+    offset_s: GCSV time of video time zero (see utils/sync_offset.py)
+    """
     if frame_count <= 0 or fps <= 0:
         return None
 
@@ -124,8 +128,11 @@ def interpolate_data_for_frames(gcsv_data, fps, frame_count):
     # Alternatively, use start of frame: np.arange(frame_count) / fps
     frame_timestamps_sec = (np.arange(frame_count) + 0.5) / fps
     print(f"Calculating target timestamps for {frame_count} frames (center-frame)...")
+    if offset_s:
+        print(f"  Applying gyro sync offset: {offset_s:+.3f}s")
 
-    original_gcsv_times = gcsv_data["timestamps_sec"]
+    # GCSV times shifted onto the video clock
+    original_gcsv_times = gcsv_data["timestamps_sec"] - offset_s
     output_data = []
 
     # Check if frame timestamps are within the range of GCSV timestamps
@@ -166,8 +173,11 @@ def interpolate_data_for_frames(gcsv_data, fps, frame_count):
 
     return output_data
 
-def interpolate_data_for_frames_from_video_path(video_path, gcsv_path):
-    """Wrapper to read video properties and GCSV data, then interpolate."""
+def interpolate_data_for_frames_from_video_path(video_path, gcsv_path, offset_s=None):
+    """
+    Wrapper to read video properties and GCSV data, then interpolate.
+    The offset defaults to the one stored by the sync stage.
+    """
     fps, frame_count = get_video_properties(video_path)
     if fps is None or frame_count is None:
         return None
@@ -176,7 +186,8 @@ def interpolate_data_for_frames_from_video_path(video_path, gcsv_path):
     if gcsv_data is None:
         return None
 
-    return interpolate_data_for_frames(gcsv_data, fps, frame_count)
+    offset_s = load_offset(gcsv_path) if offset_s is None else offset_s
+    return interpolate_data_for_frames(gcsv_data, fps, frame_count, offset_s)
 
 # --- Main execution block ---
 if __name__ == "__main__":
@@ -187,6 +198,8 @@ if __name__ == "__main__":
     parser.add_argument("gcsv_file", help="Path to the input GCSV file.")
     parser.add_argument("video_file", help="Path to the corresponding video file.")
     parser.add_argument("output_csv", help="Path to save the output CSV file with interpolated data per frame.")
+    parser.add_argument("--offset", type=float, default=None,
+                        help="GCSV time of the first frame in seconds (default: the offset stored by the sync stage, else 0).")
 
     args = parser.parse_args()
 
@@ -204,7 +217,8 @@ if __name__ == "__main__":
 
     # 3. Interpolate Data
     print("-" * 10, "Step 3: Interpolating Data", "-" * 10)
-    interpolated_results = interpolate_data_for_frames(gcsv_data, fps, frame_count)
+    offset_s = load_offset(args.gcsv_file) if args.offset is None else args.offset
+    interpolated_results = interpolate_data_for_frames(gcsv_data, fps, frame_count, offset_s)
     if interpolated_results is None:
         print("Error during interpolation step.", file=sys.stderr)
         sys.exit(1)
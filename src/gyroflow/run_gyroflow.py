@@ -1,29 +1,100 @@
+import json
 import subprocess
 from pathlib import Path
 from utils.config_manager import ConfigManager
+from gyroflow.stabilization_cache import StabilizationCache, cache_key
+from logger.spans import span, timed
+from utils.media_probe import probe
+from utils.metrics import metrics
 
 config = ConfigManager()
 
-def run_gyroflow(video_path: str):
+_cache = None
+
+def get_stabilization_cache():
+    """Returns the shared stabilization cache, or None if it is not configured."""
+    global _cache
+    cache_config = config.config.get("cache", {}).get("stabilization", {})
+    if not cache_config.get("path"):
+        return None
+    if _cache is None:
+        _cache = StabilizationCache(
+            cache_config["path"],
+            max_bytes=int(cache_config.get("max_bytes", 50 * 1024**3))
+        )
+    else:
+        # Picks up a max_bytes edited while running
+        _cache.max_bytes = int(cache_config.get("max_bytes", _cache.max_bytes))
+    return _cache
+
+def stabilized_output_path(video_path):
+    """Where gyroflow writes the stabilized version of video_path."""
+    video_path = Path(video_path)
+    return video_path.parent / f"{video_path.stem}_stabilized{video_path.suffix}"
+
+def _frame_count(video_path):
+    """Frames gyroflow renders for video_path, for the frames/s metric; None if unknown."""
+    try:
+        return probe(str(video_path))["frame_count"]
+    except Exception:
+        return None
+
+@timed("stabilize")
+def run_gyroflow(video_path: str, settings_path: str = None):
     video_path = Path(video_path)
     video_name = video_path.stem
     video_dir = video_path.parent  # ✅ Carpeta donde está el vídeo
 
     gyroflow_executable = Path(__file__).parent / "gyroflow"
-    settings_path = Path(__file__).parent / "settings.gyroflow"
+    if settings_path is None:
+        settings_path = Path(__file__).parent / "settings.gyroflow"
     gyro_data_path = video_dir / f"{video_name}_synchronized.gcsv"  # ✅ en la misma carpeta del vídeo
+    output_path = stabilized_output_path(video_path)
 
+    cache = get_stabilization_cache()
+    key = None
+    stabilized_name = "stabilized" + output_path.suffix
+    outputs = {
+        stabilized_name: output_path,
+        "synchronized.gcsv": gyro_data_path,
+    }
+    if cache is not None:
+        key = cache_key(video_path, video_dir / f"{video_name}.gcsv", settings_path)
+        hit = cache.lookup(key, outputs, required=[stabilized_name])
+        metrics.cache_lookup("stabilization", hit)
+        if hit:
+            print(f"♻️ Cache hit, skipping stabilization: {video_path.name}")
+            return str(output_path)
+
+    # Pin the output next to the source video so the cache knows what to store
+    out_params = {
+        "output_folder": str(video_dir) + "/",
+        "output_filename": output_path.name
+    }
     command = [
         str(gyroflow_executable),
         str(video_path),
         str(settings_path),
         "-g",
-        str(gyro_data_path)
+        str(gyro_data_path),
+        "-p",
+        json.dumps(out_params),
+        "-f"
     ]
     print("Running:", " ".join(command))
 
     try:
-        subprocess.run(command, check=True)
+        # Only the gyroflow run itself, so cache hits don't inflate frames/s
+        with span("stabilize.render", file=video_path, frames=_frame_count(video_path)):
+            subprocess.run(command, check=True)
         print(f"✅ Estabilizado: {video_path.name}")
     except subprocess.CalledProcessError as e:
         print(f"❌ Error al estabilizar {video_path.name}: {e}")
+        return None
+    if not output_path.is_file():
+        print(f"❌ Gyroflow did not write {output_path.name}")
+        return None
+
+    if cache is not None:
+        cache.store(key, outputs, required=[stabilized_name])
+    return str(output_path)
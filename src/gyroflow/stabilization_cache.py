@@ -0,0 +1,204 @@
+"""Content-addressed cache for gyroflow outputs"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Bytes hashed from the head and the tail of a video to fingerprint it.
+# Hashing the whole file would cost as much I/O as re-reading the footage.
+FINGERPRINT_CHUNK = 4 * 1024 * 1024
+
+
+def _sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def video_fingerprint(path):
+    """Cheap identity of a video: size plus a hash of its first and last chunk."""
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_CHUNK))
+        if size > 2 * FINGERPRINT_CHUNK:
+            f.seek(-FINGERPRINT_CHUNK, os.SEEK_END)
+            digest.update(f.read(FINGERPRINT_CHUNK))
+    return digest.hexdigest()
+
+
+def cache_key(video_path, gcsv_path, settings_path):
+    """Hash of everything that decides what gyroflow produces."""
+    digest = hashlib.sha256()
+    digest.update(video_fingerprint(video_path).encode())
+    digest.update(_sha256_file(gcsv_path).encode() if gcsv_path and os.path.isfile(gcsv_path) else b'no-gcsv')
+    digest.update(_sha256_file(settings_path).encode())
+    return digest.hexdigest()
+
+
+def _place(src, dst):
+    """Hard-link src to dst, falling back to a copy across filesystems."""
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class StabilizationCache:
+    """
+    Stores stabilized videos and their synchronized GCSV under a key derived
+    from the inputs. Entries are evicted least-recently-used first once the
+    cache grows beyond max_bytes.
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, cache_dir, max_bytes=50 * 1024**3):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_file = self.cache_dir / "index.db"
+        self._initialize_db()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _initialize_db(self):
+        with StabilizationCache._lock, self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    files TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+
+    def _entry_dir(self, key):
+        return self.cache_dir / key[:2] / key
+
+    def lookup(self, key, outputs, required=()):
+        """
+        Restores a cached entry into place.
+
+        :param key: Cache key from cache_key()
+        :param outputs: Mapping of stored name -> destination path
+        :param required: Stored names without which the entry is no hit
+        :return: True on a hit, False otherwise
+        """
+        entry_dir = self._entry_dir(key)
+        with StabilizationCache._lock, self._connect() as conn:
+            row = conn.execute("SELECT files FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False
+            files = row[0].split(",")
+            if not all(name in files for name in required):
+                # Stored before the required outputs were checked, useless as a hit
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                return False
+            if not all((entry_dir / name).is_file() for name in files):
+                # Files vanished behind our back, forget the entry
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                return False
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+
+        for name, dst in outputs.items():
+            if name in files:
+                _place(entry_dir / name, dst)
+        return True
+
+    def store(self, key, outputs, required=()):
+        """
+        Adds produced files to the cache.
+
+        :param key: Cache key from cache_key()
+        :param outputs: Mapping of stored name -> produced file path
+        :param required: Stored names that must have been produced, or nothing is stored
+        """
+        existing = {name: path for name, path in outputs.items() if path and os.path.isfile(path)}
+        if not existing or not all(name in existing for name in required):
+            return
+
+        entry_dir = self._entry_dir(key)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        size = 0
+        for name, src in existing.items():
+            _place(src, entry_dir / name)
+            size += os.path.getsize(src)
+
+        now = time.time()
+        with StabilizationCache._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, files, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, ",".join(existing), size, now, now)
+            )
+        self.evict()
+
+    def keys_linked_to(self, path):
+        """Keys of the entries holding a hard link of path (same inode)."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute("SELECT key, files FROM entries").fetchall()
+        keys = []
+        for key, files in rows:
+            for name in files.split(","):
+                try:
+                    entry_st = os.stat(self._entry_dir(key) / name)
+                except FileNotFoundError:
+                    continue
+                if (entry_st.st_dev, entry_st.st_ino) == (st.st_dev, st.st_ino):
+                    keys.append(key)
+                    break
+        return keys
+
+    def remove(self, key):
+        """Drops one entry and its files."""
+        with StabilizationCache._lock, self._connect() as conn:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def total_size(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits max_bytes."""
+        with StabilizationCache._lock, self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = conn.execute("SELECT key, size FROM entries ORDER BY last_used ASC").fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    shutil.rmtree(self._entry_dir(key))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Error evicting cache entry {key}: {e}", file=sys.stderr)
+                    continue
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
@@ -0,0 +1,90 @@
+"""Single process owning the log sinks, fed by worker processes over a queue"""
+import multiprocessing
+import signal
+import sys
+from logger.logger_manager import build_handler, configure_worker
+
+_STOP = None
+
+
+def _listen(queue):
+    """Listener process: writes every queued record to the sinks it is tagged with."""
+    # Ctrl+C reaches the whole process group; keep draining until told to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    handlers = {}
+    try:
+        while True:
+            try:
+                record = queue.get()
+            except (EOFError, OSError):
+                break
+            if record is _STOP:
+                break
+            for sink in getattr(record, "sinks", ()):
+                if sink not in handlers:
+                    try:
+                        handlers[sink] = build_handler(sink)
+                    except Exception as e:
+                        print(f"Error configuring {sink} logging: {e}", file=sys.stderr)
+                        handlers[sink] = None
+                if handlers[sink] is not None:
+                    handlers[sink].handle(record)
+    finally:
+        for handler in handlers.values():
+            if handler is not None:
+                handler.close()
+
+
+class LogListener:
+    """
+    Starts the listener process and routes this process's loggers to it.
+    Worker processes join with configure_worker as their initializer:
+
+        with LogListener() as listener:
+            with ProcessPoolExecutor(initializer=configure_worker,
+                                     initargs=listener.initargs) as pool:
+                ...
+
+    Records still queued when stop() is called are written before it returns,
+    then this process's loggers go back to their own handlers.
+    """
+    def __init__(self, context=None):
+        # spawn, not fork: a forked child inherits SQLite's per-process lock
+        # state for files this process already has open, and gets "database
+        # is locked" opening the log DB again
+        self.context = context or multiprocessing.get_context("spawn")
+        self.queue = self.context.Queue(-1)
+        self.process = None
+
+    def start(self):
+        self.process = self.context.Process(target=_listen, args=(self.queue,), name="LogListener", daemon=True)
+        self.process.start()
+        configure_worker(self.queue)
+        return self
+
+    def stop(self, timeout=10.0):
+        if self.process is None:
+            return
+        # Queue puts from this process are ordered, so the sentinel comes last
+        self.queue.put(_STOP)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            print("Warning: log listener did not stop in time.", file=sys.stderr)
+            self.process.terminate()
+            self.process.join()
+        if self.process.exitcode != 0:
+            # Nobody reads the queue anymore; don't block exit flushing it
+            self.queue.cancel_join_thread()
+        self.process = None
+        configure_worker(None)
+
+    @property
+    def initargs(self):
+        """Arguments for configure_worker when used as a pool initializer."""
+        return (self.queue,)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,99 @@
+"""Read-only queries over the SQLite log store"""
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+
+
+class LogQuery:
+    """
+    Read-only access to the log DB for status tooling. The database runs in
+    WAL mode, so these readers never block the logging writer thread.
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, timeout=5)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def events(self, since=None, until=None, event_type=None, logger_name=None, limit=1000, newest_first=True):
+        """
+        Log records in a time range.
+
+        :param since: Epoch seconds (inclusive) or None
+        :param until: Epoch seconds (exclusive) or None
+        :param event_type: Only this event type
+        :param logger_name: Only records of this logger
+        :param limit: Maximum number of rows, None for all
+        :return: List of dicts; 'data' is decoded from JSON
+        """
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created < ?")
+            params.append(until)
+        if event_type is not None:
+            clauses.append("event_type = ?")
+            params.append(event_type)
+        if logger_name is not None:
+            clauses.append("logger_name = ?")
+            params.append(logger_name)
+
+        sql = "SELECT id, created, timestamp, logger_name, message, event_type, data FROM logs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created DESC" if newest_first else " ORDER BY created ASC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        events = []
+        for row in rows:
+            event = dict(row)
+            if event["data"]:
+                try:
+                    event["data"] = json.loads(event["data"])
+                except ValueError:
+                    pass
+            events.append(event)
+        return events
+
+    def counts_by_event_type(self, since=None, until=None):
+        """Number of records per event type in a time range (uses the index)."""
+        sql = "SELECT event_type, COUNT(*) FROM logs WHERE created >= ? AND created < ? GROUP BY event_type"
+        with self._connect() as conn:
+            rows = conn.execute(sql, (since or 0, until or time.time() + 1)).fetchall()
+        return {event_type: count for event_type, count in rows}
+
+    def daily_counts(self, since_day=None, event_type=None):
+        """
+        Per-day counts by event type from the rollup table. Rows logged
+        since the last rollup are not included yet.
+
+        :param since_day: 'YYYY-MM-DD' lower bound
+        :return: List of (day, event_type, count)
+        """
+        clauses, params = [], []
+        if since_day is not None:
+            clauses.append("day >= ?")
+            params.append(since_day)
+        if event_type is not None:
+            clauses.append("event_type = ?")
+            params.append(event_type)
+        sql = "SELECT day, event_type, count FROM log_daily_counts"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY day, event_type"
+        with self._connect() as conn:
+            return [tuple(row) for row in conn.execute(sql, params).fetchall()]
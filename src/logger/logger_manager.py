@@ -2,18 +2,85 @@ import logging
 import sys
 import os
 import getpass
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, RotatingFileHandler
 from logger.sqlite_handler import SQLiteHandler
 from utils.config_manager import ConfigManager
 
 config = ConfigManager()
 
+SINKS = ("file", "console", "sqlite")
+
+# Set by configure_worker(): records then go to the log listener process
+# instead of handlers owned by this process
+_log_queue = None
+
+FORMATTER = logging.Formatter(
+    '%(asctime)s - %(name)s:%(lineno)d - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def build_handler(sink, level=logging.NOTSET, max_bytes=10*1024*1024, backup_count=5):
+    """
+    Creates the handler writing to one sink ('file', 'console' or 'sqlite').
+    Used by Logger in direct mode and by the log listener process.
+    """
+    log_config = config.config.get("logs", {})
+    user = getpass.getuser()
+
+    if sink == "file":
+        log_file = log_config.get("path", f"/home/{user}/logs/app.log").replace("[user]", user)
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handler = RotatingFileHandler(
+            log_file,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding='utf-8'
+        )
+    elif sink == "console":
+        handler = logging.StreamHandler(sys.stdout)
+    elif sink == "sqlite":
+        sqlite_db_file = log_config.get("sqlite_file", f"/home/{user}/logs/logs.db").replace("[user]", user)
+        handler = SQLiteHandler(
+            db_file=sqlite_db_file,
+            batch_size=int(log_config.get("batch_size", 100)),
+            flush_interval_ms=int(log_config.get("flush_interval_ms", 500)),
+            retention=log_config.get("retention")
+        )
+    else:
+        raise ValueError(f"Unknown log sink '{sink}'")
+
+    handler.setLevel(level)
+    handler.setFormatter(FORMATTER)
+    return handler
+
+
+class SinkQueueHandler(QueueHandler):
+    """
+    Sends records to the log listener process, tagged with the sinks the
+    logger writes to. Formatting, file rotation and SQLite inserts all
+    happen in the listener, so logging here costs a queue put.
+    """
+    def __init__(self, queue, sinks):
+        super().__init__(queue)
+        self.sinks = tuple(sinks)
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.sinks = self.sinks
+        return record
+
+
 class Logger:
     """
     Class to configure and use a standard Python logger.
     Logs to file, console, and optionally SQLite.
     Paths are configurable via config.yaml.
+    After configure_worker() records are sent to the log listener process
+    instead (see logger.log_listener).
     """
+    # logger_name -> sinks, so configure_worker() can reroute existing loggers
+    _sinks = {}
+
     def __init__(self,
                  logger_name='AppLogger',
                  level=logging.INFO,
@@ -26,57 +93,29 @@ class Logger:
         self.logger_name = logger_name
         self.level = level
 
-        # Load config values for paths
-        log_config = config.config.get("logs", {})
-        user = getpass.getuser()
-
-        log_file = log_config.get("path", f"/home/{user}/logs/app.log").replace("[user]", user)
-        sqlite_db_file = log_config.get("sqlite_file", f"/home/{user}/logs/logs.db").replace("[user]", user)
-
         self.logger = logging.getLogger(self.logger_name)
         self.logger.setLevel(self.level)
 
         if not self.logger.handlers:
-            formatter = logging.Formatter(
-                '%(asctime)s - %(name)s:%(lineno)d - %(levelname)s - %(message)s',
-                datefmt='%Y-%m-%d %H:%M:%S'
-            )
-
-            # --- File Handler ---
-            if log_to_file:
-                try:
-                    log_dir = os.path.dirname(os.path.abspath(log_file))
-                    os.makedirs(log_dir, exist_ok=True)
-
-                    file_handler = RotatingFileHandler(
-                        log_file,
-                        maxBytes=max_bytes,
-                        backupCount=backup_count,
-                        encoding='utf-8'
-                    )
-                    file_handler.setLevel(self.level)
-                    file_handler.setFormatter(formatter)
-                    self.logger.addHandler(file_handler)
-                except Exception as e:
-                    print(f"Error configuring file logging for '{log_file}': {e}", file=sys.stderr)
-
-            # --- Console Handler ---
-            if log_to_console:
-                console_handler = logging.StreamHandler(sys.stdout)
-                console_handler.setLevel(self.level)
-                console_handler.setFormatter(formatter)
-                self.logger.addHandler(console_handler)
-
-            # --- SQLite Handler ---
-            if log_to_sqlite:
-                try:
-                    sqlite_handler = SQLiteHandler(db_file=sqlite_db_file)
-                    sqlite_handler.setLevel(self.level)
-                    sqlite_handler.setFormatter(formatter)
-                    self.logger.addHandler(sqlite_handler)
-                    self.logger.info(f"Logging to SQLite DB '{sqlite_db_file}' activated.", extra={'event_type': 'LOG_INIT'})
-                except Exception as e:
-                    print(f"Could not activate SQLite logging: {e}", file=sys.stderr)
+            sinks = [
+                sink for sink, enabled in zip(SINKS, (log_to_file, log_to_console, log_to_sqlite))
+                if enabled
+            ]
+            Logger._sinks[self.logger_name] = sinks
+
+            if _log_queue is not None:
+                if sinks:
+                    self.logger.addHandler(SinkQueueHandler(_log_queue, sinks))
+            else:
+                for sink in sinks:
+                    try:
+                        handler = build_handler(sink, self.level, max_bytes, backup_count)
+                        self.logger.addHandler(handler)
+                    except Exception as e:
+                        print(f"Error configuring {sink} logging: {e}", file=sys.stderr)
+                for handler in self.logger.handlers:
+                    if isinstance(handler, SQLiteHandler):
+                        self.logger.info(f"Logging to SQLite DB '{handler.db_file}' activated.", extra={'event_type': 'LOG_INIT'})
 
             if not self.logger.handlers:
                 self.logger.addHandler(logging.NullHandler())
@@ -100,3 +139,31 @@ class Logger:
 
     def exception(self, message, extra=None):
         self.logger.exception(message, extra=extra)
+
+
+def configure_worker(queue):
+    """
+    Routes every Logger of this process to the log listener's queue.
+    Pass it as the initializer of a process pool (initargs=(queue,)); loggers
+    inherited through fork drop their own file/SQLite handlers, loggers
+    created later attach a SinkQueueHandler directly.
+    configure_worker(None) gives the loggers their own handlers back.
+    """
+    global _log_queue
+    _log_queue = queue
+    for name, sinks in Logger._sinks.items():
+        logger = logging.getLogger(name)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            if queue is None:
+                handler.close()
+        if not sinks:
+            logger.addHandler(logging.NullHandler())
+        elif queue is not None:
+            logger.addHandler(SinkQueueHandler(queue, sinks))
+        else:
+            for sink in sinks:
+                try:
+                    logger.addHandler(build_handler(sink, logger.level))
+                except Exception as e:
+                    print(f"Error configuring {sink} logging: {e}", file=sys.stderr)
@@ -0,0 +1,167 @@
+"""Timing spans recorded as structured events in the SQLite log DB"""
+import argparse
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+from logger.logger_manager import Logger
+from logger.log_query import LogQuery
+from utils.config_manager import ConfigManager
+from utils.metrics import metrics
+
+config = ConfigManager()
+
+SPAN_EVENT = 'SPAN'
+
+_logger = None
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        _logger = Logger(logger_name='SpanLogger', log_to_console=False, log_to_file=False, log_to_sqlite=True)
+    return _logger
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+def record_span(stage, duration, file=None, bytes=None, ok=True, frames=None):
+    """Writes one finished span to the log DB and adds it to the live metrics."""
+    data = {
+        "stage": stage,
+        "duration_s": duration,
+        "file": str(file) if file is not None else None,
+        "file_size": _file_size(file) if file is not None else None,
+        "bytes": bytes,
+        "frames": frames,
+        "ok": ok,
+    }
+    metrics.observe_span(stage, duration, bytes, frames, ok)
+    name = os.path.basename(str(file)) if file is not None else "-"
+    _get_logger().info(
+        f"{stage} {name} took {duration:.3f}s",
+        extra={'event_type': SPAN_EVENT, 'data': data}
+    )
+
+@contextmanager
+def span(stage, file=None, bytes=None, frames=None):
+    """
+    Times the enclosed block and records it as a SPAN event.
+    The yielded dict can be updated (e.g. span_info["bytes"] = n) before the block ends.
+
+    :param stage: Name of the stage being timed
+    :param file: File being processed, used as its identity in reports
+    :param bytes: Bytes processed; defaults to the size of file
+    :param frames: Video frames rendered, for frames/s; can also be set on the yielded dict
+    """
+    info = {"file": file, "bytes": bytes, "frames": frames, "ok": True}
+    start = time.perf_counter()
+    try:
+        yield info
+    except BaseException:
+        info["ok"] = False
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        processed = info["bytes"] if info["bytes"] is not None else _file_size(info["file"])
+        record_span(stage, duration, info["file"], processed, info["ok"], info["frames"])
+
+def timed(stage, file_arg=0):
+    """
+    Decorator recording every call as a span. A return value of False or
+    None counts as a failure, matching the convention of the wrapped helpers.
+
+    :param file_arg: Index of the positional argument holding the processed file
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            file = args[file_arg] if file_arg is not None and len(args) > file_arg else None
+            with span(stage, file=file) as info:
+                result = fn(*args, **kwargs)
+                info["ok"] = result is not False and result is not None
+                return result
+        return wrapper
+    return decorator
+
+# --- Reporting ---
+
+def percentile(values, q):
+    """Linear-interpolated percentile of a list, q in [0, 100]."""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100.0
+    lower = int(pos)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+def parse_since(value):
+    """Epoch seconds from 'YYYY-MM-DD[ HH:MM:SS]' or a relative age like '24h' / '7d'."""
+    if value is None:
+        return None
+    units = {"m": 60, "h": 3600, "d": 86400}
+    if value[-1] in units and value[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(value[:-1]) * units[value[-1]]
+    fmt = '%Y-%m-%d %H:%M:%S' if " " in value else '%Y-%m-%d'
+    return time.mktime(time.strptime(value, fmt))
+
+def load_spans(db_file, since=None):
+    """Reads SPAN events from the log DB, newest first. since is in epoch seconds."""
+    spans = []
+    for event in LogQuery(db_file).events(since=since, event_type=SPAN_EVENT, limit=None):
+        if isinstance(event["data"], dict):
+            entry = dict(event["data"])
+            entry["timestamp"] = event["timestamp"]
+            spans.append(entry)
+    return spans
+
+def stage_report(spans):
+    """Per-stage count, p50, p95, total seconds and throughput."""
+    by_stage = {}
+    for s in spans:
+        by_stage.setdefault(s["stage"], []).append(s)
+
+    report = {}
+    for stage, items in sorted(by_stage.items()):
+        durations = [s["duration_s"] for s in items]
+        total_bytes = sum(s["bytes"] or 0 for s in items)
+        total = sum(durations)
+        report[stage] = {
+            "count": len(items),
+            "failed": sum(1 for s in items if not s.get("ok", True)),
+            "p50_s": percentile(durations, 50),
+            "p95_s": percentile(durations, 95),
+            "total_s": total,
+            "mb_per_s": total_bytes / 1024**2 / total if total > 0 and total_bytes else None,
+        }
+    return report
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    log_config = config.config.get("logs", {})
+    parser = argparse.ArgumentParser(description="Report where the pipeline spends its time.")
+    parser.add_argument("--db", default=log_config.get("sqlite_file"), help="SQLite log DB.")
+    parser.add_argument("--since", help="Only spans logged since this time (YYYY-MM-DD[ HH:MM:SS]) or age (24h, 7d).")
+    parser.add_argument("--slowest", type=int, default=10, help="Number of slowest files to list.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    spans = load_spans(args.db, parse_since(args.since))
+    report = stage_report(spans)
+    slowest = sorted((s for s in spans if s.get("file")), key=lambda s: s["duration_s"], reverse=True)
+    slowest = slowest[:args.slowest]
+
+    if args.json:
+        print(json.dumps({"stages": report, "slowest": slowest}, indent=2))
+    else:
+        print(f"{'stage':<20} {'count':>6} {'p50 (s)':>9} {'p95 (s)':>9} {'total (s)':>10} {'MB/s':>8}")
+        for stage, r in report.items():
+            rate = f"{r['mb_per_s']:.1f}" if r["mb_per_s"] else "-"
+            print(f"{stage:<20} {r['count']:>6} {r['p50_s']:>9.3f} {r['p95_s']:>9.3f} {r['total_s']:>10.2f} {rate:>8}")
+        print(f"\nSlowest files:")
+        for s in slowest:
+            print(f"  {s['duration_s']:>8.2f}s  {s['stage']:<20} {s['file']}")
@@ -1,44 +1,210 @@
 # sqlite_handler.py
+import atexit
+import json
 import logging
+import queue
 import sqlite3
 import os
 import threading
+import time
 import sys # To print errors if the DB fails
 
+_STOP = object()
+
+# Rows deleted per statement while pruning, so readers and the next batch
+# never wait long on the write lock
+PRUNE_CHUNK = 5000
+
+class _SQLiteWriter:
+    """
+    Background thread owning the only connection to one database file.
+    Rows are batched into a single transaction every batch_size records or
+    flush_interval seconds, whichever comes first. Every
+    retention['maintenance_interval_s'] seconds it also rolls up per-day
+    counts and prunes old rows (see _maintain).
+    """
+    def __init__(self, db_file, batch_size=100, flush_interval=0.5, retention=None):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention = retention or {}
+        self.users = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"SQLiteLogWriter-{os.path.basename(db_file)}",
+            daemon=True
+        )
+        self._thread.start()
+
+    def put(self, row):
+        # SimpleQueue.put never blocks, so callers only pay for the enqueue
+        self._queue.put(row)
+
+    def flush(self, timeout=5.0):
+        """Blocks until everything queued so far is committed."""
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def stop(self, timeout=5.0):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        # WAL lets readers run alongside the writer; NORMAL sync skips
+        # the fsync on every commit, only checkpoints are synced
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write(self, conn, rows):
+        if not rows:
+            return
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO logs (created, timestamp, logger_name, message, event_type, data)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
+        except Exception as e:
+            print(f"Error writing {len(rows)} log records to SQLite DB '{self.db_file}': {e}", file=sys.stderr)
+
+    def _maintain(self, conn):
+        """
+        Adds rows not yet counted to the per-day rollup, then prunes rows
+        older than max_age_days or beyond max_rows. Only rows already
+        counted in the rollup are ever deleted.
+        """
+        try:
+            with conn:
+                last_id = conn.execute("SELECT last_id FROM log_rollup_state").fetchone()[0]
+                max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM logs").fetchone()[0]
+                conn.execute('''
+                    INSERT INTO log_daily_counts (day, event_type, count)
+                    SELECT date(created, 'unixepoch', 'localtime'), COALESCE(event_type, 'GENERAL'), COUNT(*)
+                    FROM logs WHERE id > ? AND id <= ?
+                    GROUP BY 1, 2
+                    ON CONFLICT(day, event_type) DO UPDATE SET count = count + excluded.count
+                ''', (last_id, max_id))
+                conn.execute("UPDATE log_rollup_state SET last_id = ?", (max_id,))
+
+            cutoff_id = 0
+            max_age_days = self.retention.get("max_age_days")
+            if max_age_days:
+                row = conn.execute(
+                    "SELECT MAX(id) FROM logs WHERE created < ?",
+                    (time.time() - float(max_age_days) * 86400,)
+                ).fetchone()
+                cutoff_id = max(cutoff_id, row[0] or 0)
+            max_rows = self.retention.get("max_rows")
+            if max_rows:
+                cutoff_id = max(cutoff_id, max_id - int(max_rows))
+            cutoff_id = min(cutoff_id, max_id)
+
+            while True:
+                with conn:
+                    deleted = conn.execute(
+                        "DELETE FROM logs WHERE id IN (SELECT id FROM logs WHERE id <= ? ORDER BY id LIMIT ?)",
+                        (cutoff_id, PRUNE_CHUNK)
+                    ).rowcount
+                if deleted < PRUNE_CHUNK:
+                    break
+        except Exception as e:
+            print(f"Error maintaining SQLite DB '{self.db_file}': {e}", file=sys.stderr)
+
+    def _run(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            print(f"Error opening SQLite DB '{self.db_file}': {e}", file=sys.stderr)
+            return
+
+        batch = []
+        deadline = None
+        maintenance_interval = float(self.retention.get("maintenance_interval_s", 3600))
+        next_maintenance = time.monotonic()
+        try:
+            while True:
+                if time.monotonic() >= next_maintenance:
+                    self._write(conn, batch)
+                    batch, deadline = [], None
+                    self._maintain(conn)
+                    next_maintenance = time.monotonic() + maintenance_interval
+
+                wake_at = next_maintenance if deadline is None else min(deadline, next_maintenance)
+                timeout = max(0.0, wake_at - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    break
+                if isinstance(item, threading.Event):
+                    self._write(conn, batch)
+                    batch, deadline = [], None
+                    item.set()
+                    continue
+                if item is not None:
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                if len(batch) >= self.batch_size or (deadline is not None and time.monotonic() >= deadline):
+                    self._write(conn, batch)
+                    batch, deadline = [], None
+        finally:
+            # Drain whatever is still queued before closing
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is not _STOP:
+                    batch.append(item)
+            self._write(conn, batch)
+            conn.close()
+
+
 class SQLiteHandler(logging.Handler):
     """
     A logging handler that writes records to a SQLite database,
-    saving only: id, timestamp, logger_name, message, event_type.
+    saving only: id, timestamp (text and epoch 'created'), logger_name,
+    message, event_type and an optional JSON 'data' payload for structured
+    events.
+    Inserts happen on a background writer thread shared by every handler
+    of the same database file, so emit() never waits for the disk.
     """
-    _conn_cache = {}
+    _writers = {}
     _lock = threading.Lock()
 
-    def __init__(self, db_file='logs.db'):
+    def __init__(self, db_file='logs.db', batch_size=100, flush_interval_ms=500, retention=None):
+        """
+        :param retention: Optional dict with max_age_days, max_rows and
+                          maintenance_interval_s; nothing is pruned by default
+        """
         super().__init__()
         self.db_file = db_file
         self._initialize_db()
-
-    def _get_connection(self):
-        """Gets a thread-safe SQLite connection for the current thread."""
-        thread_id = threading.get_ident()
-        if thread_id not in SQLiteHandler._conn_cache:
-            db_dir = os.path.dirname(os.path.abspath(self.db_file))
-            if db_dir and not os.path.exists(db_dir):
-                try:
-                    os.makedirs(db_dir, exist_ok=True)
-                except OSError as e:
-                    print(f"Error creating directory for DB {db_dir}: {e}", file=sys.stderr)
-                    raise
-
-            SQLiteHandler._conn_cache[thread_id] = sqlite3.connect(
-                self.db_file,
-                timeout=5,
-                check_same_thread=False # Necessary for thread safety with cache
-            )
-        return SQLiteHandler._conn_cache[thread_id]
+        key = os.path.abspath(db_file)
+        with SQLiteHandler._lock:
+            writer = SQLiteHandler._writers.get(key)
+            if writer is None:
+                writer = _SQLiteWriter(db_file, batch_size, flush_interval_ms / 1000.0, retention)
+                SQLiteHandler._writers[key] = writer
+            writer.users += 1
+        self._writer = writer
+        self._closed = False
 
     def _initialize_db(self):
-        """Creates the simplified logs table if it does not exist."""
+        """Creates the logs table, its indexes and the rollup tables, migrating older databases."""
         with SQLiteHandler._lock: # Use lock for initialization as well
             temp_conn = None
             try:
@@ -50,16 +216,44 @@ class SQLiteHandler(logging.Handler):
                 temp_conn = sqlite3.connect(self.db_file, timeout=5)
                 cursor = temp_conn.cursor()
                 # --- Simplified Schema ---
+                # 'created' is the epoch time of the record, used for range
+                # queries and retention; 'timestamp' keeps the readable form
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS logs (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         timestamp TEXT NOT NULL,
                         logger_name TEXT,
                         message TEXT,
-                        event_type TEXT
+                        event_type TEXT,
+                        data TEXT,
+                        created REAL
                     )
                 ''')
                 # --- End Simplified Schema ---
+                # --- Migrations of databases created by older versions ---
+                columns = [row[1] for row in cursor.execute("PRAGMA table_info(logs)")]
+                if 'data' not in columns:
+                    cursor.execute("ALTER TABLE logs ADD COLUMN data TEXT")
+                if 'created' not in columns:
+                    cursor.execute("ALTER TABLE logs ADD COLUMN created REAL")
+                    # Old timestamps were written in local time
+                    cursor.execute(
+                        "UPDATE logs SET created = CAST(strftime('%s', timestamp, 'utc') AS REAL) "
+                        "WHERE created IS NULL"
+                    )
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_created ON logs (created)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_event_type_created ON logs (event_type, created)")
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS log_daily_counts (
+                        day TEXT NOT NULL,
+                        event_type TEXT NOT NULL,
+                        count INTEGER NOT NULL,
+                        PRIMARY KEY (day, event_type)
+                    )
+                ''')
+                cursor.execute("CREATE TABLE IF NOT EXISTS log_rollup_state (last_id INTEGER NOT NULL)")
+                if cursor.execute("SELECT COUNT(*) FROM log_rollup_state").fetchone()[0] == 0:
+                    cursor.execute("INSERT INTO log_rollup_state (last_id) VALUES (0)")
                 temp_conn.commit()
             except Exception as e:
                  print(f"Error initializing/creating simplified table in SQLite DB '{self.db_file}': {e}", file=sys.stderr)
@@ -70,49 +264,62 @@ class SQLiteHandler(logging.Handler):
 
     def emit(self, record):
         """
-        Writes a log record to the simplified database.
-        Extracts 'event_type' from the record's 'extra' dictionary.
+        Queues a log record for the writer thread.
+        Extracts 'event_type' and 'data' from the record's 'extra' dictionary.
         """
-        # Formatting is necessary to get the formatted timestamp
-        self.format(record)
-
-        # Extract the required information from the record
-        timestamp = self.formatter.formatTime(record, self.formatter.datefmt) if self.formatter else record.asctime
-        logger_name = record.name
-        message = record.getMessage() # Use getMessage() for proper handling
-        # Extract event_type from the 'extra' dictionary, with a default value
-        event_type = getattr(record, 'event_type', 'GENERAL') # Use getattr for safety
-
-        # Prepare SQL for simplified insertion
-        sql = '''
-            INSERT INTO logs (timestamp, logger_name, message, event_type)
-            VALUES (?, ?, ?, ?)
-        '''
-        values = (
-            timestamp,
-            logger_name,
-            message,
-            event_type
-        )
-
-        # Insert into the database
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, values)
-            conn.commit()
-        except Exception as e:
-            # Print error to stderr and let the logging system handle the error
-            print(f"Error writing simplified log to SQLite DB '{self.db_file}': {e}", file=sys.stderr)
+            # Extract the required information from the record
+            if self.formatter:
+                timestamp = self.formatter.formatTime(record, self.formatter.datefmt)
+            else:
+                timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))
+            message = record.getMessage() # Use getMessage() for proper handling
+            # Extract event_type from the 'extra' dictionary, with a default value
+            event_type = getattr(record, 'event_type', 'GENERAL') # Use getattr for safety
+            # Structured payload from the 'extra' dictionary, stored as JSON
+            data = getattr(record, 'data', None)
+            if data is not None and not isinstance(data, str):
+                data = json.dumps(data, default=str)
+
+            self._writer.put((record.created, timestamp, record.name, message, event_type, data))
+        except Exception:
             self.handleError(record) # Standard way to signal an error during emit
 
+    def flush(self):
+        """Waits until every record emitted so far is committed."""
+        if not self._closed:
+            self._writer.flush()
+
     def close(self):
-        """Closes the SQLite connections upon finalization."""
-        with SQLiteHandler._lock: # Ensure thread safety during close
-             for conn in SQLiteHandler._conn_cache.values():
-                 try:
-                     conn.close()
-                 except Exception as e:
-                     print(f"Error closing SQLite connection: {e}", file=sys.stderr)
-        SQLiteHandler._conn_cache.clear()
-        super().close()
\ No newline at end of file
+        """Flushes pending records; the last handler of a DB stops its writer."""
+        if not self._closed:
+            self._closed = True
+            key = os.path.abspath(self.db_file)
+            with SQLiteHandler._lock:
+                self._writer.users -= 1
+                last = self._writer.users <= 0
+                if last:
+                    SQLiteHandler._writers.pop(key, None)
+            if last:
+                self._writer.stop()
+            else:
+                self._writer.flush()
+        super().close()
+
+
+@atexit.register
+def _stop_writers():
+    """Commits whatever is still queued when the interpreter exits."""
+    with SQLiteHandler._lock:
+        writers = list(SQLiteHandler._writers.values())
+        SQLiteHandler._writers.clear()
+    for writer in writers:
+        writer.stop()
+
+
+def _reset_after_fork():
+    """Writer threads do not survive fork(); a child process starts with none."""
+    SQLiteHandler._lock = threading.Lock()
+    SQLiteHandler._writers = {}
+
+os.register_at_fork(after_in_child=_reset_after_fork)
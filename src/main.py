@@ -1,10 +1,25 @@
 """Executable module for connecting all modules"""
+import argparse
+import json
 import os
+import time
 from utils.config_manager import ConfigManager
 from utils.camera import Camera
-from utils.extract_audio_wav import extract_audio_ffmpeg
-from gyroflow.run_gyroflow import run_gyroflow
-from utils.edit_video import clip
+from logger.log_listener import LogListener
+from logger.spans import span
+from utils.media_readers import readers
+from utils.media_probe import get_media_probe
+from utils.fingerprint import get_fingerprint_index
+from utils.storage_manager import get_storage_manager
+from utils.highlight_index import update_library
+from utils.shake import needs_stabilization, skipped_report, stabilize_rate
+from utils.idle_scheduler import IdleScheduler
+from utils.metrics import metrics
+from utils.status_server import StatusServer
+from utils.stages import (
+    create_pipeline, add_ingest_tasks, add_recording_tasks, stage_workers, recording_paths,
+    is_derived_video
+)
 
 config = ConfigManager()
 
@@ -22,65 +37,303 @@ def choose_files(files, prompt="Select files (comma-separated indices):"):
         print("No files found.")
         return []
 
+    # Cached after the first listing, so this stays instant for large libraries
+    infos = get_media_probe().probe_many(files)
+    metrics.set_phase("waiting for selection")
     for i, f in enumerate(files):
-        print(f"{i}: {f}")
+        info = infos.get(f)
+        if info and info["duration"]:
+            print(f"{i}: {f} ({info['duration']:.0f}s{'' if info['has_audio'] else ', no audio'})")
+        else:
+            print(f"{i}: {f}")
     
     selected = input(prompt + " ")
     indices = [int(i.strip()) for i in selected.split(",") if i.strip().isdigit()]
     return [files[i] for i in indices if 0 <= i < len(files)]
 
-def stabilish(files):
-    print("⚙️ Stabilizing the following files:")
-    stabilized = []
+class RunSummary:
+    """Collects what each stage processed and how long it took."""
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+        self.runs = {}
+        self.files = {}
+        self.selected = {}
+
+    def add(self, stages, results, wall_clock):
+        for task_name, (status, duration) in results.items():
+            stage, path = task_name.split(":", 1)
+            entry = self.stages.setdefault(stage, {"task_s": 0.0, "counts": {}})
+            entry["task_s"] += duration
+            entry["counts"][status] = entry["counts"].get(status, 0) + 1
+            self.files.setdefault(path, {})[stage] = status
+        # Stages run together overlap, so the wall clock belongs to the run, not to any one stage
+        key = ",".join(stages)
+        self.runs[key] = self.runs.get(key, 0.0) + wall_clock
+
+    def as_dict(self):
+        return {
+            "started": self.started,
+            "finished": time.time(),
+            "wall_clock_s": time.time() - self.started,
+            "stages": self.stages,
+            "runs": self.runs,
+            "selected": self.selected,
+            "files": self.files,
+        }
 
+    def write(self, path=None):
+        text = json.dumps(self.as_dict(), indent=2)
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(text)
+        print(text)
+
+def run_stages(files, stages, workers=None, summary=None):
+    """Runs the given stages for each file, skipping work that is up to date."""
+    pipeline = create_pipeline()
     for f in files:
         print(f" - {f}")
-        run_gyroflow(f)
-        stabilized.append(f)  # Si luego generas una versión `_stab.mp4`, cámbialo aquí
+        add_recording_tasks(pipeline, f, stages)
+    metrics.set_phase(",".join(stages))
+    start = time.perf_counter()
+    results = pipeline.run(stages=stages, workers=workers or stage_workers())
+    if summary is not None:
+        summary.add(stages, results, time.perf_counter() - start)
+    return results
 
-    return stabilized
+def stabilish(files, workers=None, summary=None):
+    print("⚙️ Stabilizing the following files:")
+    results = run_stages(files, ["stabilize"], workers, summary)
+    return [
+        recording_paths(f)["stabilized"] for f in files
+        if results.get(f"stabilize:{f}", ("",))[0] in ("ran", "up-to-date")
+    ]
 
-def extract_audio(files):
+def extract_audio(files, workers=None, summary=None):
     print("🔉 Extracting audio from the following files:")
-    for full_path in files:
-        print(f" - {full_path}")
+    run_stages(files, ["audio", "loudness"], workers, summary)
 
-        video_name = os.path.splitext(os.path.basename(full_path))[0]
-        video_dir = os.path.dirname(full_path)
+def clip(files, workers=None, summary=None):
+    print("✂️ Clipping the following files:")
+    run_stages(files, ["peaks", "clips", "reel"], workers, summary)
 
-        audio_dir = os.path.join(video_dir, "audio")
-        os.makedirs(audio_dir, exist_ok=True)
+def download(camera, base_path, workers=None, summary=None):
+    pipeline = create_pipeline()
+    tasks = add_ingest_tasks(pipeline, camera, base_path)
+    metrics.set_phase("ingest")
+    start = time.perf_counter()
+    with span("ingest", file=camera.mount_point) as info:
+        info["bytes"] = sum(os.path.getsize(p) for task in tasks for p in task.inputs)
+        results = pipeline.run(stages=["ingest"], workers=workers or stage_workers())
+    if summary is not None:
+        summary.add(["ingest"], results, time.perf_counter() - start)
 
-        output_path = os.path.join(audio_dir, f"{video_name}.wav")
+# --- Unattended selection ---
 
-        if os.path.exists(output_path):
-            print(f"  Skipping {output_path} (already exists)")
-            continue
+def peak_score(video_path):
+    """Highest peak value stored by the peaks stage, or None if unknown."""
+    peaks_path = recording_paths(video_path)["peaks"]
+    if not os.path.exists(peaks_path):
+        return None
+    with open(peaks_path) as f:
+        values = [p["value"] for p in json.load(f)]
+    return max(values) if values else None
 
-        extract_audio_ffmpeg(full_path, output_path)
+def shake_of(video_path):
+    """Shake metrics stored by the shake stage, or None if unknown."""
+    shake_path = recording_paths(video_path)["shake"]
+    if not os.path.exists(shake_path):
+        return None
+    with open(shake_path) as f:
+        return json.load(f)
 
-if __name__ == "__main__":
-    while True:
-        camera = Camera()
-        camera.mount()
-        print(camera.model)
-        camera.download(config.config.get("camera_path", None))
-        camera.unmount()
-        print("📤 Camera unmounted.")
+def select_for_stabilization(files, rules):
+    """
+    Files to stabilize. With rules['shake'], only the recordings the shake
+    policy finds shaky, and rules['min_peak_score'] (if set) must also be
+    exceeded by their top peak. Without it, files whose peak score exceeds
+    min_peak_score (None disables stabilization).
+    """
+    threshold = rules.get("min_peak_score")
+    use_shake = rules.get("shake", False)
+    if threshold is None and not use_shake:
+        return []
+    selected = []
+    for f in files:
+        if use_shake:
+            shake = shake_of(f)
+            if shake is None or not needs_stabilization(shake):
+                continue
+        if threshold is not None:
+            score = peak_score(f)
+            if score is None or score <= threshold:
+                continue
+        selected.append(f)
+    return selected
+
+def report_skipped_stabilization(files, selected):
+    """Footage, and estimated gyroflow time, the shake policy did not spend."""
+    chosen = set(selected)
+    skipped = [m for m in (shake_of(f) for f in files if f not in chosen) if m is not None]
+    report = skipped_report(skipped, stabilize_rate(create_pipeline().store))
+    if report["recordings"]:
+        estimate = f", ~{report['compute_s'] / 60:.1f} min of gyroflow" if report["compute_s"] else ""
+        print(f"⏭️  Not stabilizing {report['recordings']} steady recordings "
+              f"({report['footage_s'] / 60:.1f} min of footage{estimate}).")
+    return report
+
+def select_for_clipping(files):
+    """Files to clip: those with a GCSV, since clips are cut around its peaks."""
+    return [f for f in files if os.path.exists(recording_paths(f)["gcsv"])]
+
+def find_duplicates(files):
+    """
+    Recordings that repeat another one (second camera, re-import), mapped
+    to the copy that is kept. Empty when fingerprinting is disabled.
+    """
+    if not config.get("fingerprint.enabled", True):
+        return {}
+    recordings = [f for f in files if not is_derived_video(f)]
+    metrics.set_phase("fingerprint")
+    duplicates = get_fingerprint_index().find_duplicates(
+        recordings,
+        visual_threshold=float(config.get("fingerprint.visual_threshold", 0.8)),
+        motion_threshold=float(config.get("fingerprint.motion_threshold", 0.9)),
+    )
+    for dup, keep in sorted(duplicates.items()):
+        print(f"🪞 {os.path.basename(dup)} duplicates {os.path.basename(keep)}")
+    return duplicates
+
+def without_duplicates(files, duplicates):
+    """files minus the duplicates and everything derived from them."""
+    skipped = set()
+    for dup in duplicates:
+        skipped.add(os.path.abspath(dup))
+        skipped.add(os.path.abspath(recording_paths(dup)["stabilized"]))
+    return [f for f in files if os.path.abspath(f) not in skipped]
 
-        base_path = config.config.get("camera_path", "")
-        downloaded_videos = list_videos(base_path)
+def parse_workers(values):
+    """Parses ['stage=N', ...] into a dict."""
+    workers = {}
+    for value in values or []:
+        stage, _, count = value.partition("=")
+        workers[stage.strip()] = int(count)
+    return workers
 
-        print("\n🔉 Automatically extracting audio from downloaded videos...")
-        extract_audio(downloaded_videos)
+def parse_args():
+    batch_config = config.config.get("batch", {})
+    parser = argparse.ArgumentParser(description="Action cam ingest and highlight pipeline.")
+    parser.add_argument("--batch", action=argparse.BooleanOptionalAction,
+                        default=batch_config.get("enabled", False),
+                        help="Run unattended, selecting files with the rules from config.yaml.")
+    parser.add_argument("--once", action="store_true",
+                        help="Process the local library once without waiting for a camera, then exit.")
+    parser.add_argument("--stabilize-min-score", type=float,
+                        default=batch_config.get("stabilize", {}).get("min_peak_score"),
+                        help="Batch mode: stabilize recordings whose top peak score is above this value.")
+    parser.add_argument("--shake", action=argparse.BooleanOptionalAction,
+                        default=batch_config.get("stabilize", {}).get("shake", False),
+                        help="Batch mode: stabilize only recordings whose gyro data shows shake.")
+    parser.add_argument("--workers", action="append", metavar="STAGE=N",
+                        help="Worker count for a stage (repeatable), e.g. --workers clips=4.")
+    parser.add_argument("--summary", default=batch_config.get("summary_path"),
+                        help="Write the machine-readable run summary to this JSON file.")
+    return parser.parse_args()
 
+def process_library(base_path, args, summary):
+    workers = stage_workers(parse_workers(args.workers))
+    # Stabilized versions, clips and reels are outputs, not recordings to process
+    downloaded_videos = [f for f in list_videos(base_path) if not is_derived_video(f)]
+
+    # Duplicates are found before any expensive stage runs on them
+    duplicates = find_duplicates(downloaded_videos)
+    summary.selected["duplicates"] = duplicates
+    if config.get("fingerprint.action", "skip") == "skip":
+        downloaded_videos = without_duplicates(downloaded_videos, duplicates)
+    else:
+        duplicates = {}
+
+    # Every later gyro stage and the event index read their times through the offset
+    print("\n⏱️  Syncing gyro data to the videos...")
+    run_stages(downloaded_videos, ["sync"], workers, summary)
+
+    if config.get("highlight_index.enabled", True):
+        # New recordings join the library-wide event index, each event once even when flagged twice
+        metrics.set_phase("highlight_index")
+        summary.selected["indexed"] = update_library(
+            base_path, exclude=[recording_paths(d)["gcsv"] for d in summary.selected["duplicates"]])
+
+    print("\n🔉 Automatically extracting audio from downloaded videos...")
+    extract_audio(downloaded_videos, workers, summary)
+
+    if args.batch:
+        # Peaks and shake feed the stabilization rules; peaks are reused by the clip stage
+        run_stages(downloaded_videos, ["peaks", "shake"], workers, summary)
+        videos_to_stabilize = select_for_stabilization(
+            downloaded_videos, {"min_peak_score": args.stabilize_min_score, "shake": args.shake})
+        if args.shake:
+            summary.selected["stabilize_skipped"] = report_skipped_stabilization(
+                downloaded_videos, videos_to_stabilize)
+    else:
+        run_stages(downloaded_videos, ["shake"], workers, summary)
+        shaky = select_for_stabilization(downloaded_videos, {"shake": True})
+        if shaky:
+            print(f"\n〰️  Shaky recordings: {', '.join(os.path.basename(f) for f in shaky)}")
         print("\n🎥 Available videos:")
         videos_to_stabilize = choose_files(downloaded_videos, "Select videos to stabilize:")
-        stabilized_videos = stabilish(videos_to_stabilize)
+    summary.selected["stabilize"] = videos_to_stabilize
+    stabilish(videos_to_stabilize, workers, summary)
 
-        all_videos_after_stab = list_videos(base_path)
+    # Recordings and their stabilized versions; exported clips and reels are never clipped again
+    all_videos_after_stab = without_duplicates(
+        [f for f in list_videos(base_path) if os.path.basename(os.path.dirname(f)) != "clips"], duplicates)
+    if args.batch:
+        videos_to_clip = select_for_clipping(all_videos_after_stab)
+    else:
         print("\n📼 Videos available for clipping:")
         videos_to_clip = choose_files(all_videos_after_stab, "Select videos to clip:")
-        clip(videos_to_clip)
+    summary.selected["clip"] = videos_to_clip
+    clip(videos_to_clip, workers, summary)
+
+    storage = get_storage_manager()
+    if storage is not None:
+        metrics.set_phase("storage")
+        summary.selected["storage"] = storage.enforce()
+
+if __name__ == "__main__":
+    args = parse_args()
+    base_path = config.config.get("camera_path", "")
+
+    # One process owns the log files when worker processes are in use
+    listener = LogListener().start() if config.config.get("logs", {}).get("listener") else None
+    idle_scheduler = IdleScheduler(base_path) if config.get("idle.enabled", True) else None
+    status_server = StatusServer().start() if config.get("status_server.enabled", True) else None
+    try:
+        while True:
+            summary = RunSummary()
+            if not args.once:
+                metrics.set_phase("waiting for camera")
+                camera = Camera(idle_scheduler=idle_scheduler)
+                camera.mount()
+                print(camera.model)
+                download(camera, base_path, stage_workers(parse_workers(args.workers)), summary)
+                camera.unmount()
+                print("📤 Camera unmounted.")
+
+            process_library(base_path, args, summary)
+            # Nothing is read until the next session; free the ffmpeg readers
+            readers.close_all()
+
+            if args.batch or args.summary:
+                summary.write(args.summary)
 
-        print("\n🔁 Restarting loop...\n")
+            if args.once:
+                break
+            print("\n🔁 Restarting loop...\n")
+    finally:
+        if status_server:
+            status_server.stop()
+        if listener:
+            listener.stop()
@@ -1,32 +1,50 @@
 """Utils focused on detecting and connecting to the camera"""
-import pyudev
 import os
 import subprocess
 from utils.config_manager import ConfigManager
 from logger.logger_manager import Logger
+from utils.camera_backends import UdevBackend
+from logger.spans import span
 import shutil
 import time
 
 config = ConfigManager()
 logger = Logger(logger_name='CameraLogger', log_to_file=True, log_to_sqlite=True)
 class Camera:
-    def __init__(self):
+    def __init__(self, backend=None, idle_scheduler=None, known_serials=None):
+        """
+        Blocks until a known camera is connected.
+
+        :param backend: Device backend (see utils.camera_backends); real USB devices by default
+        :param idle_scheduler: Optional utils.idle_scheduler.IdleScheduler run while waiting
+        :param known_serials: Serials to accept; the cameras of config.yaml by default
+        """
+        self.backend = backend if backend is not None else UdevBackend()
+        self.idle_scheduler = idle_scheduler
         self.vendor = None
         self.model = None
         self.device_node = None
         self.serial = None
-        self._wait_for_camera()
+        self._wait_for_camera(known_serials)
 
-    def _wait_for_camera(self):
-        context = pyudev.Context()
-        monitor = pyudev.Monitor.from_netlink(context)
-        monitor.filter_by('block')
-
-        known_serials = config.config.get("cameras", [])
+    def _wait_for_camera(self, known_serials=None):
+        if known_serials is None:
+            known_serials = config.config.get("cameras", [])
 
         logger.info(f"Waiting for USB camera. Known serials: {known_serials}")
 
-        for device in iter(monitor.poll, None):
+        # The wait is idle time: precompute in the background until a camera shows up
+        if self.idle_scheduler is not None:
+            self.idle_scheduler.start()
+        try:
+            self._match_camera(known_serials)
+        finally:
+            # Ingest gets the machine to itself from the camera's event on
+            if self.idle_scheduler is not None and self.idle_scheduler.stop():
+                logger.info("Stopped idle precomputation for the camera.")
+
+    def _match_camera(self, known_serials):
+        for device in self.backend.events():
             if device.action == 'add' and device.get('ID_USB_DRIVER') == 'usb-storage':
                 serial = device.get('ID_SERIAL_SHORT') or device.get('ID_SERIAL', '')
                 if serial in known_serials:
@@ -51,13 +69,7 @@ class Camera:
         os.makedirs(mount_path, exist_ok=True)
 
         # Encuentra particiones hijas de este dispositivo
-        context = pyudev.Context()
-        device = pyudev.Device.from_device_file(context, self.device_node)
-        partitions = [
-            dev.device_node
-            for dev in device.children
-            if dev.subsystem == 'block' and dev.device_type == 'partition'
-        ]
+        partitions = self.backend.partitions(self.device_node)
 
         if not partitions:
             logger.error(f"No partitions found for device {self.device_node}")
@@ -65,13 +77,10 @@ class Camera:
 
         for partition in partitions:
             try:
-                subprocess.run(
-                    ["sudo", "mount", partition, mount_path],
-                    check=True
-                )
+                self.backend.mount(partition, mount_path)
                 logger.info(f"Camera mounted at {mount_path} using partition {partition}")
                 return  # exit after first successful mount
-            except subprocess.CalledProcessError:
+            except (subprocess.CalledProcessError, OSError):
                 logger.warning(f"Failed to mount {partition}, trying next...")
 
         logger.error(f"All mount attempts failed for {self.device_node}")
@@ -83,10 +92,7 @@ class Camera:
 
         try:
             # Intenta desmontar con la opción -l (lazy unmount)
-            subprocess.run(
-                ["sudo", "umount", "-l", self.mount_point],
-                check=True
-            )
+            self.backend.unmount(self.mount_point)
             logger.info(f"Camera unmounted from {self.mount_point}")
 
             # Espera activa hasta que el sistema libere el punto de montaje
@@ -113,49 +119,64 @@ class Camera:
         except Exception as e:
             logger.error(f"Unexpected error during unmount: {e}")
 
-    def download(self, base_path):
+    def list_recordings(self):
         """
-        Download the content of the camera to the given path.
-        Each video (and its associated .gcsv) is saved in its own subfolder.
+        Groups the video and .gcsv files of the mounted camera by base name.
+
+        :return: Dict of base name -> list of file paths on the camera
         """
         if not hasattr(self, 'mount_point'):
             logger.warning("Camera is not mounted.")
-            return
+            return {}
 
         camara_path = os.path.join(self.mount_point, "DCIM")
         if not os.path.exists(camara_path):
             logger.warning(f"Camera path {camara_path} does not exist.")
-            return
+            return {}
 
         video_exts = ('.mp4', '.mov', '.avi', '.mkv', '.mts')
         gcsv_exts = ('.gcsv',)
 
-        logger.info(f"Copying files from {camara_path} to individual folders under {base_path}")
-
         files_by_base = {}
-
-        # First pass: group files by base name (without extension)
         for root, _, files in os.walk(camara_path):
             for file in files:
                 name, ext = os.path.splitext(file)
                 ext = ext.lower()
                 if ext in video_exts or ext in gcsv_exts:
                     files_by_base.setdefault(name, []).append(os.path.join(root, file))
+        return files_by_base
 
-        # Now for each base, create a subfolder and copy files in
-        for base_name, file_paths in files_by_base.items():
-            dest_dir = os.path.join(base_path, base_name)
-            os.makedirs(dest_dir, exist_ok=True)
+    def copy_recording(self, base_name, file_paths, base_path):
+        """Copies the files of one recording into its own subfolder of base_path."""
+        dest_dir = os.path.join(base_path, base_name)
+        os.makedirs(dest_dir, exist_ok=True)
 
-            for src in file_paths:
-                filename = os.path.basename(src)
-                dst_file = os.path.join(dest_dir, filename)
+        for src in file_paths:
+            filename = os.path.basename(src)
+            dst_file = os.path.join(dest_dir, filename)
 
-                if not os.path.exists(dst_file):
-                    try:
+            # A size mismatch means an interrupted copy or a re-recorded file
+            if not os.path.exists(dst_file) or os.path.getsize(dst_file) != os.path.getsize(src):
+                try:
+                    with span("ingest.copy", file=src):
                         shutil.copy2(src, dst_file)
-                        logger.info(f"  Copied {filename} to {dest_dir}")
-                    except Exception as e:
-                        logger.error(f"  Error copying {filename} to {dest_dir}: {e}")
-                else:
-                    logger.info(f"  Skipped (already exists): {filename} in {dest_dir}")
+                    logger.info(f"  Copied {filename} to {dest_dir}")
+                except Exception as e:
+                    logger.error(f"  Error copying {filename} to {dest_dir}: {e}")
+            else:
+                logger.info(f"  Skipped (already exists): {filename} in {dest_dir}")
+
+    def download(self, base_path):
+        """
+        Download the content of the camera to the given path.
+        Each video (and its associated .gcsv) is saved in its own subfolder.
+        """
+        files_by_base = self.list_recordings()
+        if not files_by_base:
+            return
+
+        logger.info(f"Copying files from {self.mount_point} to individual folders under {base_path}")
+        with span("ingest", file=self.mount_point) as info:
+            info["bytes"] = sum(os.path.getsize(p) for paths in files_by_base.values() for p in paths)
+            for base_name, file_paths in files_by_base.items():
+                self.copy_recording(base_name, file_paths, base_path)
@@ -0,0 +1,97 @@
+"""Device backends used by Camera: real udev hotplug, or a simulated camera for tests and benchmarks"""
+import os
+import queue
+import subprocess
+
+
+class UdevBackend:
+    """Real USB cameras, detected with pyudev and mounted with sudo mount."""
+    def __init__(self):
+        import pyudev
+        self._pyudev = pyudev
+        self.context = pyudev.Context()
+
+    def events(self):
+        """Yields block device events as they happen."""
+        monitor = self._pyudev.Monitor.from_netlink(self.context)
+        monitor.filter_by('block')
+        return iter(monitor.poll, None)
+
+    def partitions(self, device_node):
+        device = self._pyudev.Device.from_device_file(self.context, device_node)
+        return [
+            dev.device_node
+            for dev in device.children
+            if dev.subsystem == 'block' and dev.device_type == 'partition'
+        ]
+
+    def mount(self, partition, mount_path):
+        subprocess.run(["sudo", "mount", partition, mount_path], check=True)
+
+    def unmount(self, mount_point):
+        # Lazy unmount (-l) so a busy file handle does not block us
+        subprocess.run(["sudo", "umount", "-l", mount_point], check=True)
+
+
+class SimulatedDevice:
+    """Mimics the parts of a pyudev.Device that Camera reads."""
+    def __init__(self, action, device_node, properties):
+        self.action = action
+        self.device_node = device_node
+        self._properties = properties
+
+    def get(self, key, default=None):
+        return self._properties.get(key, default)
+
+
+class SimulatedBackend:
+    """
+    A fake camera serving a directory (or a loopback disk image) that
+    contains a DCIM tree. plug() emits the same 'add' event a real
+    usb-storage device produces.
+
+    :param source: Directory holding DCIM/, or a disk image file
+    :param serial: Serial reported by the fake device; must be in config 'cameras'
+    :param autoplug: Queue an add event right away
+    """
+    def __init__(self, source, serial, vendor="Simulated", model="FakeCam", autoplug=True):
+        self.source = os.path.abspath(source)
+        self.serial = serial
+        self.vendor = vendor
+        self.model = model
+        self.device_node = f"/dev/sim-{serial}"
+        self._events = queue.Queue()
+        if autoplug:
+            self.plug()
+
+    def plug(self):
+        self._events.put(SimulatedDevice('add', self.device_node, {
+            'ID_USB_DRIVER': 'usb-storage',
+            'ID_SERIAL_SHORT': self.serial,
+            'ID_VENDOR': self.vendor,
+            'ID_MODEL': self.model,
+        }))
+
+    def events(self):
+        while True:
+            yield self._events.get()
+
+    def _is_image(self):
+        return os.path.isfile(self.source)
+
+    def partitions(self, device_node):
+        return [self.source]
+
+    def mount(self, partition, mount_path):
+        if self._is_image():
+            subprocess.run(["sudo", "mount", "-o", "loop,ro", partition, mount_path], check=True)
+            return
+        # Directories are exposed through a symlink at the mount point
+        os.rmdir(mount_path)
+        os.symlink(partition, mount_path)
+
+    def unmount(self, mount_point):
+        if self._is_image():
+            subprocess.run(["sudo", "umount", "-l", mount_point], check=True)
+        elif os.path.islink(mount_point):
+            os.unlink(mount_point)
@@ -1,18 +1,232 @@
 import os
+import threading
+import time
 import yaml
 import getpass
 
+
+class ConfigError(ValueError):
+    """Raised when config.yaml does not match SCHEMA."""
+
+
+NUMBER = (int, float)
+OPTIONAL = type(None)
+
+# Dotted key -> (accepted types, extra check or None). Keys that are absent
+# are not an error; modules fall back to their own defaults.
+SCHEMA = {
+    "camera_path": (str, None),
+    "cameras": (list, None),
+    "logs.path": (str, None),
+    "logs.sqlite_file": (str, None),
+    "logs.batch_size": (int, lambda v: v > 0),
+    "logs.flush_interval_ms": (int, lambda v: v >= 0),
+    "logs.listener": (bool, None),
+    "logs.retention": ((dict, OPTIONAL), None),
+    "batch.enabled": (bool, None),
+    "batch.stabilize.min_peak_score": ((int, float, OPTIONAL), None),
+    "batch.stabilize.shake": (bool, None),
+    "pipeline.state_db": (str, None),
+    "pipeline.workers": ((int, dict), lambda v: all(
+        isinstance(n, int) and n > 0 for n in (v.values() if isinstance(v, dict) else [v]))),
+    "cache.fingerprint.path": (str, None),
+    "cache.gcsv.path": (str, None),
+    "cache.gcsv.max_bytes": ((int, OPTIONAL), lambda v: v is None or v > 0),
+    "cache.highlights.path": (str, None),
+    "cache.lod.path": (str, None),
+    "cache.lod.max_bytes": ((int, OPTIONAL), lambda v: v is None or v > 0),
+    "cache.probe.path": (str, None),
+    "cache.stabilization.path": ((str, OPTIONAL), None),
+    "cache.stabilization.max_bytes": (int, lambda v: v > 0),
+    "encoder.codec": (str, None),
+    "encoder.audio_codec": (str, None),
+    "encoder.preset": (str, lambda v: v in (
+        "ultrafast", "superfast", "veryfast", "faster", "fast",
+        "medium", "slow", "slower", "veryslow", "placebo")),
+    "encoder.crf": (int, lambda v: 0 <= v <= 51),
+    "encoder.threads": ((int, OPTIONAL), lambda v: v is None or v > 0),
+    "fingerprint.enabled": (bool, None),
+    "fingerprint.action": (str, lambda v: v in ("skip", "flag")),
+    "fingerprint.samples": (int, lambda v: v > 0),
+    "fingerprint.visual_threshold": (NUMBER, lambda v: 0 < v <= 1),
+    "fingerprint.motion_threshold": (NUMBER, lambda v: 0 < v <= 1),
+    "highlight_index.enabled": (bool, None),
+    "highlight_index.processes": ((int, OPTIONAL), lambda v: v is None or v > 0),
+    "highlight_index.kinds": (list, lambda v: bool(v) and all(k in ("acceleration", "rotation") for k in v)),
+    "highlight_index.min_separation_s": (NUMBER, lambda v: v > 0),
+    "highlight_index.max_events": (int, lambda v: v > 0),
+    "idle.enabled": (bool, None),
+    "idle.start_delay_s": (NUMBER, lambda v: v >= 0),
+    "idle.niceness": (int, lambda v: 0 <= v <= 19),
+    "idle.stages": (list, lambda v: all(s in ("audio", "loudness", "sync", "peaks", "shake", "stabilize", "clips", "reel") for s in v)),
+    "loudness.enabled": (bool, None),
+    "loudness.target_lufs": (NUMBER, lambda v: -70 < v < 0),
+    "loudness.peak_db": (NUMBER, lambda v: v <= 0),
+    "loudness.max_gain_db": (NUMBER, lambda v: v >= 0),
+    "peaks.kind": (str, lambda v: v in ("acceleration", "rotation")),
+    "peaks.top_n": (int, lambda v: v > 0),
+    "peaks.clip_before": (NUMBER, lambda v: v >= 0),
+    "peaks.clip_after": (NUMBER, lambda v: v >= 0),
+    "planner.target_duration": ((int, float, OPTIONAL), lambda v: v is None or v > 0),
+    "planner.min_gap": (NUMBER, lambda v: v >= 0),
+    "render_queue.enabled": (bool, None),
+    "render_queue.path": (str, None),
+    "render_queue.lease_s": (NUMBER, lambda v: v > 0),
+    "render_queue.max_attempts": (int, lambda v: v > 0),
+    "render_queue.wait_timeout_s": ((int, float, OPTIONAL), None),
+    "planner.scales": (list, lambda v: bool(v) and all(isinstance(x, (int, float)) and x > 0 for x in v)),
+    "shake.highpass_hz": (NUMBER, lambda v: v > 0),
+    "shake.window_s": (NUMBER, lambda v: v > 0),
+    "shake.threshold_dps": (NUMBER, lambda v: v > 0),
+    "shake.min_shaky_fraction": (NUMBER, lambda v: 0 <= v <= 1),
+    "status_server.enabled": (bool, None),
+    "status_server.port": (int, lambda v: 0 < v < 65536),
+    "status_server.rate_window_s": (NUMBER, lambda v: v > 0),
+    "storage.enabled": (bool, None),
+    "storage.db": (str, None),
+    "storage.budget_bytes": ((int, OPTIONAL), lambda v: v is None or v > 0),
+    "storage.high_watermark": ((int, float, OPTIONAL), lambda v: v is None or 0 < v <= 1),
+    "storage.low_watermark": ((int, float, OPTIONAL), lambda v: v is None or 0 < v <= 1),
+    "storage.evict": (list, lambda v: all(k in ("audio", "stabilized") for k in v)),
+    "storage.min_idle_hours": (NUMBER, lambda v: v >= 0),
+    "storage.archive_path": ((str, OPTIONAL), None),
+    "storage.archive_after_days": (NUMBER, lambda v: v >= 0),
+    "sync.enabled": (bool, None),
+    "sync.probe_s": (NUMBER, lambda v: v > 0),
+    "sync.rate_hz": (NUMBER, lambda v: v > 0),
+    "sync.flow_width": (int, lambda v: v >= 32),
+    "sync.max_offset_s": (NUMBER, lambda v: v > 0),
+    "sync.min_confidence": (NUMBER, lambda v: -1 <= v <= 1),
+}
+
+_MISSING = object()
+
+def _lookup(config, dotted_key, default=_MISSING):
+    value = config
+    for part in dotted_key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return default
+        value = value[part]
+    return value
+
+def validate_config(config):
+    """Returns a list of problems found in a loaded config (empty if valid)."""
+    if not isinstance(config, dict):
+        return ["top level must be a mapping"]
+    errors = []
+    for key, (types, check) in SCHEMA.items():
+        value = _lookup(config, key)
+        if value is _MISSING:
+            continue
+        # bool is an int subclass; don't accept True where a count is expected
+        if isinstance(value, bool) and bool not in (types if isinstance(types, tuple) else (types,)):
+            errors.append(f"{key}: expected {types}, got {value!r}")
+        elif not isinstance(value, types):
+            errors.append(f"{key}: expected {types}, got {value!r}")
+        elif check is not None and not check(value):
+            errors.append(f"{key}: invalid value {value!r}")
+    return errors
+
+
 class ConfigManager:
+    """
+    Shared, validated view of config.yaml.
+    Every ConfigManager() for the same file returns the same instance, so the
+    file is parsed once per process. Reading .config checks the file's mtime
+    (at most every RELOAD_CHECK_INTERVAL seconds) and reloads it when it
+    changed; an invalid edit is reported and the previous config kept.
+    """
+    RELOAD_CHECK_INTERVAL = 1.0
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __new__(cls, path="config/config.yaml"):
+        key = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), path))
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = super().__new__(cls)
+                instance._initialized = False
+                cls._instances[key] = instance
+        return instance
+
     def __init__(self, path="config/config.yaml"):
+        if self._initialized:
+            return
         self.path = path
-        self.config = None
+        self._config = None
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.RLock()
+        self._callbacks = []
         self._ensure_config_exists()
-        self._load_config()
-        self._fix_placeholders()
+        config = self._read()
+        errors = validate_config(config)
+        if errors:
+            raise ConfigError(f"Invalid {self.path}: " + "; ".join(errors))
+        self._config = config
+        self._next_check = time.monotonic() + self.RELOAD_CHECK_INTERVAL
+        self._initialized = True
 
-    def _ensure_config_exists(self):
+    @property
+    def absolute_path(self):
         base_dir = os.path.dirname(os.path.dirname(__file__))
-        absolute_path = os.path.join(base_dir, self.path)
+        return os.path.join(base_dir, self.path)
+
+    @property
+    def config(self):
+        """The current config dict, reloaded first if the file changed."""
+        if time.monotonic() >= self._next_check:
+            self.reload()
+        return self._config
+
+    def get(self, dotted_key, default=None):
+        """Value at a dotted key such as 'peaks.top_n', or default."""
+        value = _lookup(self.config, dotted_key)
+        return default if value is _MISSING or value is None else value
+
+    def on_reload(self, callback):
+        """Registers callback(config) to run after each successful reload."""
+        self._callbacks.append(callback)
+
+    def reload(self, force=False):
+        """
+        Re-reads the file if its mtime changed (or force is set).
+        Returns True when a new config was applied.
+        """
+        with self._lock:
+            self._next_check = time.monotonic() + self.RELOAD_CHECK_INTERVAL
+            try:
+                mtime = os.path.getmtime(self.absolute_path)
+            except OSError:
+                return False
+            if not force and mtime == self._mtime:
+                return False
+            try:
+                config = self._read()
+            except Exception as e:
+                self._mtime = mtime
+                print(f"⚠️  Could not reload {self.path}, keeping previous config: {e}")
+                return False
+            errors = validate_config(config)
+            self._mtime = mtime
+            if errors:
+                print(f"⚠️  Ignoring invalid {self.path}: " + "; ".join(errors))
+                return False
+            changed = config != self._config
+            self._config = config
+        if changed:
+            print(f"🔄 Reloaded {self.path}")
+            for callback in self._callbacks:
+                try:
+                    callback(config)
+                except Exception as e:
+                    print(f"⚠️  Config reload callback failed: {e}")
+        return changed
+
+    def _ensure_config_exists(self):
+        absolute_path = self.absolute_path
 
         config_dir = os.path.dirname(absolute_path)
         os.makedirs(config_dir, exist_ok=True)
@@ -22,20 +236,146 @@ class ConfigManager:
                 "camera_path": "/home/[user]/camera_mount",
                 "logs": {
                     "path": "/home/[user]/logs/app.log",
-                    "sqlite_file": "/home/[user]/logs/logs.db"
+                    "sqlite_file": "/home/[user]/logs/logs.db",
+                    "batch_size": 100,
+                    "flush_interval_ms": 500,
+                    "listener": False,
+                    "retention": {
+                        "max_age_days": 90,
+                        "max_rows": 2000000,
+                        "maintenance_interval_s": 3600
+                    }
+                },
+                "cameras": ["Wasintek_camera"],
+                "batch": {
+                    "enabled": False,
+                    "stabilize": {"min_peak_score": None, "shake": True},
+                    "summary_path": "/home/[user]/logs/last_run.json"
+                },
+                "pipeline": {
+                    "state_db": "/home/[user]/cache/pipeline.db",
+                    "workers": {
+                        "default": 2,
+                        "stabilize": 1
+                    }
+                },
+                "cache": {
+                    "fingerprint": {
+                        "path": "/home/[user]/cache/fingerprints.db"
+                    },
+                    "gcsv": {
+                        "path": "/home/[user]/cache/gcsv",
+                        "max_bytes": 5 * 1024**3
+                    },
+                    "highlights": {
+                        "path": "/home/[user]/cache/highlights.db"
+                    },
+                    "lod": {
+                        "path": "/home/[user]/cache/lod",
+                        "max_bytes": 5 * 1024**3
+                    },
+                    "probe": {
+                        "path": "/home/[user]/cache/probe.db"
+                    },
+                    "stabilization": {
+                        "path": "/home/[user]/cache/stabilized",
+                        "max_bytes": 50 * 1024**3
+                    }
+                },
+                "encoder": {
+                    "codec": "libx264",
+                    "audio_codec": "aac",
+                    "preset": "medium",
+                    "crf": 23,
+                    "threads": None
+                },
+                "fingerprint": {
+                    "enabled": True,
+                    "action": "skip",
+                    "samples": 8,
+                    "visual_threshold": 0.8,
+                    "motion_threshold": 0.9
+                },
+                "highlight_index": {
+                    "enabled": True,
+                    "processes": None,
+                    "kinds": ["acceleration", "rotation"],
+                    "min_separation_s": 1.0,
+                    "max_events": 200
+                },
+                "idle": {
+                    "enabled": True,
+                    "start_delay_s": 30,
+                    "niceness": 19,
+                    "stages": ["audio", "loudness", "sync", "peaks", "shake"]
                 },
-                "cameras": ["Wasintek_camera"]
+                "loudness": {
+                    "enabled": True,
+                    "target_lufs": -16.0,
+                    "peak_db": -1.0,
+                    "max_gain_db": 20.0
+                },
+                "peaks": {
+                    "kind": "acceleration",
+                    "top_n": 5,
+                    "clip_before": 0.5,
+                    "clip_after": 1.5
+                },
+                "planner": {
+                    "target_duration": None,
+                    "min_gap": 1.0,
+                    "scales": [0.5, 1.0, 1.5, 2.0]
+                },
+                "render_queue": {
+                    "enabled": False,
+                    "path": "/home/[user]/cache/render_queue.db",
+                    "lease_s": 120,
+                    "max_attempts": 3,
+                    "wait_timeout_s": None
+                },
+                "shake": {
+                    "highpass_hz": 1.0,
+                    "window_s": 1.0,
+                    "threshold_dps": 15.0,
+                    "min_shaky_fraction": 0.1
+                },
+                "status_server": {
+                    "enabled": True,
+                    "port": 9187,
+                    "rate_window_s": 300
+                },
+                "storage": {
+                    "enabled": False,
+                    "db": "/home/[user]/cache/storage.db",
+                    "budget_bytes": None,
+                    "high_watermark": 0.9,
+                    "low_watermark": 0.8,
+                    "evict": ["audio", "stabilized"],
+                    "min_idle_hours": 24,
+                    "archive_path": None,
+                    "archive_after_days": 14
+                },
+                "sync": {
+                    "enabled": True,
+                    "probe_s": 30.0,
+                    "rate_hz": 30.0,
+                    "flow_width": 160,
+                    "max_offset_s": 5.0,
+                    "min_confidence": 0.5
+                }
             }
             with open(absolute_path, 'w') as file:
                 yaml.dump(default_config, file, default_flow_style=False)
 
-    def _load_config(self):
-        base_dir = os.path.dirname(os.path.dirname(__file__))
-        absolute_path = os.path.join(base_dir, self.path)
-        with open(absolute_path, 'r') as file:
-            self.config = yaml.safe_load(file)
+    def _read(self):
+        """Parses the file and replaces the [user] placeholders."""
+        self._mtime = os.path.getmtime(self.absolute_path)
+        with open(self.absolute_path, 'r') as file:
+            config = yaml.safe_load(file)
+        return self._fix_placeholders(config)
 
-    def _fix_placeholders(self):
+    @staticmethod
+    def _fix_placeholders(config):
         user = getpass.getuser()
 
         def replace_placeholders(value):
@@ -47,4 +387,4 @@ class ConfigManager:
                 return {k: replace_placeholders(v) for k, v in value.items()}
             return value
 
-        self.config = replace_placeholders(self.config)
+        return replace_placeholders(config)
@@ -1,10 +1,35 @@
 from moviepy.editor import VideoFileClip, concatenate_videoclips, TextClip, CompositeVideoClip, ImageClip
 from utils.manage_csv import CSVManager
 from utils.config_manager import ConfigManager
+from utils.media_readers import readers
+from logger.spans import span
 import os
 import subprocess
 from gyroflow.interpolate_gcsv import interpolate_data_for_frames_from_video_path
 
+config = ConfigManager()
+
+def encoder_settings():
+    """Encoder section of config.yaml with defaults filled in."""
+    return {
+        "codec": config.get("encoder.codec", "libx264"),
+        "audio_codec": config.get("encoder.audio_codec", "aac"),
+        "preset": config.get("encoder.preset", "medium"),
+        "crf": int(config.get("encoder.crf", 23)),
+        "threads": config.get("encoder.threads"),
+    }
+
+def encoder_args(encoder=None, audio=True):
+    """Keyword arguments for moviepy's write_videofile from encoder settings."""
+    encoder = encoder or encoder_settings()
+    return {
+        "codec": encoder["codec"],
+        "audio_codec": encoder["audio_codec"] if audio else None,
+        "audio": audio,
+        "preset": encoder["preset"],
+        "ffmpeg_params": ["-crf", str(encoder["crf"])],
+        "threads": encoder["threads"],
+    }
 
 def get_interval_clip(peak_times, clip_duration=(0.5, 1.5)):
     clips_duration = []
@@ -31,41 +56,43 @@ def get_interval_clip(peak_times, clip_duration=(0.5, 1.5)):
     return merged_clips
 
 def overlay_data_on_video(video_path, frame_data):
-    video = VideoFileClip(video_path)
-    fps = video.fps
-
-    def make_frame_with_overlay(get_frame, t):
-        frame = get_frame(t)
-        frame_idx = int(t * fps)
-        if frame_idx >= len(frame_data):
-            return frame
-
-        data = frame_data[frame_idx]
-        text = (
-            f"Time: {data['timestamp_sec']:.2f}s\n"
-            f"Gyro: [{data['gyro_x']:.2f}, {data['gyro_y']:.2f}, {data['gyro_z']:.2f}]\n"
-            f"Accel: [{data['accel_x']:.2f}, {data['accel_y']:.2f}, {data['accel_z']:.2f}]"
-        )
+    with readers.acquire(video_path) as video:
+        fps = video.fps
+
+        def make_frame_with_overlay(get_frame, t):
+            frame = get_frame(t)
+            frame_idx = int(t * fps)
+            if frame_idx >= len(frame_data):
+                return frame
+
+            data = frame_data[frame_idx]
+            text = (
+                f"Time: {data['timestamp_sec']:.2f}s\n"
+                f"Gyro: [{data['gyro_x']:.2f}, {data['gyro_y']:.2f}, {data['gyro_z']:.2f}]\n"
+                f"Accel: [{data['accel_x']:.2f}, {data['accel_y']:.2f}, {data['accel_z']:.2f}]"
+            )
 
-        txt_clip = TextClip(
-            text,
-            fontsize=20,
-            color='white',
-            font='DejaVu-Sans',
-            bg_color='black'
-        ).set_position(("left", "bottom")).set_duration(1.0 / fps)
+            txt_clip = TextClip(
+                text,
+                fontsize=20,
+                color='white',
+                font='DejaVu-Sans',
+                bg_color='black'
+            ).set_position(("left", "bottom")).set_duration(1.0 / fps)
 
-        composite = CompositeVideoClip([ImageClip(frame).set_duration(1.0 / fps), txt_clip])
-        return composite.get_frame(0)
+            composite = CompositeVideoClip([ImageClip(frame).set_duration(1.0 / fps), txt_clip])
+            return composite.get_frame(0)
 
-    print("Rendering video with overlay...")
+        print("Rendering video with overlay...")
 
-    base, ext = os.path.splitext(video_path)
-    temp_output_path = f"{base}_with_overlay{ext}"
+        base, ext = os.path.splitext(video_path)
+        temp_output_path = f"{base}_with_overlay{ext}"
 
-    new_video = video.fl(make_frame_with_overlay)
-    new_video.write_videofile(temp_output_path, codec="libx264", audio_codec="aac")
+        new_video = video.fl(make_frame_with_overlay)
+        new_video.write_videofile(temp_output_path, **encoder_args())
 
+    # The original is about to be replaced; don't keep its reader around
+    readers.discard(video_path)
     print("Replacing original video...")
     os.remove(video_path)
     os.rename(temp_output_path, video_path)
@@ -73,57 +100,79 @@ def overlay_data_on_video(video_path, frame_data):
     return video_path
 
 
-def create_highlight_clips(video_path, clips_duration, output_folder, join=False):
+def create_highlight_clips(video_path, clips_duration, output_folder, join=False, encoder=None, gains=None):
+    """
+    Exports one clip per (start, end) window.
+
+    :param gains: Optional audio gain in dB per window (see utils.loudness.clip_gains),
+                  applied while encoding
+    """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
     base_name = os.path.splitext(os.path.basename(video_path))[0]
     clip_paths = []
 
-    video = VideoFileClip(video_path)
-    total_duration = video.duration
-    clips = []
+    # Subclips share the pooled reader, so everything happens inside this block
+    with readers.acquire(video_path) as video:
+        total_duration = video.duration
+        clips = []
 
-    for i, (start, end) in enumerate(clips_duration):
-        start = max(start, 0)
-        end = min(end, total_duration)
-        if end - start <= 0.1:
-            print(f"Clip {i+1} skipped: duration too short ({end - start}s)")
-            continue
-
-        try:
-            subclip = video.subclip(start, end)
-            has_audio = subclip.audio is not None
-
-            clip_file = os.path.join(output_folder, f"{base_name}_clip_{i+1}.mp4")
-            print(f"Exporting clip {i+1}: {start:.2f}s to {end:.2f}s | Audio: {has_audio}")
-            
-            subclip.write_videofile(
-                clip_file,
-                codec="libx264",
-                audio_codec="aac" if has_audio else None,
-                audio=has_audio,
-                verbose=False,
-                logger=None
-            )
-            
-            clip_paths.append(clip_file)
-            clips.append(subclip)
-        except Exception as e:
-            print(f"Error creating clip {i+1}: {e}")
+        for i, (start, end) in enumerate(clips_duration):
+            start = max(start, 0)
+            end = min(end, total_duration)
+            if end - start <= 0.1:
+                print(f"Clip {i+1} skipped: duration too short ({end - start}s)")
+                continue
 
-    if join and clips:
-        try:
-            final = concatenate_videoclips(clips)
-            joined_path = os.path.join(output_folder, f"{base_name}_highlights.mp4")
-            print("Concatenating all clips into one...")
-            final.write_videofile(joined_path, codec="libx264", audio=True)
-            return [joined_path]
-        except Exception as e:
-            print(f"Error concatenating clips: {e}")
+            try:
+                subclip = video.subclip(start, end)
+                has_audio = subclip.audio is not None
+                if has_audio and gains and gains[i]:
+                    subclip = subclip.volumex(10 ** (gains[i] / 20))
+
+                clip_file = os.path.join(output_folder, f"{base_name}_clip_{i+1}.mp4")
+                print(f"Exporting clip {i+1}: {start:.2f}s to {end:.2f}s | Audio: {has_audio}"
+                      + (f" ({gains[i]:+.1f} dB)" if has_audio and gains and gains[i] else ""))
+
+                with span("clip.export", file=video_path, frames=int(round((end - start) * video.fps))) as info:
+                    subclip.write_videofile(
+                        clip_file,
+                        verbose=False,
+                        logger=None,
+                        **encoder_args(encoder, audio=has_audio)
+                    )
+                    info["bytes"] = os.path.getsize(clip_file)
+
+                clip_paths.append(clip_file)
+                clips.append(subclip)
+            except Exception as e:
+                print(f"Error creating clip {i+1}: {e}")
+
+        if join and clips:
+            try:
+                final = concatenate_videoclips(clips)
+                joined_path = os.path.join(output_folder, f"{base_name}_highlights.mp4")
+                print("Concatenating all clips into one...")
+                final.write_videofile(joined_path, **encoder_args(encoder))
+                return [joined_path]
+            except Exception as e:
+                print(f"Error concatenating clips: {e}")
 
     return clip_paths
 
+def join_clips(clip_paths, output_path, encoder=None):
+    """Concatenates already exported clip files into a single reel."""
+    clips = [VideoFileClip(p) for p in clip_paths]
+    try:
+        final = concatenate_videoclips(clips)
+        print(f"Concatenating {len(clips)} clips into {output_path}...")
+        final.write_videofile(output_path, **encoder_args(encoder))
+    finally:
+        for c in clips:
+            c.close()
+    return output_path
+
 def clip(files):
     print("✂️ Clipping the following files:")
     for full_path in files:
@@ -148,14 +197,21 @@ def clip(files):
 
         try:
             csv_manager = CSVManager(gcsv_path)
-            peaks = csv_manager.detect_peaks(kind='acceleration', top_n=5, plot=False)
+            peaks = csv_manager.detect_peaks(
+                kind=config.get("peaks.kind", "acceleration"),
+                top_n=int(config.get("peaks.top_n", 5)),
+                plot=False
+            )
             peak_times = [p[0] for p in peaks]
 
             if not peak_times:
                 print(f"  ⚠️  No peaks found in {gcsv_path}, skipping.")
                 continue
 
-            clips_duration = get_interval_clip(peak_times, clip_duration=(0.5, 1.5))
+            clips_duration = get_interval_clip(peak_times, clip_duration=(
+                float(config.get("peaks.clip_before", 0.5)),
+                float(config.get("peaks.clip_after", 1.5))
+            ))
             clips_dir = os.path.join(video_dir, "clips")
 
             print(f"  ✨ Creating highlight clips for {base_name}...")
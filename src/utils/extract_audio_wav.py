@@ -1,8 +1,19 @@
 #!/usr/bin/env python3
 import ffmpeg
+import shutil
 import sys
 import os
+from logger.spans import timed
 
+def ffmpeg_command():
+    """ffmpeg from the PATH, or the binary bundled with imageio-ffmpeg (as moviepy does)."""
+    exe = shutil.which("ffmpeg")
+    if exe:
+        return exe
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+@timed("audio")
 def extract_audio_ffmpeg(input_video_path, output_audio_path):
     """
     Extracts the audio stream from a video file to WAV format using ffmpeg-python.
@@ -34,7 +45,7 @@ def extract_audio_ffmpeg(input_video_path, output_audio_path):
         # overwrite_output=True allows overwriting the output file if it already exists.
         # capture_stdout/stderr=True allows capturing FFmpeg's messages if needed.
         print("Running FFmpeg command...")
-        ffmpeg.run(stream, capture_stdout=True, capture_stderr=True, overwrite_output=True)
+        ffmpeg.run(stream, cmd=ffmpeg_command(), capture_stdout=True, capture_stderr=True, overwrite_output=True)
 
         print("Audio extraction completed successfully!")
         return True
@@ -0,0 +1,51 @@
+"""Size limit for caches stored as one file per entry, least recently used first"""
+import os
+import sys
+
+
+def touch(path):
+    """Marks a cache file as used now; its mtime is its last use."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def trim(cache_dir, max_bytes, suffix=".npz"):
+    """
+    Deletes the least recently used files under cache_dir until the ones
+    ending in suffix fit max_bytes. Cheap next to building an entry: one
+    stat per cached file.
+
+    :return: Number of files deleted
+    """
+    if max_bytes is None:
+        return 0
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for f in files:
+            # Temporary files of a write in progress are not entries yet
+            if not f.endswith(suffix) or f.endswith(".tmp" + suffix):
+                continue
+            path = os.path.join(root, f)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error evicting cache file {path}: {e}", file=sys.stderr)
+            continue
+        total -= size
+        removed += 1
+    return removed
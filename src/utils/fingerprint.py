@@ -0,0 +1,389 @@
+"""Near-duplicate recording detection from sampled frame hashes and GCSV signatures"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import cv2
+import numpy as np
+from scipy.signal import correlate
+from utils.config_manager import ConfigManager
+
+config = ConfigManager()
+
+# Rate of the GCSV motion series compared between recordings
+SERIES_HZ = 5.0
+# 64-bit hashes are split into BANDS bands; two hashes sharing any band are
+# candidates. Hashes within BANDS - 1 bits of each other always share one.
+BANDS = 4
+BAND_BITS = 64 // BANDS
+# Hamming distance under which two frame hashes show the same picture
+FRAME_MATCH_BITS = 10
+# Frames with less grey-level spread than this carry no fingerprint
+FLAT_FRAME_STD = 4.0
+
+# Fixed random hyperplanes for the GCSV simhash, identical in every process
+_HYPERPLANES = np.random.default_rng(20240501).normal(size=(64, 34))
+
+
+def dhash(gray, size=8):
+    """64-bit difference hash of a grayscale image."""
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def frame_hashes(video_path, samples=8, keyframe_times=None):
+    """
+    dHashes of `samples` frames spread over the video (the first and last
+    5% are skipped: black frames and menus look alike everywhere; so are
+    flat frames). When
+    keyframe times are known, the nearest keyframe is used, which the
+    decoder can seek to without decoding from the previous one.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return []
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        duration = frames / fps if frames > 0 else 0
+        if duration <= 0:
+            return []
+
+        targets = np.linspace(0.05, 0.95, samples) * duration
+        if keyframe_times and len(keyframe_times) >= samples:
+            kf = np.asarray(keyframe_times)
+            targets = kf[np.abs(kf[None, :] - targets[:, None]).argmin(axis=1)]
+
+        hashes = []
+        for t in targets:
+            cap.set(cv2.CAP_PROP_POS_MSEC, float(t) * 1000)
+            ok, frame = cap.read()
+            if not ok:
+                continue
+            gray = cv2.cvtColor(cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+            # Flat frames (lens cap, black, sky) hash alike in every video
+            if gray.std() < FLAT_FRAME_STD:
+                continue
+            hashes.append(dhash(gray))
+        return hashes
+    finally:
+        cap.release()
+
+
+def motion_series(gcsv_path):
+    """
+    Acceleration magnitude of a GCSV at SERIES_HZ, mean removed. Magnitudes
+    don't depend on how the camera is mounted, so two cameras on the same
+    vehicle give nearly the same series.
+    """
+    from utils.manage_csv import CSVManager
+    data = CSVManager(gcsv_path).data
+    if data is None or data.empty:
+        return None
+    t = data["time_s"].to_numpy()
+    accel = np.sqrt(data["ax_g"].to_numpy()**2 + data["ay_g"].to_numpy()**2 + data["az_g"].to_numpy()**2)
+    gyro = np.sqrt(data["rx_deg"].to_numpy()**2 + data["ry_deg"].to_numpy()**2 + data["rz_deg"].to_numpy()**2)
+
+    bins = ((t - t[0]) * SERIES_HZ).astype(np.int64)
+    counts = np.maximum(np.bincount(bins), 1)
+    accel_series = np.bincount(bins, weights=accel) / counts
+    gyro_series = np.bincount(bins, weights=gyro) / counts
+    return (accel_series - accel_series.mean()).astype(np.float32), gyro_series.astype(np.float32)
+
+
+def gcsv_simhash(accel_series, gyro_series):
+    """
+    64-bit simhash of shift-invariant features (value histograms and
+    duration), so recordings of the same run land in the same LSH bucket
+    even if one camera started later.
+    """
+    features = np.concatenate([
+        np.histogram(np.clip(accel_series, -1.0, 1.0), bins=16, range=(-1.0, 1.0))[0],
+        np.histogram(np.clip(gyro_series, 0, 400), bins=16, range=(0, 400))[0],
+    ]).astype(float)
+    features /= max(features.sum(), 1.0)
+    features = np.concatenate([features, [np.log1p(len(accel_series) / SERIES_HZ) / 10, 1.0]])
+    bits = (_HYPERPLANES @ (features - features.mean())) > 0
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def _bands(value):
+    return [(band, (value >> (band * BAND_BITS)) & ((1 << BAND_BITS) - 1)) for band in range(BANDS)]
+
+
+def _hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def visual_similarity(a, b):
+    """Share of sampled frames of either video that also appear in the other."""
+    if not a or not b:
+        return 0.0
+    a_in_b = sum(min(_hamming(x, y) for y in b) <= FRAME_MATCH_BITS for x in a) / len(a)
+    b_in_a = sum(min(_hamming(y, x) for x in a) <= FRAME_MATCH_BITS for y in b) / len(b)
+    return (a_in_b + b_in_a) / 2
+
+
+def lagged_pearson(a, b, max_lag, min_overlap):
+    """
+    Pearson correlation of b against a shifted by every lag up to max_lag
+    samples, each lag scored on its own overlap. The sums behind every lag
+    come from one FFT correlation and cumulative sums.
+
+    :return: (lags, r) for the lags overlapping at least min_overlap samples;
+             lag k aligns a[k] with b[0]
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    a, b = a - a.mean(), b - b.mean()
+    n, m = len(a), len(b)
+    lags = np.arange(-(m - 1), n)
+    # Overlap of a[lag:lag+m] and b, as index ranges into each series
+    a_lo, a_hi = np.maximum(lags, 0), np.minimum(lags + m, n)
+    b_lo, b_hi = a_lo - lags, a_hi - lags
+    overlap = a_hi - a_lo
+    valid = (np.abs(lags) <= max_lag) & (overlap >= max(min_overlap, 2))
+    if not valid.any():
+        return lags[:0], np.zeros(0)
+
+    def window_sums(x, lo, hi):
+        c = np.concatenate([[0.0], np.cumsum(x)])
+        return c[hi] - c[lo]
+
+    sab = correlate(a, b, mode="full", method="fft")
+    sa, sb = window_sums(a, a_lo, a_hi), window_sums(b, b_lo, b_hi)
+    saa, sbb = window_sums(a * a, a_lo, a_hi), window_sums(b * b, b_lo, b_hi)
+    k = overlap[valid]
+    cov = sab[valid] - sa[valid] * sb[valid] / k
+    var = (saa[valid] - sa[valid]**2 / k) * (sbb[valid] - sb[valid]**2 / k)
+    r = cov / np.sqrt(np.maximum(var, 1e-12))
+    return lags[valid], np.clip(r, -1.0, 1.0)
+
+
+def series_similarity(a, b, max_lag_s=120.0):
+    """
+    Peak Pearson correlation of two motion series over the lags up to
+    max_lag_s. Near 1.0 means the same ride.
+    """
+    if a is None or b is None or len(a) < 10 or len(b) < 10:
+        return 0.0
+    # Require half of the shorter series to overlap, so short chance matches don't count
+    _, r = lagged_pearson(a, b, max_lag_s * SERIES_HZ, min(len(a), len(b)) // 2)
+    return float(r.max()) if len(r) else 0.0
+
+
+class FingerprintIndex:
+    """
+    Fingerprints of every recording in SQLite, with LSH band tables for the
+    frame hashes and the GCSV simhash. Looking up the matches of a new file
+    only compares it with files sharing a band, so the cost grows with the
+    number of look-alikes rather than with the size of the library.
+    """
+    def __init__(self, db_file, samples=8):
+        self.db_file = db_file
+        self.samples = samples
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    frames TEXT NOT NULL,
+                    gcsv_hash INTEGER,
+                    accel BLOB,
+                    created REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS lsh (
+                    kind TEXT NOT NULL,
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    path TEXT NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lsh_bucket ON lsh (kind, band, bucket)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lsh_path ON lsh (path)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_signed(value):
+        # SQLite integers are signed 64-bit
+        return value - (1 << 64) if value >= 1 << 63 else value
+
+    @staticmethod
+    def _to_unsigned(value):
+        return value + (1 << 64) if value < 0 else value
+
+    def _load(self, conn, path):
+        row = conn.execute(
+            "SELECT size, mtime_ns, frames, gcsv_hash, accel FROM fingerprints WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "path": path,
+            "identity": (row[0], row[1]),
+            "frames": [int(h, 16) for h in json.loads(row[2])],
+            "gcsv_hash": self._to_unsigned(row[3]) if row[3] is not None else None,
+            "accel": np.frombuffer(row[4], dtype=np.float32) if row[4] is not None else None,
+        }
+
+    def fingerprint(self, video_path):
+        """Fingerprint of a recording, computed once per size/mtime of the video."""
+        from utils.stages import recording_paths
+        from utils.media_probe import get_media_probe
+
+        path = os.path.abspath(video_path)
+        st = os.stat(path)
+        identity = (st.st_size, st.st_mtime_ns)
+        with self._connect() as conn:
+            cached = self._load(conn, path)
+        if cached and cached["identity"] == identity:
+            return cached
+
+        try:
+            keyframes = get_media_probe().keyframes(path)
+        except Exception:
+            keyframes = None
+        frames = frame_hashes(path, self.samples, keyframes)
+
+        gcsv_path = recording_paths(path)["gcsv"]
+        accel, gcsv_hash = None, None
+        if os.path.exists(gcsv_path):
+            series = motion_series(gcsv_path)
+            if series is not None:
+                accel = series[0]
+                gcsv_hash = gcsv_simhash(*series)
+
+        with self._lock, self._connect() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO fingerprints (path, size, mtime_ns, frames, gcsv_hash, accel, created)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (path, identity[0], identity[1], json.dumps([f"{h:016x}" for h in frames]),
+                  self._to_signed(gcsv_hash) if gcsv_hash is not None else None,
+                  accel.tobytes() if accel is not None else None, time.time()))
+            conn.execute("DELETE FROM lsh WHERE path = ?", (path,))
+            rows = [("f", band, bucket, path) for h in frames for band, bucket in _bands(h)]
+            if gcsv_hash is not None:
+                rows += [("g", band, bucket, path) for band, bucket in _bands(gcsv_hash)]
+            conn.executemany("INSERT INTO lsh (kind, band, bucket, path) VALUES (?, ?, ?, ?)", set(rows))
+
+        return {"path": path, "identity": identity, "frames": frames, "gcsv_hash": gcsv_hash, "accel": accel}
+
+    def candidates(self, fp):
+        """Paths sharing at least one LSH band with fp."""
+        keys = [("f", band, bucket) for h in fp["frames"] for band, bucket in _bands(h)]
+        if fp["gcsv_hash"] is not None:
+            keys += [("g", band, bucket) for band, bucket in _bands(fp["gcsv_hash"])]
+        found = set()
+        with self._connect() as conn:
+            for key in set(keys):
+                found.update(r[0] for r in conn.execute(
+                    "SELECT path FROM lsh WHERE kind = ? AND band = ? AND bucket = ?", key))
+        found.discard(fp["path"])
+        return found
+
+    def compare(self, a, b):
+        """(visual similarity, motion similarity) of two fingerprints."""
+        return visual_similarity(a["frames"], b["frames"]), series_similarity(a["accel"], b["accel"])
+
+    def find_duplicates(self, paths, visual_threshold=0.8, motion_threshold=0.9, workers=4):
+        """
+        Groups paths that show the same recording and picks one to keep per
+        group: the one with a GCSV, then the largest file, then the first path.
+
+        :return: Dict duplicate path -> kept path
+        """
+        paths = [os.path.abspath(p) for p in paths]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fps = dict(zip(paths, pool.map(self._safe_fingerprint, paths)))
+        fps = {p: fp for p, fp in fps.items() if fp is not None}
+
+        parent = {p: p for p in fps}
+
+        def root(p):
+            while parent[p] != p:
+                parent[p] = parent[parent[p]]
+                p = parent[p]
+            return p
+
+        for path, fp in fps.items():
+            for other in self.candidates(fp):
+                if other not in fps or root(other) == root(path):
+                    continue
+                visual, motion = self.compare(fp, fps[other])
+                if visual >= visual_threshold or motion >= motion_threshold:
+                    parent[root(other)] = root(path)
+
+        groups = {}
+        for p in fps:
+            groups.setdefault(root(p), []).append(p)
+
+        def rank(p):
+            return (fps[p]["accel"] is None, -fps[p]["identity"][0], p)
+
+        duplicates = {}
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            keep = min(members, key=rank)
+            for m in members:
+                if m != keep:
+                    duplicates[m] = keep
+        return duplicates
+
+    def _safe_fingerprint(self, path):
+        try:
+            return self.fingerprint(path)
+        except Exception as e:
+            print(f"⚠️  Could not fingerprint {path}: {e}")
+            return None
+
+
+_index = None
+
+def get_fingerprint_index():
+    """The shared index at cache.fingerprint.path."""
+    global _index
+    if _index is None:
+        _index = FingerprintIndex(
+            config.get("cache.fingerprint.path", os.path.expanduser("~/cache/fingerprints.db")),
+            samples=int(config.get("fingerprint.samples", 8))
+        )
+    return _index
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    from utils.stages import is_derived_video
+    from main import list_videos
+
+    parser = argparse.ArgumentParser(description="List recordings that duplicate another one.")
+    parser.add_argument("path", nargs="?", default=config.get("camera_path", ""), help="Library to scan.")
+    parser.add_argument("--visual", type=float, default=float(config.get("fingerprint.visual_threshold", 0.8)))
+    parser.add_argument("--motion", type=float, default=float(config.get("fingerprint.motion_threshold", 0.9)))
+    args = parser.parse_args()
+
+    videos = [v for v in list_videos(args.path) if not is_derived_video(v)]
+    start = time.perf_counter()
+    duplicates = get_fingerprint_index().find_duplicates(videos, args.visual, args.motion)
+    for dup, keep in sorted(duplicates.items()):
+        print(f"{dup}\n    duplicates {keep}")
+    print(f"{len(duplicates)} duplicates among {len(videos)} recordings ({time.perf_counter() - start:.1f}s)")
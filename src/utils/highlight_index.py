@@ -0,0 +1,391 @@
+"""Library-wide index of GCSV events, built in parallel and queried without re-parsing"""
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+from scipy.signal import find_peaks
+from utils.config_manager import ConfigManager
+from utils.sync_offset import load_offset
+
+config = ConfigManager()
+
+KINDS = ("acceleration", "rotation")
+# Bumped whenever the scoring changes, so every recording is re-analyzed
+SCORING_VERSION = 1
+
+
+def score_events(gcsv_path, kinds=KINDS, min_separation_s=1.0, max_events=200):
+    """
+    Every event of each kind in one GCSV: peaks above the threshold
+    CSVManager.detect_peaks uses, at least min_separation_s apart, keeping
+    the max_events strongest per kind. Runs in a worker process.
+
+    :return: (duration in seconds, list of (time, kind, score))
+    """
+    from utils.manage_csv import CSVManager
+    manager = CSVManager(gcsv_path)
+    data = manager.data
+    if data is None or data.empty:
+        return 0.0, []
+
+    times = data["time_s"].to_numpy()
+    duration = float(times[-1] - times[0]) if len(times) > 1 else 0.0
+    rate = (len(times) - 1) / duration if duration > 0 else 1.0
+
+    events = []
+    for kind in kinds:
+        magnitude, _, threshold = manager.event_magnitude(kind)
+        magnitude = magnitude.to_numpy()
+        indices, properties = find_peaks(magnitude, height=threshold,
+                                         distance=max(1, int(min_separation_s * rate)))
+        found = sorted(zip(times[indices].tolist(), properties["peak_heights"].tolist()),
+                       key=lambda e: e[1], reverse=True)[:max_events]
+        events.extend((t, kind, v) for t, v in found)
+    return duration, events
+
+
+def _analyze(gcsv_path, kinds, min_separation_s, max_events):
+    start = time.perf_counter()
+    duration, events = score_events(gcsv_path, kinds, min_separation_s, max_events)
+    return gcsv_path, duration, events, time.perf_counter() - start
+
+
+def video_for(gcsv_path):
+    """The raw video next to a GCSV, if any."""
+    base = os.path.splitext(gcsv_path)[0]
+    for ext in ('.MP4', '.mp4', '.MOV', '.mov', '.AVI', '.avi'):
+        if os.path.exists(base + ext):
+            return base + ext
+    return None
+
+
+class HighlightIndex:
+    """
+    Events of every recording in one SQLite table, indexed by kind and
+    score and by recording date. Recordings are re-analyzed only when their
+    GCSV changes size or mtime, so updating after a camera download only
+    parses the new files.
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS recordings (
+                    gcsv_path TEXT PRIMARY KEY,
+                    video_path TEXT,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    recorded REAL NOT NULL,
+                    duration REAL,
+                    params TEXT NOT NULL,
+                    indexed REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    gcsv_path TEXT NOT NULL,
+                    video_path TEXT,
+                    time REAL NOT NULL,
+                    kind TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    recorded REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_kind_score ON events (kind, score DESC)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_kind_recorded ON events (kind, recorded)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_gcsv ON events (gcsv_path)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def stale(self, gcsv_paths, params):
+        """
+        GCSVs never indexed, changed since, or indexed with other parameters.
+
+        :param params: Dict of GCSV path -> parameters it would be indexed with
+        """
+        with self._connect() as conn:
+            known = {r[0]: (r[1], r[2], r[3]) for r in conn.execute(
+                "SELECT gcsv_path, size, mtime_ns, params FROM recordings")}
+        stale = []
+        for path in gcsv_paths:
+            st = os.stat(path)
+            if known.get(path) != (st.st_size, st.st_mtime_ns, params[path]):
+                stale.append(path)
+        return stale
+
+    def _store(self, gcsv_path, duration, events, params):
+        st = os.stat(gcsv_path)
+        video_path = video_for(gcsv_path)
+        # The camera sets the mtime when it closes the file: the end of the ride
+        recorded = st.st_mtime
+        with self._connect() as conn:
+            conn.execute("DELETE FROM events WHERE gcsv_path = ?", (gcsv_path,))
+            conn.executemany(
+                "INSERT INTO events (gcsv_path, video_path, time, kind, score, recorded) VALUES (?, ?, ?, ?, ?, ?)",
+                [(gcsv_path, video_path, t, kind, score, recorded) for t, kind, score in events]
+            )
+            conn.execute('''
+                INSERT OR REPLACE INTO recordings
+                    (gcsv_path, video_path, size, mtime_ns, recorded, duration, params, indexed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (gcsv_path, video_path, st.st_size, st.st_mtime_ns, recorded, duration, params, time.time()))
+
+    def forget_missing(self, gcsv_paths):
+        """
+        Drops recordings whose GCSV was deleted. Footage archived by the
+        storage manager keeps its events, so queries still cover it.
+        """
+        from utils.storage_manager import get_storage_manager
+        storage = get_storage_manager()
+        present = set(gcsv_paths)
+        with self._connect() as conn:
+            gone = [
+                r[0] for r in conn.execute("SELECT gcsv_path FROM recordings")
+                if r[0] not in present and not os.path.exists(r[0])
+                and not (storage is not None and storage.is_retired(r[0]))
+            ]
+        self.forget(gone)
+        return gone
+
+    def forget(self, gcsv_paths):
+        """Drops the given recordings and their events."""
+        rows = [(os.path.abspath(p),) for p in gcsv_paths]
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM events WHERE gcsv_path = ?", rows)
+            conn.executemany("DELETE FROM recordings WHERE gcsv_path = ?", rows)
+
+    def update(self, gcsv_paths, processes=None, kinds=KINDS, min_separation_s=1.0, max_events=200,
+               log_queue=None):
+        """
+        Analyzes the stale GCSVs on a process pool (GCSV parsing is CPU
+        bound) and writes their events from this process, the only writer.
+
+        :param log_queue: Queue of a running LogListener for the workers' logs;
+                          defaults to the one this process logs through, or
+                          a listener started for the pool when there is none
+        :return: Dict with the number of analyzed, unchanged and removed recordings
+        """
+        from logger import logger_manager
+        from logger.log_listener import LogListener
+        log_queue = log_queue or logger_manager._log_queue
+
+        gcsv_paths = [os.path.abspath(p) for p in gcsv_paths]
+        settings = {"kinds": list(kinds), "min_separation_s": min_separation_s,
+                    "max_events": max_events, "version": SCORING_VERSION}
+        # Event times follow the sync offset, so a new offset re-indexes the recording
+        params = {p: json.dumps({**settings, "offset_s": load_offset(p)}, sort_keys=True) for p in gcsv_paths}
+        stale = self.stale(gcsv_paths, params)
+        removed = self.forget_missing(gcsv_paths)
+
+        analyzed, failed = 0, 0
+        workers = min(processes or os.cpu_count() or 1, len(stale))
+        listener = None
+        if workers <= 1:
+            # A worker process would only add its start-up time
+            results = (self._attempt(_analyze, p, kinds, min_separation_s, max_events) for p in stale)
+            pool = None
+        else:
+            if log_queue is None:
+                # Workers with their own handlers would all write to the same log files and DB
+                listener = LogListener().start()
+                log_queue = listener.queue
+            # spawn, like the log listener: forked children inherit SQLite locks
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=logger_manager.configure_worker, initargs=(log_queue,))
+            futures = [pool.submit(_analyze, p, kinds, min_separation_s, max_events) for p in stale]
+            results = (self._attempt(f.result) for f in as_completed(futures))
+        try:
+            for result in results:
+                if result is None:
+                    failed += 1
+                    continue
+                gcsv_path, duration, events, _ = result
+                self._store(gcsv_path, duration, events, params[gcsv_path])
+                analyzed += 1
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if listener is not None:
+                listener.stop()
+        return {"analyzed": analyzed, "failed": failed, "unchanged": len(gcsv_paths) - len(stale),
+                "removed": len(removed)}
+
+    @staticmethod
+    def _attempt(func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            print(f"❌ Could not analyze a GCSV: {e}")
+            return None
+
+    def top(self, kind="acceleration", n=20, since=None, until=None, per_recording=None):
+        """
+        Strongest events of a kind, newest recordings first on ties.
+
+        :param since: Epoch seconds; only recordings made after it
+        :param until: Epoch seconds; only recordings made before it
+        :param per_recording: At most this many events from one recording
+        :return: List of dicts with gcsv_path, video_path, time, kind, score, recorded
+        """
+        where, args = ["kind = ?"], [kind]
+        if since is not None:
+            where.append("recorded >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("recorded < ?")
+            args.append(until)
+        query = f'''
+            SELECT gcsv_path, video_path, time, kind, score, recorded FROM events
+            WHERE {" AND ".join(where)} ORDER BY score DESC, recorded DESC
+        '''
+        results, per = [], {}
+        with self._connect() as conn:
+            if per_recording is None:
+                rows = conn.execute(query + " LIMIT ?", (*args, n)).fetchall()
+            else:
+                rows = conn.execute(query, args)
+            for row in rows:
+                if per_recording is not None:
+                    if per.get(row[0], 0) >= per_recording:
+                        continue
+                    per[row[0]] = per.get(row[0], 0) + 1
+                results.append(dict(zip(("gcsv_path", "video_path", "time", "kind", "score", "recorded"), row)))
+                if len(results) >= n:
+                    break
+        return results
+
+    def counts(self):
+        with self._connect() as conn:
+            recordings = conn.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+            events = dict(conn.execute("SELECT kind, COUNT(*) FROM events GROUP BY kind").fetchall())
+        return {"recordings": recordings, "events": events}
+
+
+def assemble_reel(events, output_path, clip_duration=(0.5, 1.5), encoder=None):
+    """
+    Cuts the given index events from their videos and joins them into one
+    reel, in the order given. Only the event windows are decoded, and
+    their audio is normalized from the stored loudness profiles.
+    """
+    from utils.edit_video import create_highlight_clips, get_interval_clip, join_clips
+    from utils.loudness import clip_gains
+    from utils.stages import recording_paths
+    clips_dir = os.path.join(os.path.dirname(os.path.abspath(output_path)), "index_clips")
+    by_video = {}
+    for event in events:
+        if event["video_path"] and os.path.exists(event["video_path"]):
+            by_video.setdefault(event["video_path"], []).append(event["time"])
+    order = {}
+    for video_path, times in by_video.items():
+        windows = get_interval_clip(times, clip_duration=clip_duration)
+        # Clips from different recordings are brought to the same loudness
+        gains = clip_gains(recording_paths(video_path)["audio"], windows)
+        for clip_path in create_highlight_clips(video_path, windows, clips_dir, encoder=encoder, gains=gains):
+            # Clips are named <video>_clip_<window number>.mp4; short windows are skipped
+            start, end = windows[int(os.path.splitext(clip_path)[0].rsplit("_", 1)[1]) - 1]
+            order[clip_path] = min(i for i, e in enumerate(events)
+                                   if e["video_path"] == video_path and start <= e["time"] <= end)
+    if not order:
+        print("❌ None of the events has its video on disk.")
+        return None
+    return join_clips(sorted(order, key=order.get), output_path, encoder=encoder)
+
+
+def library_gcsvs(base_path):
+    """GCSV logs of the raw recordings (gyroflow's synchronized copies excluded)."""
+    found = []
+    for root, _, files in os.walk(base_path):
+        for f in files:
+            if f.lower().endswith(".gcsv") and not f.endswith("_synchronized.gcsv"):
+                found.append(os.path.join(root, f))
+    return sorted(found)
+
+
+def index_settings():
+    """Scoring parameters from the 'highlight_index' section of config.yaml."""
+    return {
+        "kinds": tuple(config.get("highlight_index.kinds", list(KINDS))),
+        "min_separation_s": float(config.get("highlight_index.min_separation_s", 1.0)),
+        "max_events": int(config.get("highlight_index.max_events", 200)),
+    }
+
+
+def update_library(base_path, log_queue=None, exclude=()):
+    """
+    Brings the shared index up to date with the GCSVs under base_path.
+    GCSVs in exclude (e.g. of duplicate recordings) are left out, and
+    dropped from the index if they were in it.
+    """
+    excluded = {os.path.abspath(p) for p in exclude}
+    gcsvs = [p for p in library_gcsvs(base_path) if os.path.abspath(p) not in excluded]
+    index = get_highlight_index()
+    index.forget(excluded)
+    return index.update(
+        gcsvs, processes=config.get("highlight_index.processes"),
+        log_queue=log_queue, **index_settings())
+
+
+_index = None
+
+def get_highlight_index():
+    """The shared index at cache.highlights.path."""
+    global _index
+    if _index is None:
+        _index = HighlightIndex(config.get("cache.highlights.path", os.path.expanduser("~/cache/highlights.db")))
+    return _index
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    from logger.log_listener import LogListener
+    from logger.spans import parse_since
+
+    parser = argparse.ArgumentParser(description="Build and query the library-wide highlight index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="Index new and changed recordings.")
+    build_parser.add_argument("path", nargs="?", default=config.get("camera_path", ""))
+    build_parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: all CPUs).")
+    top_parser = sub.add_parser("top", help="Strongest events across the library.")
+    top_parser.add_argument("--kind", choices=KINDS, default="acceleration")
+    top_parser.add_argument("-n", type=int, default=20)
+    top_parser.add_argument("--since", help="Recordings since 'YYYY-MM-DD' or an age like '30d'.")
+    top_parser.add_argument("--until", help="Recordings before 'YYYY-MM-DD'.")
+    top_parser.add_argument("--per-recording", type=int, default=None)
+    top_parser.add_argument("--reel", help="Also cut the events into this reel file.")
+    sub.add_parser("stats", help="Indexed recordings and events.")
+    args = parser.parse_args()
+
+    index = get_highlight_index()
+    if args.command == "build":
+        gcsvs = library_gcsvs(args.path)
+        start = time.perf_counter()
+        with LogListener() as listener:
+            result = index.update(gcsvs, processes=args.processes, log_queue=listener.queue, **index_settings())
+        print(f"Indexed {result['analyzed']} recordings ({result['unchanged']} unchanged, "
+              f"{result['removed']} removed, {result['failed']} failed) in {time.perf_counter() - start:.1f}s")
+    elif args.command == "top":
+        events = index.top(args.kind, args.n, parse_since(args.since), parse_since(args.until), args.per_recording)
+        for e in events:
+            day = datetime.fromtimestamp(e["recorded"]).strftime("%Y-%m-%d")
+            print(f"{e['score']:8.3f}  {day}  {e['time']:8.2f}s  {e['video_path'] or e['gcsv_path']}")
+        if args.reel and events:
+            clip_duration = (float(config.get("peaks.clip_before", 0.5)), float(config.get("peaks.clip_after", 1.5)))
+            from utils.edit_video import encoder_settings
+            assemble_reel(events, args.reel, clip_duration, encoder_settings())
+    else:
+        print(json.dumps(index.counts(), indent=2))
@@ -0,0 +1,121 @@
+"""Chooses highlight windows that fit a target reel duration before anything is rendered"""
+import argparse
+import json
+import numpy as np
+
+
+def candidate_windows(peaks, clip_duration=(0.5, 1.5), scales=(0.5, 1.0, 1.5, 2.0), video_duration=None):
+    """
+    Windows around every peak at several paddings.
+
+    A window is worth the summed score of the peaks it contains, times
+    sqrt(length / nominal length): more context around a peak is better,
+    with diminishing returns, and a trimmed window still keeps some value.
+
+    :param peaks: List of (time, score)
+    :param clip_duration: Nominal (before, after) padding around a peak
+    :param scales: Multipliers of the nominal padding to try
+    :param video_duration: Windows are clamped to [0, video_duration]
+    :return: List of (start, end, value)
+    """
+    before, after = clip_duration
+    nominal = before + after
+    times = np.array([t for t, _ in peaks], dtype=float)
+    scores = np.array([max(float(v), 0.0) for _, v in peaks], dtype=float)
+
+    windows = set()
+    for t in times.tolist():
+        for scale in scales:
+            start = max(t - before * scale, 0.0)
+            end = t + after * scale
+            if video_duration is not None:
+                end = min(end, video_duration)
+            if end > start:
+                windows.add((round(start, 3), round(end, 3)))
+
+    result = []
+    for start, end in sorted(windows):
+        inside = (times >= start) & (times <= end)
+        value = scores[inside].sum() * np.sqrt((end - start) / nominal)
+        if value > 0:
+            result.append((start, end, float(value)))
+    return result
+
+
+def plan_windows(windows, target_duration, min_gap=1.0, resolution=0.1):
+    """
+    Picks non-overlapping windows, at least min_gap seconds apart, whose
+    total length fits target_duration and whose summed value is maximal.
+
+    Weighted interval scheduling with a knapsack over the duration budget:
+    windows are sorted by end, and best[i][w] is the best value using the
+    first i windows within w budget units. Each row is one vectorized max.
+
+    :param windows: List of (start, end, value)
+    :param target_duration: Reel length budget in seconds
+    :param resolution: Budget step in seconds; lengths are rounded up to it
+    :return: Chosen (start, end) pairs in time order
+    """
+    if not windows or target_duration <= 0:
+        return []
+
+    windows = sorted(windows, key=lambda w: w[1])
+    budget = int(target_duration / resolution + 1e-9)
+    ends = np.array([w[1] for w in windows])
+    weights = [int(np.ceil((w[1] - w[0]) / resolution - 1e-9)) for w in windows]
+
+    n = len(windows)
+    best = np.zeros((n + 1, budget + 1))
+    take = np.zeros((n + 1, budget + 1), dtype=bool)
+    for i, (start, end, value) in enumerate(windows, start=1):
+        weight = weights[i - 1]
+        best[i] = best[i - 1]
+        if weight > budget:
+            continue
+        # Last window (in end order) that finishes min_gap before this one starts
+        prev = int(np.searchsorted(ends, start - min_gap, side="right"))
+        with_it = np.full(budget + 1, -np.inf)
+        with_it[weight:] = best[prev, :budget + 1 - weight] + value
+        take[i] = with_it > best[i]
+        best[i] = np.maximum(best[i], with_it)
+
+    chosen = []
+    i, w = n, int(np.argmax(best[n]))
+    while i > 0 and w >= 0:
+        if take[i, w]:
+            start, end, _ = windows[i - 1]
+            chosen.append((start, end))
+            w -= weights[i - 1]
+            i = int(np.searchsorted(ends, start - min_gap, side="right"))
+        else:
+            i -= 1
+    return sorted(chosen)
+
+
+def plan_highlights(peaks, target_duration, clip_duration=(0.5, 1.5), video_duration=None,
+                    min_gap=1.0, scales=(0.5, 1.0, 1.5, 2.0), resolution=0.1):
+    """
+    Highlight windows for one recording that fit target_duration seconds.
+    Returns (start, end) pairs, like get_interval_clip, ready for
+    create_highlight_clips.
+    """
+    windows = candidate_windows(peaks, clip_duration, scales, video_duration)
+    return plan_windows(windows, target_duration, min_gap, resolution)
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan highlight windows from a peaks file.")
+    parser.add_argument("peaks_json", help="<name>_peaks.json written by the peaks stage.")
+    parser.add_argument("--target", type=float, default=30.0, help="Target reel duration in seconds.")
+    parser.add_argument("--min-gap", type=float, default=1.0)
+    parser.add_argument("--before", type=float, default=0.5)
+    parser.add_argument("--after", type=float, default=1.5)
+    args = parser.parse_args()
+
+    with open(args.peaks_json) as f:
+        peaks = [(p["time"], p["value"]) for p in json.load(f)]
+    plan = plan_highlights(peaks, args.target, (args.before, args.after), min_gap=args.min_gap)
+    for start, end in plan:
+        print(f"{start:8.2f}s - {end:8.2f}s  ({end - start:.2f}s)")
+    print(f"Total: {sum(e - s for s, e in plan):.2f}s of {args.target:.2f}s")
@@ -0,0 +1,190 @@
+"""Low-priority precomputation while the daemon waits for a camera"""
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import threading
+import time
+from utils.config_manager import ConfigManager
+
+config = ConfigManager()
+
+# Stages cheap enough to run for every recording ahead of time; clips and
+# reels can be added in config.yaml, at the cost of rendering unselected files
+DEFAULT_STAGES = ("audio", "loudness", "sync", "peaks", "shake")
+
+
+def lower_priority(niceness=19, io_class=3):
+    """
+    Lowers the CPU (nice) and disk (ionice; 3 is the idle class) priority of
+    this process. Children, such as ffmpeg, inherit both.
+    """
+    try:
+        os.nice(niceness)
+    except OSError as e:
+        print(f"⚠️  Could not renice the idle worker: {e}")
+    try:
+        subprocess.run(["ionice", "-c", str(io_class), "-p", str(os.getpid())],
+                       check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"⚠️  Could not set the I/O priority of the idle worker: {e}")
+
+
+def precompute(base_path, stages=DEFAULT_STAGES):
+    """
+    Everything the next session would otherwise compute first: media
+    probes, GCSV binary caches, fingerprints, the given pipeline stages,
+    the highlight index and the plot pyramids. Every step is stored as it
+    completes, so being stopped halfway loses at most the current file.
+
+    :return: Dict of step -> seconds spent
+    """
+    from main import list_videos, find_duplicates, without_duplicates
+    from utils.media_probe import get_media_probe
+    from utils.manage_csv import CSVManager
+    from utils.highlight_index import update_library
+    from utils.lod_pyramid import get_pyramid
+    from utils.stages import create_pipeline, add_recording_tasks, recording_paths, is_derived_video
+
+    videos = list_videos(base_path)
+    recordings = [v for v in videos if not is_derived_video(v)]
+    gcsvs = [p for p in (recording_paths(v)["gcsv"] for v in recordings) if os.path.exists(p)]
+    duplicates = {}
+    timings = {}
+
+    def step(name, func, *args):
+        start = time.perf_counter()
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"❌ Idle step {name} failed: {e}")
+        timings[name] = round(time.perf_counter() - start, 2)
+
+    def parse_gcsvs():
+        for gcsv in gcsvs:
+            CSVManager(gcsv)
+
+    def fingerprints():
+        # Same rules as process_library, so the session finds the same work done
+        duplicates.update(find_duplicates(recordings))
+
+    def run_stages():
+        todo = recordings
+        if config.get("fingerprint.action", "skip") == "skip":
+            todo = without_duplicates(recordings, duplicates)
+        pipeline = create_pipeline()
+        for video in todo:
+            add_recording_tasks(pipeline, video, stages)
+        # One task at a time: the point is to use idle time, not to compete for it
+        pipeline.run(stages=list(stages), workers=1)
+
+    def pyramids():
+        for gcsv in gcsvs:
+            get_pyramid(gcsv)
+
+    step("probe", get_media_probe().probe_many, videos)
+    step("gcsv", parse_gcsvs)
+    step("fingerprint", fingerprints)
+    step("stages", run_stages)
+    if config.get("highlight_index.enabled", True):
+        step("highlight_index", lambda: update_library(
+            base_path, exclude=[recording_paths(d)["gcsv"] for d in duplicates]))
+    step("lod", pyramids)
+    return timings
+
+
+def _worker(base_path, stages, niceness, log_queue):
+    # Own process group, so stopping it also stops the ffmpeg/gyroflow children
+    os.setpgrp()
+    if log_queue is not None:
+        from logger import logger_manager
+        logger_manager.configure_worker(log_queue)
+    lower_priority(niceness)
+    timings = precompute(base_path, stages)
+    print(f"💤 Idle precomputation done: {timings}")
+
+
+class IdleScheduler:
+    """
+    Runs precompute() in a background process while Camera waits for a
+    device, and stops it the moment one arrives so ingest gets the machine
+    to itself. The process runs at the lowest CPU and I/O priority, starts
+    after start_delay_s, so a camera plugged in right away never sees it,
+    and is spawned rather than forked (forked children inherit SQLite locks).
+    """
+    def __init__(self, base_path, stages=None, niceness=None, start_delay_s=None):
+        self.base_path = base_path
+        self.stages = tuple(stages if stages is not None else config.get("idle.stages", DEFAULT_STAGES))
+        self.niceness = int(niceness if niceness is not None else config.get("idle.niceness", 19))
+        self.start_delay_s = float(start_delay_s if start_delay_s is not None
+                                   else config.get("idle.start_delay_s", 30))
+        self._process = None
+        self._timer = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Schedules the worker; returns immediately."""
+        self.stop()
+        with self._lock:
+            self._timer = threading.Timer(self.start_delay_s, self._spawn, args=(self._generation,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _spawn(self, generation):
+        from logger import logger_manager
+        with self._lock:
+            # A stop() that raced the timer wins
+            if generation != self._generation:
+                return
+            ctx = multiprocessing.get_context("spawn")
+            process = ctx.Process(
+                target=_worker, args=(self.base_path, self.stages, self.niceness, logger_manager._log_queue),
+                name="idle-precompute", daemon=True)
+            process.start()
+            self._process = process
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.is_alive()
+
+    def stop(self, timeout=5.0):
+        """
+        Stops the worker and everything it started. SIGSTOP takes the
+        group off the CPU at once; SIGTERM (delivered on SIGCONT) then ends
+        it. Finished steps are already stored, the current one is redone
+        by the session.
+        """
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            process, self._process = self._process, None
+        if process is None or not process.is_alive():
+            return False
+        try:
+            os.killpg(process.pid, signal.SIGSTOP)
+            os.killpg(process.pid, signal.SIGTERM)
+            os.killpg(process.pid, signal.SIGCONT)
+        except ProcessLookupError:
+            # Still starting up, not yet the leader of its own group
+            process.terminate()
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        return True
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute what the next session needs, at low priority.")
+    parser.add_argument("path", nargs="?", default=config.get("camera_path", ""), help="Library to precompute.")
+    parser.add_argument("--stages", default=None, help="Comma-separated pipeline stages (default: from config.yaml).")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",")] if args.stages else config.get("idle.stages", DEFAULT_STAGES)
+    lower_priority(int(config.get("idle.niceness", 19)))
+    print(precompute(args.path, stages))
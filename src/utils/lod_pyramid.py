@@ -0,0 +1,226 @@
+"""Min/max level-of-detail pyramid over GCSV channels, for fast headless plotting"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from utils import file_cache
+from utils.config_manager import ConfigManager
+from utils.metrics import metrics
+from utils.sync_offset import load_offset
+
+config = ConfigManager()
+
+CHANNELS = ("rx_deg", "ry_deg", "rz_deg", "ax_g", "ay_g", "az_g", "braking", "rotation")
+# Samples merged into one bin from one level to the next
+FACTOR = 4
+# Levels stop once they are this short; no plot is wider than that many pixels
+MIN_BINS = 256
+# Bumped when the file layout or the derived channels change
+FORMAT_VERSION = 1
+
+
+class MinMaxPyramid:
+    """
+    Raw samples plus successively coarser levels holding, per bin of FACTOR**k
+    samples, the first timestamp and the min and max of every channel.
+    Drawing the min/max envelope of a level with about one bin per pixel
+    looks the same as drawing every sample, at a fraction of the cost.
+    """
+    def __init__(self, t, raw, channels, levels):
+        self.t = t
+        self.raw = raw
+        self.channels = list(channels)
+        self.levels = levels  # list of (t, lo, hi), finest first
+
+    @classmethod
+    def build(cls, t, raw, channels=CHANNELS):
+        """Builds every level from the raw samples, each from the previous one."""
+        t = np.asarray(t, dtype=np.float64)
+        raw = np.asarray(raw, dtype=np.float32)
+        levels = []
+        lvl_t, lo, hi = t, raw, raw
+        while len(lvl_t) // FACTOR >= MIN_BINS:
+            n = len(lvl_t) // FACTOR * FACTOR
+            # The ragged tail is folded into the last full bin
+            lvl_t = lvl_t[:n:FACTOR]
+            lo_next = lo[:n].reshape(-1, FACTOR, lo.shape[1]).min(axis=1)
+            hi_next = hi[:n].reshape(-1, FACTOR, hi.shape[1]).max(axis=1)
+            if n < len(lo):
+                lo_next[-1] = np.minimum(lo_next[-1], lo[n:].min(axis=0))
+                hi_next[-1] = np.maximum(hi_next[-1], hi[n:].max(axis=0))
+            lo, hi = lo_next, hi_next
+            levels.append((lvl_t, lo, hi))
+        return cls(t, raw, channels, levels)
+
+    @classmethod
+    def from_csv_manager(cls, manager):
+        """Pyramid over the GCSV channels plus the braking and rotation magnitudes detect_peaks uses."""
+        data = manager.data
+        columns = [data[c].to_numpy() for c in CHANNELS[:6]]
+        columns.append(manager.event_magnitude("acceleration")[0].to_numpy())
+        columns.append(manager.event_magnitude("rotation")[0].to_numpy())
+        return cls.build(data["time_s"].to_numpy(), np.column_stack(columns), CHANNELS)
+
+    def query(self, channels, t0=None, t1=None, width=1600):
+        """
+        Data to draw channels between t0 and t1 on width pixels, from the
+        coarsest level that still has at least one bin per pixel.
+
+        :return: (t, lo, hi, level); level 0 means raw samples, with lo == hi
+        """
+        idx = [self.channels.index(c) for c in channels]
+        t0 = self.t[0] if t0 is None else t0
+        t1 = self.t[-1] if t1 is None else t1
+
+        chosen = 0
+        for k, (lvl_t, _, _) in enumerate(self.levels, start=1):
+            a, b = np.searchsorted(lvl_t, [t0, t1])
+            if b - a >= width:
+                chosen = k
+            else:
+                break
+
+        if chosen == 0:
+            a, b = np.searchsorted(self.t, [t0, t1], side="right")
+            a = max(a - 1, 0)
+            values = self.raw[a:b + 1, idx]
+            return self.t[a:b + 1], values, values, 0
+        lvl_t, lo, hi = self.levels[chosen - 1]
+        a, b = np.searchsorted(lvl_t, [t0, t1], side="right")
+        a = max(a - 1, 0)
+        return lvl_t[a:b + 1], lo[a:b + 1, idx], hi[a:b + 1, idx], chosen
+
+    def save(self, path, identity):
+        arrays = {"t": self.t, "raw": self.raw}
+        for k, (lvl_t, lo, hi) in enumerate(self.levels, start=1):
+            arrays[f"t{k}"], arrays[f"lo{k}"], arrays[f"hi{k}"] = lvl_t, lo, hi
+        meta = {"channels": self.channels, "levels": len(self.levels), "identity": identity,
+                "version": FORMAT_VERSION}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, identity=None):
+        """The pyramid stored at path, or None if missing, stale or from another version."""
+        try:
+            with np.load(path) as f:
+                meta = json.loads(str(f["meta"]))
+                if meta.get("version") != FORMAT_VERSION:
+                    return None
+                if identity is not None and meta["identity"] != identity:
+                    return None
+                levels = [(f[f"t{k}"], f[f"lo{k}"], f[f"hi{k}"]) for k in range(1, meta["levels"] + 1)]
+                return cls(f["t"], f["raw"], meta["channels"], levels)
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def _cache_dir():
+    return config.get("cache.lod.path", os.path.expanduser("~/cache/lod"))
+
+
+def _cache_file(gcsv_path):
+    digest = hashlib.sha1(os.path.abspath(gcsv_path).encode()).hexdigest()
+    return os.path.join(_cache_dir(), digest[:2], f"{digest}.npz")
+
+
+def get_pyramid(gcsv_path, manager=None):
+    """
+    Pyramid of a GCSV, from the cache while the file and its sync offset
+    are unchanged. A cache hit needs no GCSV parsing at all; on a miss the
+    given CSVManager (or a new one) is used and the result stored, evicting
+    least recently used pyramids beyond cache.lod.max_bytes.
+    """
+    st = os.stat(gcsv_path)
+    offset = manager.offset_s if manager is not None else load_offset(gcsv_path)
+    identity = [st.st_size, st.st_mtime_ns, offset]
+    cache_file = _cache_file(gcsv_path)
+    pyramid = MinMaxPyramid.load(cache_file, identity)
+    metrics.cache_lookup("lod", pyramid is not None)
+    if pyramid is not None:
+        file_cache.touch(cache_file)
+        return pyramid
+
+    if manager is None:
+        from utils.manage_csv import CSVManager
+        manager = CSVManager(gcsv_path)
+    pyramid = MinMaxPyramid.from_csv_manager(manager)
+    try:
+        pyramid.save(cache_file, identity)
+        file_cache.trim(_cache_dir(), config.get("cache.lod.max_bytes"))
+    except OSError as e:
+        print(f"⚠️  Could not cache the plot pyramid of {gcsv_path}: {e}")
+    return pyramid
+
+
+def render(pyramid, channels, output=None, t0=None, t1=None, width=1600, height=600,
+           title=None, ylabel=None, labels=None, markers=None):
+    """
+    Plots channels from the pyramid level matching the figure width.
+
+    :param output: .png or .svg path, rendered with the Agg canvas (no display
+                   needed); None shows an interactive pyplot window instead
+    :param markers: Optional (times, values) drawn as red crosses, e.g. peaks
+    :return: output, or None when shown
+    """
+    dpi = 100
+    if output is None:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    else:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+
+    t, lo, hi, level = pyramid.query(channels, t0, t1, width)
+    for i, channel in enumerate(channels):
+        label = labels[i] if labels else channel
+        if level == 0:
+            ax.plot(t, lo[:, i], label=label, linewidth=0.8)
+        else:
+            # Envelope of each bin: every sample lies between lo and hi
+            ax.fill_between(t, lo[:, i], hi[:, i], step="post", label=label, alpha=0.6, linewidth=0)
+    if markers is not None and len(markers[0]):
+        ax.plot(markers[0], markers[1], "rx", label=f"Top {len(markers[0])} Peaks")
+
+    ax.set_title(title or ", ".join(channels))
+    ax.set_xlabel("Time (s)")
+    if ylabel:
+        ax.set_ylabel(ylabel)
+    ax.legend()
+    ax.grid()
+    fig.tight_layout()
+
+    if output is None:
+        import matplotlib.pyplot as plt
+        plt.show()
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    fig.savefig(output)
+    return output
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render GCSV channels through the cached min/max pyramid.")
+    parser.add_argument("gcsv", help="GCSV file.")
+    parser.add_argument("--output", "-o", required=True, help="Output .png or .svg file.")
+    parser.add_argument("--channels", default="rx_deg,ry_deg,rz_deg", help=f"Among {', '.join(CHANNELS)}.")
+    parser.add_argument("--from", dest="t0", type=float, default=None, help="Start time (s).")
+    parser.add_argument("--to", dest="t1", type=float, default=None, help="End time (s).")
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--height", type=int, default=600)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pyramid = get_pyramid(args.gcsv)
+    loaded = time.perf_counter()
+    channels = [c.strip() for c in args.channels.split(",") if c.strip()]
+    render(pyramid, channels, args.output, args.t0, args.t1, args.width, args.height)
+    print(f"Wrote {args.output} (pyramid {loaded - start:.2f}s, render {time.perf_counter() - loaded:.2f}s)")
@@ -0,0 +1,219 @@
+"""Loudness profile of each recording's audio, measured once and reused for every clip gain"""
+import argparse
+import os
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import sosfilt
+from utils.config_manager import ConfigManager
+
+config = ConfigManager()
+
+# Sub-block length: momentary (400 ms) and short-term (3 s) windows hop by it
+HOP_S = 0.1
+MOMENTARY_BLOCKS = 4
+SHORT_TERM_BLOCKS = 30
+# BS.1770 gates for the integrated loudness of a window
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# Seconds of audio filtered at a time, so hour-long recordings fit in memory
+CHUNK_S = 60
+# Bumped when the stored arrays change
+FORMAT_VERSION = 1
+
+
+def loudness_settings():
+    """Gain policy from the 'loudness' section of config.yaml, or None when normalization is disabled."""
+    if not config.get("loudness.enabled", True):
+        return None
+    return {
+        "target_lufs": float(config.get("loudness.target_lufs", -16.0)),
+        "peak_db": float(config.get("loudness.peak_db", -1.0)),
+        "max_gain_db": float(config.get("loudness.max_gain_db", 20.0)),
+    }
+
+
+def profile_path(audio_path):
+    """Where the profile of an extracted audio file is kept, next to it."""
+    return f"{os.path.splitext(audio_path)[0]}_loudness.npz"
+
+
+def k_weighting(fs):
+    """
+    The two BS.1770 K-weighting stages (high shelf, then high pass) as
+    second-order sections, from their analog prototypes through the
+    bilinear transform, so any sample rate matches the 48 kHz table.
+    """
+    # Stage 1: +4 dB shelf modelling the head
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / fs)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    # Stage 2: RLB high pass
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / fs)
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, highpass])
+
+
+def to_lufs(mean_square):
+    """Loudness of a channel-summed mean square; silence gives -inf."""
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10 * np.log10(mean_square)
+
+
+def _as_float(samples):
+    if samples.dtype.kind == "f":
+        return samples.astype(np.float64)
+    return samples.astype(np.float64) / float(np.iinfo(samples.dtype).max + 1)
+
+
+def measure(samples, fs):
+    """
+    Mean square of the K-weighted signal (summed over channels) and the
+    sample peak of every HOP_S sub-block. Filtering runs chunk by chunk with
+    the filter state carried over; the per-block sums are array reductions.
+
+    :param samples: (n,) or (n, channels) array, integer PCM or float
+    :return: (energy, peak) arrays, one value per complete sub-block
+    """
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    hop = int(round(fs * HOP_S))
+    blocks = len(samples) // hop
+    sos = k_weighting(fs)
+    zi = np.zeros((len(sos), 2, samples.shape[1]))
+
+    energy, peak = np.zeros(blocks), np.zeros(blocks)
+    chunk = max(1, int(CHUNK_S / HOP_S))
+    for first in range(0, blocks, chunk):
+        last = min(first + chunk, blocks)
+        x = _as_float(samples[first * hop:last * hop])
+        y, zi = sosfilt(sos, x, axis=0, zi=zi)
+        energy[first:last] = (y ** 2).reshape(last - first, hop, -1).mean(axis=1).sum(axis=1)
+        peak[first:last] = np.abs(x).reshape(last - first, hop, -1).max(axis=(1, 2))
+    return energy, peak
+
+
+class LoudnessProfile:
+    """
+    Momentary and short-term loudness of a recording at HOP_S resolution,
+    plus the sub-block energies and peaks they come from, which give the
+    gated loudness and the peak of any window without touching the audio.
+    """
+    def __init__(self, energy, peak):
+        self.energy = np.asarray(energy, dtype=np.float64)
+        self.peak = np.asarray(peak, dtype=np.float64)
+        self.momentary = to_lufs(self._windowed(MOMENTARY_BLOCKS))
+        self.short_term = to_lufs(self._windowed(SHORT_TERM_BLOCKS))
+
+    def _windowed(self, blocks):
+        """Mean energy of every window of `blocks` sub-blocks, one per hop."""
+        if len(self.energy) < blocks:
+            return np.zeros(0)
+        c = np.concatenate([[0.0], np.cumsum(self.energy)])
+        return (c[blocks:] - c[:-blocks]) / blocks
+
+    @classmethod
+    def from_wav(cls, wav_path):
+        fs, samples = wavfile.read(wav_path, mmap=True)
+        return cls(*measure(samples, fs))
+
+    def window_loudness(self, t0, t1):
+        """Gated integrated loudness (LUFS) of [t0, t1], from the 400 ms blocks inside it."""
+        a = max(int(np.floor(t0 / HOP_S)), 0)
+        b = min(int(np.ceil(t1 / HOP_S)), len(self.energy))
+        if b - a < MOMENTARY_BLOCKS:
+            blocks = self.energy[a:b].mean(keepdims=True) if b > a else np.zeros(0)
+        else:
+            blocks = self._windowed(MOMENTARY_BLOCKS)[a:b - MOMENTARY_BLOCKS + 1]
+        blocks = blocks[to_lufs(blocks) > ABSOLUTE_GATE_LUFS]
+        if not len(blocks):
+            return float("-inf")
+        relative = to_lufs(blocks.mean()) + RELATIVE_GATE_LU
+        return float(to_lufs(blocks[to_lufs(blocks) > relative].mean()))
+
+    def window_peak_db(self, t0, t1):
+        a = max(int(np.floor(t0 / HOP_S)), 0)
+        b = min(int(np.ceil(t1 / HOP_S)), len(self.peak))
+        if b <= a:
+            return float("-inf")
+        with np.errstate(divide="ignore"):
+            return float(20 * np.log10(self.peak[a:b].max()))
+
+    def gain_db(self, t0, t1, target_lufs=-16.0, peak_db=-1.0, max_gain_db=20.0):
+        """
+        Gain bringing [t0, t1] to target_lufs, reduced so the sample peak
+        stays under peak_db and bounded by max_gain_db. Silent windows get 0.
+        """
+        loudness = self.window_loudness(t0, t1)
+        if not np.isfinite(loudness):
+            return 0.0
+        gain = min(target_lufs - loudness, peak_db - self.window_peak_db(t0, t1))
+        return float(np.clip(gain, -max_gain_db, max_gain_db))
+
+    def save(self, path):
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, energy=self.energy, peak=self.peak, hop_s=HOP_S, version=FORMAT_VERSION,
+                 momentary=self.momentary.astype(np.float32), short_term=self.short_term.astype(np.float32))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """The profile stored at path, or None if missing or from another version."""
+        try:
+            with np.load(path) as f:
+                if int(f["version"]) != FORMAT_VERSION:
+                    return None
+                return cls(f["energy"], f["peak"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def analyze(audio_path, output_path=None):
+    """Measures an extracted WAV once and stores its profile (the loudness stage)."""
+    profile = LoudnessProfile.from_wav(audio_path)
+    profile.save(output_path or profile_path(audio_path))
+    return profile
+
+
+def clip_gains(audio_path, windows, settings=None):
+    """
+    Gain (dB) for each (start, end) window of a recording, from its stored
+    profile. None when normalization is disabled or the recording has no
+    profile, in which case clips keep the camera levels.
+    """
+    settings = settings if settings is not None else loudness_settings()
+    if settings is None:
+        return None
+    profile = LoudnessProfile.load(profile_path(audio_path))
+    if profile is None:
+        return None
+    return [round(profile.gain_db(max(start, 0), end, **settings), 2) for start, end in windows]
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Measure the loudness of extracted WAV files.")
+    parser.add_argument("wavs", nargs="+", help="WAV files (audio/<name>.wav).")
+    parser.add_argument("--window", nargs=2, type=float, metavar=("START", "END"),
+                        help="Also print the loudness, peak and gain of this window.")
+    args = parser.parse_args()
+
+    settings = loudness_settings() or {}
+    for wav in args.wavs:
+        start = time.perf_counter()
+        profile = analyze(wav)
+        t1 = len(profile.energy) * HOP_S
+        print(f"{wav}: {profile.window_loudness(0, t1):.1f} LUFS integrated, "
+              f"short-term max {np.max(profile.short_term, initial=-np.inf):.1f} LUFS, "
+              f"peak {profile.window_peak_db(0, t1):.1f} dBFS ({time.perf_counter() - start:.2f}s)")
+        if args.window:
+            a, b = args.window
+            print(f"  [{a:.1f}s, {b:.1f}s]: {profile.window_loudness(a, b):.1f} LUFS, "
+                  f"peak {profile.window_peak_db(a, b):.1f} dBFS, gain {profile.gain_db(a, b, **settings):+.1f} dB")
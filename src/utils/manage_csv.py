@@ -1,103 +1,161 @@
 from utils.config_manager import ConfigManager
 import pandas as pd
-import matplotlib.pyplot as plt
+import hashlib
+import json
 import os
 import numpy as np
 from scipy.signal import find_peaks
+from logger.spans import span
+from utils.metrics import metrics
+from utils import file_cache
+from utils.lod_pyramid import get_pyramid, render
+from utils.sync_offset import load_offset
 
 config = ConfigManager()
 
+# Bumped when the layout of the binary GCSV cache changes
+BINARY_VERSION = 1
+
+def _binary_dir():
+    return config.get("cache.gcsv.path", os.path.expanduser("~/cache/gcsv"))
+
+def _binary_file(path):
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(_binary_dir(), digest[:2], f"{digest}.npz")
+
+def load_binary(path):
+    """
+    Raw columns, (tscale, gscale, ascale) and video name of a GCSV from the
+    binary cache, or None if it was never stored or the file changed since.
+    Loading it is an order of magnitude faster than parsing the text.
+    """
+    try:
+        st = os.stat(path)
+        cache_file = _binary_file(path)
+        with np.load(cache_file) as f:
+            meta = json.loads(str(f["meta"]))
+            if meta["version"] != BINARY_VERSION or meta["identity"] != [st.st_size, st.st_mtime_ns]:
+                return None
+            data = pd.DataFrame({c: f[f"col_{i}"] for i, c in enumerate(meta["columns"])})
+        file_cache.touch(cache_file)
+        return data, tuple(meta["scales"]), meta["video_name"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+def store_binary(path, data, scales, video_name):
+    """
+    Stores the raw columns of a parsed GCSV for load_binary, evicting least
+    recently used files beyond cache.gcsv.max_bytes.
+    """
+    try:
+        st = os.stat(path)
+        cache_file = _binary_file(path)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        meta = {"version": BINARY_VERSION, "identity": [st.st_size, st.st_mtime_ns],
+                "columns": list(data.columns), "scales": list(scales), "video_name": video_name}
+        tmp = f"{cache_file}.tmp.npz"
+        np.savez(tmp, meta=np.array(json.dumps(meta)),
+                 **{f"col_{i}": data[c].to_numpy() for i, c in enumerate(data.columns)})
+        os.replace(tmp, cache_file)
+        file_cache.trim(_binary_dir(), config.get("cache.gcsv.max_bytes"))
+    except OSError as e:
+        print(f"⚠️  Could not cache the parsed GCSV {path}: {e}")
+
 class CSVManager:
     """
     Class to manage CSV files.
     """
-    def __init__(self, path):
+    def __init__(self, path, offset_s=None):
         """
         Initializes the CSVManager with a given path.
         Path of the GCSV file
+        offset_s: Seconds subtracted from the GCSV times so they match the video;
+                  by default the offset stored by the sync stage (utils.sync_offset)
         """
         self.path_file = path 
+        self.offset_s = load_offset(path) if offset_s is None else offset_s
         self.data = None
         self.video_name = None
         self.create_dataframe()
 
     def create_dataframe(self):
-        with open(self.path_file) as f:
-            lines = f.readlines()
-
-        tscale = gscale = ascale = None
-        header_lines = []
-        data_start_index = 0
-        for i, line in enumerate(lines):
-            if line.startswith("videofilename"):
-                self.video_name = line.strip().split(",")[1]
-            elif line.startswith("tscale"):
-                tscale = float(line.split(",")[1])
-            elif line.startswith("gscale"):
-                gscale = float(line.split(",")[1])
-            elif line.startswith("ascale"):
-                ascale = float(line.split(",")[1])
-            elif line.startswith("t,rx,ry,rz,ax,ay,az"):
-                data_start_index = i
-                break
-            header_lines.append(line.strip())
-
-        self.data = pd.read_csv(self.path_file, skiprows=data_start_index)
-
-        self.data["time_s"] = self.data["t"] * tscale
-        self.data["rx_deg"] = self.data["rx"] * gscale
-        self.data["ry_deg"] = self.data["ry"] * gscale
-        self.data["rz_deg"] = self.data["rz"] * gscale
-        self.data["ax_g"] = self.data["ax"] * ascale
-        self.data["ay_g"] = self.data["ay"] * ascale
-        self.data["az_g"] = self.data["az"] * ascale
-
-    def plot_csv(self):
+        with span("gcsv.parse", file=self.path_file):
+            cached = load_binary(self.path_file)
+            metrics.cache_lookup("gcsv", cached is not None)
+            if cached is not None:
+                self.data, scales, self.video_name = cached
+                tscale, gscale, ascale = scales
+            else:
+                with open(self.path_file) as f:
+                    lines = f.readlines()
+
+                tscale = gscale = ascale = None
+                header_lines = []
+                data_start_index = 0
+                for i, line in enumerate(lines):
+                    if line.startswith("videofilename"):
+                        self.video_name = line.strip().split(",")[1]
+                    elif line.startswith("tscale"):
+                        tscale = float(line.split(",")[1])
+                    elif line.startswith("gscale"):
+                        gscale = float(line.split(",")[1])
+                    elif line.startswith("ascale"):
+                        ascale = float(line.split(",")[1])
+                    elif line.startswith("t,rx,ry,rz,ax,ay,az"):
+                        data_start_index = i
+                        break
+                    header_lines.append(line.strip())
+
+                self.data = pd.read_csv(self.path_file, skiprows=data_start_index)
+                store_binary(self.path_file, self.data, (tscale, gscale, ascale), self.video_name)
+
+            self.data["time_s"] = self.data["t"] * tscale - self.offset_s
+            # gscale gives rad/s; every consumer works in deg/s
+            self.data["rx_deg"] = np.rad2deg(self.data["rx"] * gscale)
+            self.data["ry_deg"] = np.rad2deg(self.data["ry"] * gscale)
+            self.data["rz_deg"] = np.rad2deg(self.data["rz"] * gscale)
+            self.data["ax_g"] = self.data["ax"] * ascale
+            self.data["ay_g"] = self.data["ay"] * ascale
+            self.data["az_g"] = self.data["az"] * ascale
+
+    def plot_csv(self, output=None, t0=None, t1=None, width=1200):
         """
         Plot gyro and accelerometer data.
+
+        Plots are drawn from the cached min/max pyramid (utils.lod_pyramid)
+        at the level matching width, so hour-long logs plot as fast as
+        short ones.
+
+        :param output: None shows the plots; a .png/.svg path renders them
+                       headless as <name>_gyro.<ext> and <name>_accel.<ext>
+        :param t0: Start of the time range (s), default the whole log
+        :param t1: End of the time range (s)
+        :return: Paths written, when output is given
         """
-        data = self.data
+        pyramid = get_pyramid(self.path_file, manager=self)
+        stem, ext = os.path.splitext(output) if output else (None, None)
+        written = []
 
         # Plot gyroscope
-        plt.figure(figsize=(12, 6))
-        plt.plot(data["time_s"], data["rx_deg"], label="rx (deg)")
-        plt.plot(data["time_s"], data["ry_deg"], label="ry (deg)")
-        plt.plot(data["time_s"], data["rz_deg"], label="rz (deg)")
-        plt.title("Rotation (gyroscope)")
-        plt.xlabel("Time (s)")
-        plt.ylabel("Rotation (degrees)")
-        plt.legend()
-        plt.grid()
-        plt.tight_layout()
-        plt.show()
+        path = render(pyramid, ["rx_deg", "ry_deg", "rz_deg"], f"{stem}_gyro{ext}" if output else None,
+                      t0, t1, width=width, title="Rotation (gyroscope)", ylabel="Rotation (degrees)",
+                      labels=["rx (deg)", "ry (deg)", "rz (deg)"])
+        written.append(path)
 
         # Plot accelerometer
-        plt.figure(figsize=(12, 6))
-        plt.plot(data["time_s"], data["ax_g"], label="ax (g)")
-        plt.plot(data["time_s"], data["ay_g"], label="ay (g)")
-        plt.plot(data["time_s"], data["az_g"], label="az (g)")
-        plt.title("Acceleration (accelerometer)")
-        plt.xlabel("Time (s)")
-        plt.ylabel("Acceleration (g)")
-        plt.legend()
-        plt.grid()
-        plt.tight_layout()
-        plt.show()
-
-    def detect_peaks(self, kind='acceleration', top_n=3, plot=True):
+        path = render(pyramid, ["ax_g", "ay_g", "az_g"], f"{stem}_accel{ext}" if output else None,
+                      t0, t1, width=width, title="Acceleration (accelerometer)", ylabel="Acceleration (g)",
+                      labels=["ax (g)", "ay (g)", "az (g)"])
+        written.append(path)
+        return written if output else None
+
+    def event_magnitude(self, kind='acceleration'):
         """
-        Detect the top peaks distributed across video segments.
+        Signal the peaks of a kind are detected on.
 
         :param kind: 'acceleration' or 'rotation'
-        :param top_n: Final number of top peaks to return (after segment selection)
-        :param plot: Whether to show a plot
-        :return: List of (time, value) of the top peaks
+        :return: (magnitude series, plot label, detection threshold)
         """
-        if self.data is None:
-            print("No data loaded.")
-            return []
-
-        # Select magnitude based on kind
         if kind == 'acceleration':
             magnitude = -((self.data["ax_g"] + self.data["ay_g"] + self.data["az_g"])/3.0)  # invert for braking
             ylabel = "Braking Force (-a in g)"
@@ -112,47 +170,58 @@ class CSVManager:
             threshold = np.percentile(magnitude, 95)
         else:
             raise ValueError("Kind must be 'acceleration' or 'rotation'.")
+        return magnitude, ylabel, threshold
+
+    def detect_peaks(self, kind='acceleration', top_n=3, plot=True, plot_path=None):
+        """
+        Detect the top peaks distributed across video segments.
+
+        :param kind: 'acceleration' or 'rotation'
+        :param top_n: Final number of top peaks to return (after segment selection)
+        :param plot: Whether to show a plot
+        :param plot_path: Render the plot headless to this .png/.svg file instead
+        :return: List of (time, value) of the top peaks
+        """
+        if self.data is None:
+            print("No data loaded.")
+            return []
 
-        # Detect peaks
-        indices, properties = find_peaks(magnitude, height=threshold)
-        peak_times = self.data["time_s"].iloc[indices].values
-        peak_values = properties["peak_heights"]
-        all_peaks = list(zip(peak_times, peak_values))
-
-        # Segment the time axis into 10 parts
-        total_time = self.data["time_s"].iloc[-1]
-        segment_duration = total_time / 10
-        segment_best_peaks = []
-
-        for i in range(10):
-            start = i * segment_duration
-            end = (i + 1) * segment_duration
-            segment_peaks = [
-                (t, v) for t, v in all_peaks if start <= t < end
-            ]
-            if segment_peaks:
-                # Select the max peak in the segment
-                best = max(segment_peaks, key=lambda x: x[1])
-                segment_best_peaks.append(best)
-
-        # From segment-best peaks, select the top N globally
-        segment_best_peaks.sort(key=lambda x: x[1], reverse=True)
-        selected_peaks = segment_best_peaks[:top_n]
+        with span("peaks", file=self.path_file):
+            magnitude, ylabel, threshold = self.event_magnitude(kind)
+
+            # Detect peaks
+            indices, properties = find_peaks(magnitude, height=threshold)
+            peak_times = self.data["time_s"].iloc[indices].values
+            peak_values = properties["peak_heights"]
+            all_peaks = list(zip(peak_times, peak_values))
+
+            # Segment the time axis into 10 parts
+            total_time = self.data["time_s"].iloc[-1]
+            segment_duration = total_time / 10
+            segment_best_peaks = []
+
+            for i in range(10):
+                start = i * segment_duration
+                end = (i + 1) * segment_duration
+                segment_peaks = [
+                    (t, v) for t, v in all_peaks if start <= t < end
+                ]
+                if segment_peaks:
+                    # Select the max peak in the segment
+                    best = max(segment_peaks, key=lambda x: x[1])
+                    segment_best_peaks.append(best)
+
+            # From segment-best peaks, select the top N globally
+            segment_best_peaks.sort(key=lambda x: x[1], reverse=True)
+            selected_peaks = segment_best_peaks[:top_n]
 
         # Plot if needed
-        if plot:
-            plt.figure(figsize=(12, 6))
-            plt.plot(self.data["time_s"], magnitude, label="Magnitude")
-            times = [p[0] for p in selected_peaks]
-            vals = [p[1] for p in selected_peaks]
-            plt.plot(times, vals, "rx", label=f"Top {len(selected_peaks)} Peaks")
-            plt.title(f"Top {len(selected_peaks)} {kind.capitalize()} Peaks (Segmented)")
-            plt.xlabel("Time (s)")
-            plt.ylabel(ylabel)
-            plt.legend()
-            plt.grid()
-            plt.tight_layout()
-            plt.show()
+        if plot or plot_path:
+            channel = "braking" if kind == 'acceleration' else "rotation"
+            render(get_pyramid(self.path_file, manager=self), [channel], plot_path,
+                   title=f"Top {len(selected_peaks)} {kind.capitalize()} Peaks (Segmented)",
+                   ylabel=ylabel, labels=["Magnitude"],
+                   markers=([p[0] for p in selected_peaks], [p[1] for p in selected_peaks]))
 
         return selected_peaks
 
@@ -0,0 +1,313 @@
+"""Cached media probing: fps, duration, streams and keyframes, remembered across runs"""
+import argparse
+import bisect
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from utils.config_manager import ConfigManager
+from utils.metrics import metrics
+
+config = ConfigManager()
+
+
+def _ffmpeg_binary():
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+
+def _ffprobe_binary():
+    """ffprobe from the PATH, or next to the ffmpeg moviepy uses; None if absent."""
+    exe = shutil.which("ffprobe")
+    if exe:
+        return exe
+    candidate = os.path.join(os.path.dirname(_ffmpeg_binary()), "ffprobe")
+    return candidate if os.path.isfile(candidate) else None
+
+
+def _rate(value):
+    """'30000/1001' -> 29.97; None for missing or 0/0 rates."""
+    try:
+        num, _, den = str(value).partition("/")
+        num, den = float(num), float(den or 1)
+        return num / den if num > 0 and den > 0 else None
+    except ValueError:
+        return None
+
+
+def _probe_ffprobe(path, ffprobe):
+    result = subprocess.run(
+        [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+        capture_output=True, text=True, check=True
+    )
+    data = json.loads(result.stdout)
+    streams = [
+        {
+            "index": s.get("index"),
+            "type": s.get("codec_type"),
+            "codec": s.get("codec_name"),
+            "width": s.get("width"),
+            "height": s.get("height"),
+            "fps": _rate(s.get("avg_frame_rate")) or _rate(s.get("r_frame_rate")),
+            "frames": int(s["nb_frames"]) if str(s.get("nb_frames", "")).isdigit() else None,
+            "sample_rate": int(s["sample_rate"]) if s.get("sample_rate") else None,
+            "channels": s.get("channels"),
+            "duration": float(s["duration"]) if s.get("duration") else None,
+        }
+        for s in data.get("streams", [])
+    ]
+    duration = data.get("format", {}).get("duration")
+    return streams, float(duration) if duration else None
+
+
+def _probe_ffmpeg(path):
+    """Fallback when ffprobe is not installed: the stream summary ffmpeg -i prints, as moviepy parses it."""
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+    infos = ffmpeg_parse_infos(path)
+    streams = []
+    if infos.get("video_found"):
+        width, height = infos.get("video_size") or (None, None)
+        streams.append({
+            "index": 0, "type": "video", "codec": None, "width": width, "height": height,
+            "fps": infos.get("video_fps"), "frames": infos.get("video_nframes"),
+            "sample_rate": None, "channels": None, "duration": infos.get("video_duration"),
+        })
+    if infos.get("audio_found"):
+        streams.append({
+            "index": len(streams), "type": "audio", "codec": None, "width": None, "height": None,
+            "fps": None, "frames": None, "sample_rate": infos.get("audio_fps"), "channels": None,
+            "duration": infos.get("duration"),
+        })
+    return streams, infos.get("duration")
+
+
+def probe_file(path):
+    """
+    Runs the prober on one file, without caching.
+
+    :return: Dict with fps, frame_count, duration, width, height, has_audio
+             and the list of streams
+    """
+    ffprobe = _ffprobe_binary()
+    streams, duration = _probe_ffprobe(path, ffprobe) if ffprobe else _probe_ffmpeg(path)
+
+    video = next((s for s in streams if s["type"] == "video"), None)
+    audio = next((s for s in streams if s["type"] == "audio"), None)
+    fps = video["fps"] if video else None
+    if duration is None and video:
+        duration = video["duration"]
+    frame_count = video["frames"] if video else None
+    if not frame_count and fps and duration:
+        frame_count = int(round(fps * duration))
+
+    return {
+        "fps": fps,
+        "frame_count": frame_count,
+        "duration": duration,
+        "width": video["width"] if video else None,
+        "height": video["height"] if video else None,
+        "video_codec": video["codec"] if video else None,
+        "has_audio": audio is not None,
+        "audio_sample_rate": audio["sample_rate"] if audio else None,
+        "streams": streams,
+    }
+
+
+_SHOWINFO = re.compile(r"pts_time:\s*([0-9.]+)")
+
+def scan_keyframes(path):
+    """Timestamps (s) of the video keyframes, in order."""
+    ffprobe = _ffprobe_binary()
+    if ffprobe:
+        # Packet flags come from the container; nothing is decoded
+        result = subprocess.run(
+            [ffprobe, "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path],
+            capture_output=True, text=True, check=True
+        )
+        times = []
+        for line in result.stdout.splitlines():
+            pts, _, flags = line.partition(",")
+            if "K" in flags and pts not in ("", "N/A"):
+                times.append(float(pts))
+        return sorted(times)
+
+    # Without ffprobe, decode only the keyframes and read their times from showinfo
+    result = subprocess.run(
+        [_ffmpeg_binary(), "-hide_banner", "-nostats", "-skip_frame", "nokey", "-i", path,
+         "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"],
+        capture_output=True, text=True
+    )
+    return sorted(float(m) for m in _SHOWINFO.findall(result.stderr))
+
+
+class MediaProbe:
+    """
+    Probe results stored in SQLite, keyed by path and invalidated when the
+    file's size or mtime changes. Keyframe tables are scanned on first
+    request only, since they cost a pass over the container.
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._memo = {}
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        self._initialize_db()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, hit):
+        # probe_many calls this from several threads
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.cache_lookup("probe", hit)
+
+    def _initialize_db(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS probes (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    info TEXT NOT NULL,
+                    keyframes TEXT,
+                    probed REAL NOT NULL
+                )
+            ''')
+
+    def probe(self, path, keyframes=False):
+        """
+        Properties of a media file, from the cache when the file is unchanged.
+
+        :param keyframes: Also return (and cache) the keyframe timestamps
+        :return: Dict as returned by probe_file, plus 'keyframes' when asked
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        identity = (st.st_size, st.st_mtime_ns)
+
+        with self._lock:
+            memo = self._memo.get(path)
+        if memo and memo[0] == identity and (not keyframes or "keyframes" in memo[1]):
+            self._count(hit=True)
+            return dict(memo[1])
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT size, mtime_ns, info, keyframes FROM probes WHERE path = ?", (path,)
+            ).fetchone()
+
+        info = None
+        if row and (row[0], row[1]) == identity:
+            info = json.loads(row[2])
+            if row[3] is not None:
+                info["keyframes"] = json.loads(row[3])
+            if keyframes and "keyframes" not in info:
+                info["keyframes"] = scan_keyframes(path)
+                with self._connect() as conn:
+                    conn.execute("UPDATE probes SET keyframes = ? WHERE path = ?",
+                                 (json.dumps(info["keyframes"]), path))
+                self._count(hit=False)
+            else:
+                self._count(hit=True)
+        else:
+            self._count(hit=False)
+            info = probe_file(path)
+            kf = scan_keyframes(path) if keyframes else None
+            with self._connect() as conn:
+                conn.execute('''
+                    INSERT INTO probes (path, size, mtime_ns, info, keyframes, probed)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET
+                        size = excluded.size, mtime_ns = excluded.mtime_ns, info = excluded.info,
+                        keyframes = excluded.keyframes, probed = excluded.probed
+                ''', (path, identity[0], identity[1], json.dumps(info),
+                      json.dumps(kf) if kf is not None else None, time.time()))
+            if kf is not None:
+                info["keyframes"] = kf
+
+        with self._lock:
+            self._memo[path] = (identity, info)
+        return dict(info)
+
+    def probe_many(self, paths, workers=4, keyframes=False):
+        """
+        Probes several files in parallel (ffprobe runs as a subprocess).
+        Files that cannot be probed map to None.
+        """
+        def safe_probe(path):
+            try:
+                return self.probe(path, keyframes=keyframes)
+            except Exception as e:
+                print(f"⚠️  Could not probe {path}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(paths, pool.map(safe_probe, paths)))
+
+    def keyframes(self, path):
+        return self.probe(path, keyframes=True)["keyframes"]
+
+    def keyframe_before(self, path, t):
+        """Last keyframe at or before t (s): the cheapest place to start a cut."""
+        times = self.keyframes(path)
+        i = bisect.bisect_right(times, t)
+        return times[i - 1] if i else 0.0
+
+    def forget(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            self._memo.pop(path, None)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM probes WHERE path = ?", (path,))
+
+
+_probe = None
+_probe_lock = threading.Lock()
+
+def get_media_probe():
+    """Returns the shared probe index at cache.probe.path."""
+    global _probe
+    with _probe_lock:
+        if _probe is None:
+            db_file = config.get("cache.probe.path", os.path.expanduser("~/cache/probe.db"))
+            _probe = MediaProbe(db_file)
+    return _probe
+
+def probe(path, keyframes=False):
+    """Shortcut for get_media_probe().probe(path)."""
+    return get_media_probe().probe(path, keyframes=keyframes)
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Probe media files through the shared cache.")
+    parser.add_argument("paths", nargs="+", help="Video files to probe.")
+    parser.add_argument("--keyframes", action="store_true", help="Include keyframe timestamps.")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = get_media_probe().probe_many(args.paths, workers=args.workers, keyframes=args.keyframes)
+    print(json.dumps(results, indent=2))
+    print(f"Probed {len(results)} files in {time.perf_counter() - start:.2f}s", file=sys.stderr)
@@ -0,0 +1,141 @@
+"""Pool of open moviepy readers with scoped acquisition and guaranteed cleanup"""
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from moviepy.editor import VideoFileClip
+
+
+def _identity(path):
+    """Size and mtime of a file, so a replaced file never reuses a stale reader."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class _Entry:
+    def __init__(self, path, identity, clip):
+        self.path = path
+        self.identity = identity
+        self.clip = clip
+        self.in_use = False
+        self.last_used = time.monotonic()
+
+
+class ReaderPool:
+    """
+    Keeps VideoFileClip readers (an ffmpeg subprocess and its pipes each)
+    open between uses of the same file, so several windows of one recording
+    share a single reader instead of spawning one per clip.
+
+    A reader is lent to one caller at a time; concurrent callers of the same
+    file get separate readers. Idle readers beyond max_idle, or unused for
+    idle_timeout seconds, are closed. Subclips taken from a lent clip share
+    its reader: use them inside the acquire() block and never close them
+    yourself.
+
+    :param max_idle: Number of idle readers kept open
+    :param idle_timeout: Seconds after which an idle reader is closed
+    """
+    def __init__(self, max_idle=2, idle_timeout=300):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._entries = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    @contextmanager
+    def acquire(self, path, audio=True):
+        """
+        Lends an open VideoFileClip of path for the duration of the block.
+
+        :param audio: Whether the audio track is needed
+        """
+        entry = self._checkout(path, audio)
+        try:
+            yield entry.clip
+        finally:
+            self._release(entry)
+
+    def _checkout(self, path, audio):
+        path = os.path.abspath(path)
+        identity = _identity(path)
+        stale = []
+        with self._lock:
+            entry = None
+            for candidate in self._entries:
+                if candidate.path != path or candidate.in_use:
+                    continue
+                if candidate.identity != identity or (audio and candidate.clip.audio is None):
+                    stale.append(candidate)
+                elif entry is None:
+                    entry = candidate
+            for candidate in stale:
+                self._entries.remove(candidate)
+            if entry is not None:
+                entry.in_use = True
+                self.reused += 1
+        self._close_entries(stale)
+
+        if entry is None:
+            entry = _Entry(path, identity, VideoFileClip(path, audio=audio))
+            entry.in_use = True
+            with self._lock:
+                self._entries.append(entry)
+                self.opened += 1
+        return entry
+
+    def _release(self, entry):
+        expired = []
+        with self._lock:
+            entry.in_use = False
+            entry.last_used = time.monotonic()
+            idle = sorted((e for e in self._entries if not e.in_use), key=lambda e: e.last_used)
+            cutoff = time.monotonic() - self.idle_timeout
+            expired = [e for e in idle if e.last_used < cutoff]
+            remaining = [e for e in idle if e not in expired]
+            expired += remaining[:max(0, len(remaining) - self.max_idle)]
+            for e in expired:
+                self._entries.remove(e)
+        self._close_entries(expired)
+
+    def discard(self, path):
+        """Closes the idle readers of path, e.g. before the file is replaced or deleted."""
+        path = os.path.abspath(path)
+        with self._lock:
+            victims = [e for e in self._entries if e.path == path and not e.in_use]
+            for e in victims:
+                self._entries.remove(e)
+        self._close_entries(victims)
+
+    def close_all(self):
+        """Closes every idle reader. Readers currently lent out are left alone."""
+        with self._lock:
+            victims = [e for e in self._entries if not e.in_use]
+            for e in victims:
+                self._entries.remove(e)
+        self._close_entries(victims)
+
+    def open_count(self):
+        with self._lock:
+            return len(self._entries)
+
+    @staticmethod
+    def _close_entries(entries):
+        for e in entries:
+            try:
+                e.clip.close()
+            except Exception as ex:
+                print(f"⚠️  Could not close reader for {e.path}: {ex}")
+
+
+readers = ReaderPool()
+
+@contextmanager
+def open_video(path, audio=True):
+    """Scoped access to a video through the shared reader pool."""
+    with readers.acquire(path, audio=audio) as clip:
+        yield clip
+
+atexit.register(readers.close_all)
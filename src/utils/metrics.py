@@ -0,0 +1,160 @@
+"""In-process counters and gauges of the running pipeline, served by the status server"""
+import logging
+import threading
+import time
+from collections import deque
+
+# Throughput gauges cover the spans that ended this many seconds ago at most
+RATE_WINDOW_S = 300
+# Errors kept for the status page
+ERROR_HISTORY = 50
+
+
+class Metrics:
+    """
+    What the daemon is doing, reported by the code doing it: the phase
+    main.py is in, the tasks running and waiting per stage, span totals
+    (bytes and frames), cache lookups and recent errors. Every method is
+    cheap and thread-safe; snapshot() is what the status server reads.
+    Worker processes have their own (unread) registry, so their work only
+    shows up through the tasks of this process waiting for it.
+    """
+    def __init__(self, rate_window_s=RATE_WINDOW_S, error_history=ERROR_HISTORY):
+        self.rate_window_s = rate_window_s
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._phase = ("starting", self.started)
+        self._running = {}  # task name -> (stage, started)
+        self._pending = {}  # stage -> tasks waiting in the current pipeline run
+        self._tasks = {}  # (stage, status) -> count
+        self._spans = {}  # stage -> totals
+        self._recent = deque()  # (ended, stage, seconds, bytes, frames)
+        self._caches = {}  # name -> [hits, misses]
+        self._errors = deque(maxlen=error_history)
+        self._errors_total = 0
+
+    # --- Reporting side ---
+
+    def set_phase(self, phase):
+        """What main.py is doing, e.g. 'waiting for camera' or 'stabilize'."""
+        with self._lock:
+            self._phase = (phase, time.time())
+
+    def task_started(self, name, stage):
+        with self._lock:
+            self._running[name] = (stage, time.time())
+
+    def task_finished(self, name, stage, status):
+        with self._lock:
+            self._running.pop(name, None)
+            self._tasks[(stage, status)] = self._tasks.get((stage, status), 0) + 1
+
+    def set_pending(self, counts):
+        """Tasks not yet started, per stage, in the pipeline run in progress."""
+        with self._lock:
+            self._pending = dict(counts)
+
+    def observe_span(self, stage, duration, bytes=None, frames=None, ok=True):
+        now = time.time()
+        with self._lock:
+            totals = self._spans.setdefault(
+                stage, {"count": 0, "failed": 0, "seconds": 0.0, "bytes": 0, "frames": 0})
+            totals["count"] += 1
+            totals["failed"] += 0 if ok else 1
+            totals["seconds"] += duration
+            totals["bytes"] += bytes or 0
+            totals["frames"] += frames or 0
+            self._recent.append((now, stage, duration, bytes or 0, frames or 0))
+            self._trim(now)
+
+    def cache_lookup(self, name, hit):
+        with self._lock:
+            counts = self._caches.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def error(self, source, message):
+        with self._lock:
+            self._errors.append({"time": time.time(), "source": source, "message": str(message)})
+            self._errors_total += 1
+
+    # --- Reading side ---
+
+    def _trim(self, now):
+        while self._recent and self._recent[0][0] < now - self.rate_window_s:
+            self._recent.popleft()
+
+    def throughput(self):
+        """
+        Per stage MB/s and frames/s over the spans of the last rate_window_s
+        seconds, while working: total bytes (frames) over total span time.
+        A stage that stalls or stops drops out instead of keeping its average.
+        """
+        with self._lock:
+            self._trim(time.time())
+            recent = list(self._recent)
+        sums = {}
+        for _, stage, seconds, nbytes, frames in recent:
+            s = sums.setdefault(stage, [0.0, 0, 0])
+            s[0] += seconds
+            s[1] += nbytes
+            s[2] += frames
+        return {
+            stage: {
+                "mb_per_s": nbytes / 1024**2 / seconds if seconds > 0 and nbytes else None,
+                "frames_per_s": frames / seconds if seconds > 0 and frames else None,
+            }
+            for stage, (seconds, nbytes, frames) in sums.items()
+        }
+
+    def snapshot(self):
+        """Everything reported so far, as plain JSON-serializable data."""
+        now = time.time()
+        throughput = self.throughput()
+        with self._lock:
+            phase, since = self._phase
+            running = [
+                {"task": name, "stage": stage, "running_s": round(now - started, 1)}
+                for name, (stage, started) in sorted(self._running.items(), key=lambda kv: kv[1][1])
+            ]
+            stages = sorted({stage for stage, _ in self._running.values()})
+            tasks = {}
+            for (stage, status), count in self._tasks.items():
+                tasks.setdefault(stage, {})[status] = count
+            spans = {stage: dict(totals, **throughput.get(stage, {"mb_per_s": None, "frames_per_s": None}))
+                     for stage, totals in self._spans.items()}
+            caches = {
+                name: {"hits": hits, "misses": misses,
+                       "hit_rate": hits / (hits + misses) if hits + misses else None}
+                for name, (hits, misses) in self._caches.items()
+            }
+            return {
+                "time": now,
+                "uptime_s": round(now - self.started, 1),
+                "phase": phase,
+                "phase_s": round(now - since, 1),
+                "stages": stages,
+                "running": running,
+                "pending": dict(self._pending),
+                "tasks": tasks,
+                "spans": spans,
+                "caches": caches,
+                "errors": list(self._errors),
+                "errors_total": self._errors_total,
+            }
+
+
+class ErrorLogHandler(logging.Handler):
+    """Copies ERROR records of every Logger into the recent errors."""
+    def __init__(self, registry, level=logging.ERROR):
+        super().__init__(level)
+        self.registry = registry
+
+    def emit(self, record):
+        try:
+            self.registry.error(record.name, record.getMessage())
+        except Exception:
+            self.handleError(record)
+
+
+# Shared by the whole process
+metrics = Metrics()
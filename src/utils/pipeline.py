@@ -0,0 +1,294 @@
+"""Incremental task graph used to run the processing stages make-style"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from utils.metrics import metrics
+
+
+class SkipTask(Exception):
+    """Raised by an action when there is nothing to produce this time."""
+
+
+class Task:
+    """
+    A unit of work with declared file inputs and outputs.
+
+    :param name: Unique name of the task inside a pipeline
+    :param stage: Stage the task belongs to (ingest, audio, peaks, ...)
+    :param action: Callable run without arguments; raising marks the task as failed
+    :param inputs: Files whose content decides the result
+    :param outputs: Files the action produces
+    :param params: JSON-serializable parameters that also decide the result
+    :param deps: Names of tasks that must finish first
+    """
+    def __init__(self, name, stage, action, inputs=(), outputs=(), params=None, deps=()):
+        self.name = name
+        self.stage = stage
+        self.action = action
+        self.inputs = [str(p) for p in inputs]
+        self.outputs = [str(p) for p in outputs]
+        self.params = params or {}
+        self.deps = list(deps)
+
+    def signature(self):
+        """Hash of the parameters and the size/mtime of every input."""
+        digest = hashlib.sha256()
+        digest.update(self.stage.encode())
+        digest.update(json.dumps(self.params, sort_keys=True, default=str).encode())
+        for path in self.inputs:
+            try:
+                st = os.stat(path)
+                digest.update(f"{path}:{st.st_size}:{st.st_mtime_ns}".encode())
+            except OSError:
+                digest.update(f"{path}:missing".encode())
+        return digest.hexdigest()
+
+    def __repr__(self):
+        return f"Task({self.name!r})"
+
+
+class TaskStore:
+    """Remembers, in SQLite, the signature each task had when it last succeeded."""
+    _lock = threading.Lock()
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        db_dir = os.path.dirname(os.path.abspath(db_file))
+        os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    name TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    outputs TEXT,
+                    duration REAL,
+                    updated REAL NOT NULL
+                )
+            ''')
+
+    @contextmanager
+    def _connect(self):
+        with TaskStore._lock:
+            conn = sqlite3.connect(self.db_file, timeout=5)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def get_signature(self, name):
+        with self._connect() as conn:
+            row = conn.execute("SELECT signature FROM tasks WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, task, signature, duration):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (name, stage, signature, outputs, duration, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (task.name, task.stage, signature, json.dumps(task.outputs), duration, time.time())
+            )
+
+    def durations(self, stage):
+        """(name, seconds) of the last successful run of every task of a stage that did run."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT name, duration FROM tasks WHERE stage = ? AND duration > 0", (stage,)
+            ).fetchall()
+
+    def forget(self, name):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tasks WHERE name = ?", (name,))
+
+
+class Pipeline:
+    """
+    A DAG of tasks. Only tasks whose inputs, parameters or outputs changed
+    since their last successful run are executed.
+
+    :param storage: Optional StorageManager; outputs it evicted or archived
+                    don't make a task stale, and every task run records a
+                    use of its files
+    """
+    def __init__(self, store, storage=None):
+        self.store = store
+        self.storage = storage
+        self.tasks = {}
+
+    def add(self, task):
+        if task.name in self.tasks:
+            raise ValueError(f"Duplicate task name: {task.name}")
+        self.tasks[task.name] = task
+        return task
+
+    def _topological_order(self):
+        for task in self.tasks.values():
+            for dep in task.deps:
+                if dep not in self.tasks:
+                    raise ValueError(f"Task {task.name} depends on unknown task {dep}")
+
+        order = []
+        visiting = set()
+        done = set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through task {name}")
+            visiting.add(name)
+            for dep in self.tasks[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(self.tasks[name])
+
+        for name in self.tasks:
+            visit(name)
+        return order
+
+    def is_stale(self, task):
+        if self.store.get_signature(task.name) != task.signature():
+            return True
+        return any(self._missing(p) for p in task.outputs)
+
+    def _missing(self, path):
+        if os.path.exists(path):
+            return False
+        return self.storage is None or not self.storage.is_retired(path)
+
+    def _select(self, stages):
+        return [t for t in self._topological_order() if stages is None or t.stage in stages]
+
+    def plan(self, stages=None):
+        """
+        Tasks that a run would execute, in order. A task is planned if it
+        is stale itself or if a task it depends on is planned.
+        """
+        planned = []
+        planned_names = set()
+        for task in self._select(stages):
+            if self.is_stale(task) or any(dep in planned_names for dep in task.deps):
+                planned.append(task)
+                planned_names.add(task.name)
+        return planned
+
+    def dry_run(self, stages=None):
+        """Prints what run() would execute and returns the planned tasks."""
+        planned = self.plan(stages)
+        if not planned:
+            print("Nothing to do, everything is up to date.")
+        for task in planned:
+            print(f"  would run [{task.stage}] {task.name}")
+        return planned
+
+    def _run_task(self, task):
+        # Checked here, not when planning: upstream tasks may just have
+        # rewritten this task's inputs.
+        if not self.is_stale(task):
+            self._touch(task)
+            return "up-to-date", 0.0
+        metrics.task_started(task.name, task.stage)
+        start = time.perf_counter()
+        task.action()
+        duration = time.perf_counter() - start
+        missing = [p for p in task.outputs if not os.path.exists(p)]
+        if missing:
+            raise RuntimeError(f"outputs not produced: {', '.join(missing)}")
+        self.store.record(task, task.signature(), duration)
+        self._touch(task)
+        return "ran", duration
+
+    def _touch(self, task):
+        if self.storage is not None:
+            self.storage.touch(task.inputs + task.outputs)
+
+    def run(self, stages=None, workers=1, dry_run=False):
+        """
+        Executes the selected stages on a worker pool.
+
+        :param stages: Iterable of stage names to run, or None for all of them
+        :param workers: Number of tasks run concurrently, either overall (int)
+                        or per stage (dict of stage -> int, with an optional
+                        'default' entry for stages not listed)
+        :param dry_run: Only print what would run
+        :return: Dict of task name -> (status, seconds). Status is one of
+                 'ran', 'up-to-date', 'skipped', 'failed' or 'blocked'
+        """
+        if dry_run:
+            return {task.name: ("planned", 0.0) for task in self.dry_run(stages)}
+
+        selected = self._select(stages)
+        selected_names = {t.name for t in selected}
+        results = {}
+        pending = list(selected)
+        running = {}
+
+        if isinstance(workers, dict):
+            default_limit = workers.get("default", 1)
+            limits = {t.stage: max(1, workers.get(t.stage, default_limit)) for t in selected}
+            pool_size = sum(limits.values())
+        else:
+            limits = {t.stage: max(1, workers) for t in selected}
+            pool_size = max(1, workers)
+        busy = {stage: 0 for stage in limits}
+
+        def ready(task):
+            for dep in task.deps:
+                if dep in selected_names:
+                    if dep not in results:
+                        return None
+                    if results[dep][0] not in ("ran", "up-to-date"):
+                        return False
+                elif self.is_stale(self.tasks[dep]):
+                    # Dependency outside of this run and not built yet
+                    return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=max(1, pool_size)) as pool:
+            while pending or running:
+                for task in list(pending):
+                    state = ready(task)
+                    if state is None:
+                        continue
+                    if state is False:
+                        pending.remove(task)
+                        results[task.name] = ("blocked", 0.0)
+                        metrics.task_finished(task.name, task.stage, "blocked")
+                        continue
+                    if busy[task.stage] >= limits[task.stage]:
+                        continue
+                    pending.remove(task)
+                    busy[task.stage] += 1
+                    running[pool.submit(self._run_task, task)] = task
+                metrics.set_pending(Counter(t.stage for t in pending))
+
+                if not running:
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    busy[task.stage] -= 1
+                    try:
+                        results[task.name] = future.result()
+                    except SkipTask as e:
+                        print(f"  Skipped {task.name}: {e}")
+                        results[task.name] = ("skipped", 0.0)
+                    except Exception as e:
+                        print(f"❌ Task {task.name} failed: {e}", file=sys.stderr)
+                        metrics.error(task.name, e)
+                        self.store.forget(task.name)
+                        results[task.name] = ("failed", 0.0)
+                    metrics.task_finished(task.name, task.stage, results[task.name][0])
+
+        metrics.set_pending({})
+        return results
@@ -0,0 +1,403 @@
+"""Render job queue shared by worker processes or machines through one SQLite file"""
+import argparse
+import json
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from utils.config_manager import ConfigManager
+from logger.logger_manager import Logger, configure_worker
+
+config = ConfigManager()
+logger = Logger(logger_name='RenderQueueLogger', log_to_file=True, log_to_sqlite=True)
+
+QUEUED, LEASED, DONE, FAILED = "queued", "leased", "done", "failed"
+
+
+class JobFailed(RuntimeError):
+    """Raised by wait() when a job ended in the failed state."""
+
+
+class JobStore:
+    """
+    Jobs in a SQLite file that every worker opens, locally or on shared
+    storage. Claims run in a BEGIN IMMEDIATE transaction, so two workers can
+    never lease the same job. A lease expires unless the worker heartbeats;
+    expired jobs are handed to the next worker until max_attempts is reached.
+
+    The rollback journal is used instead of WAL because WAL needs shared
+    memory and does not work on network filesystems. Lease times are wall
+    clock seconds, so machines sharing a queue should run NTP.
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    dedupe_key TEXT,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL DEFAULT 3,
+                    available_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key)")
+
+    @contextmanager
+    def _connect(self, immediate=False):
+        conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_job(row):
+        keys = ("id", "kind", "payload", "status", "attempts", "max_attempts",
+                "lease_owner", "lease_expires", "result", "error")
+        job = dict(zip(keys, row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    _COLUMNS = "id, kind, payload, status, attempts, max_attempts, lease_owner, lease_expires, result, error"
+
+    def submit(self, kind, payload, priority=0, max_attempts=3, dedupe_key=None):
+        """
+        Adds a job and returns its id. If a queued or leased job with the
+        same dedupe_key and payload exists, its id is returned instead; a
+        queued one with another payload (e.g. new settings) gets this payload.
+        """
+        now = time.time()
+        # Round-tripped, so tuples compare equal to the lists read back
+        wanted = json.loads(json.dumps(payload))
+        with self._connect(immediate=True) as conn:
+            if dedupe_key is not None:
+                rows = conn.execute(
+                    "SELECT id, payload, status FROM jobs WHERE dedupe_key = ? AND status IN (?, ?) ORDER BY id",
+                    (dedupe_key, QUEUED, LEASED)
+                ).fetchall()
+                for job_id, stored, _ in rows:
+                    if json.loads(stored) == wanted:
+                        return job_id
+                for job_id, _, status in rows:
+                    if status == QUEUED:
+                        conn.execute("UPDATE jobs SET payload = ?, updated = ? WHERE id = ?",
+                                     (json.dumps(payload), now, job_id))
+                        return job_id
+            cursor = conn.execute('''
+                INSERT INTO jobs (kind, payload, dedupe_key, status, priority, max_attempts,
+                                  available_at, created, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (kind, json.dumps(payload), dedupe_key, QUEUED, priority, max_attempts, now, now, now))
+            return cursor.lastrowid
+
+    def claim(self, worker_id, kinds=None, lease_s=120):
+        """Leases the next runnable job to worker_id; returns it, or None if there is none."""
+        now = time.time()
+        with self._connect(immediate=True) as conn:
+            # Leases that ran out on their last attempt end here
+            conn.execute('''
+                UPDATE jobs SET status = ?, error = 'lease expired', lease_owner = NULL, updated = ?
+                WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts
+            ''', (FAILED, now, LEASED, now))
+
+            sql = f'''
+                SELECT {self._COLUMNS} FROM jobs
+                WHERE ((status = ? AND available_at <= ?) OR (status = ? AND lease_expires < ?))
+            '''
+            params = [QUEUED, now, LEASED, now]
+            if kinds:
+                sql += f" AND kind IN ({', '.join('?' * len(kinds))})"
+                params += list(kinds)
+            sql += " ORDER BY priority DESC, id LIMIT 1"
+            row = conn.execute(sql, params).fetchone()
+            if row is None:
+                return None
+
+            job = self._row_to_job(row)
+            conn.execute('''
+                UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?,
+                                attempts = attempts + 1, updated = ?
+                WHERE id = ?
+            ''', (LEASED, worker_id, now + lease_s, now, job["id"]))
+            job.update(status=LEASED, lease_owner=worker_id, attempts=job["attempts"] + 1)
+            return job
+
+    def heartbeat(self, job_id, worker_id, lease_s=120):
+        """Extends a lease. Returns False if the worker no longer holds it."""
+        now = time.time()
+        with self._connect(immediate=True) as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET lease_expires = ?, updated = ?
+                WHERE id = ? AND status = ? AND lease_owner = ?
+            ''', (now + lease_s, now, job_id, LEASED, worker_id))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        """Stores the result. Returns False if the lease was lost meanwhile."""
+        now = time.time()
+        with self._connect(immediate=True) as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET status = ?, result = ?, error = NULL, lease_owner = NULL,
+                                lease_expires = NULL, updated = ?
+                WHERE id = ? AND status = ? AND lease_owner = ?
+            ''', (DONE, json.dumps(result, default=str), now, job_id, LEASED, worker_id))
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error, retry=True, backoff_s=30):
+        """
+        Records a failed attempt. The job is queued again after
+        backoff_s * attempts seconds while attempts remain.
+        """
+        now = time.time()
+        with self._connect(immediate=True) as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = ? AND lease_owner = ?",
+                (job_id, LEASED, worker_id)
+            ).fetchone()
+            if row is None:
+                return False
+            attempts, max_attempts = row
+            again = retry and attempts < max_attempts
+            conn.execute('''
+                UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_owner = NULL,
+                                lease_expires = NULL, updated = ?
+                WHERE id = ?
+            ''', (QUEUED if again else FAILED, error, now + backoff_s * attempts, now, job_id))
+            return True
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def wait(self, job_id, timeout=None, poll_s=2.0):
+        """
+        Blocks until the job is done and returns its result.
+        Raises JobFailed if it failed, TimeoutError after timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                raise KeyError(f"Unknown job {job_id}")
+            if job["status"] == DONE:
+                return job["result"]
+            if job["status"] == FAILED:
+                raise JobFailed(f"{job['kind']} job {job_id} failed: {job['error']}")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"{job['kind']} job {job_id} still {job['status']}")
+            time.sleep(poll_s)
+
+    def counts(self):
+        """Number of jobs per (kind, status)."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status").fetchall()
+        return {(kind, status): count for kind, status, count in rows}
+
+    def retry_failed(self, kind=None):
+        """Queues failed jobs again with a fresh attempt budget. Returns how many."""
+        now = time.time()
+        sql = "UPDATE jobs SET status = ?, attempts = 0, error = NULL, available_at = ?, updated = ? WHERE status = ?"
+        params = [QUEUED, now, now, FAILED]
+        if kind:
+            sql += " AND kind = ?"
+            params.append(kind)
+        with self._connect(immediate=True) as conn:
+            return conn.execute(sql, params).rowcount
+
+
+# --- Job handlers wrapping the existing entry points ---
+
+def _run_clips(payload):
+    from utils.edit_video import create_highlight_clips
+    clips = create_highlight_clips(
+        payload["video_path"],
+        [tuple(w) for w in payload["clips_duration"]],
+        payload["output_folder"],
+        join=payload.get("join", False),
+        encoder=payload.get("encoder"),
+        gains=payload.get("gains")
+    )
+    if payload["clips_duration"] and not clips:
+        raise RuntimeError("no clip could be exported")
+    return {"clips": clips}
+
+def _run_stabilize(payload):
+    from gyroflow.run_gyroflow import run_gyroflow
+    output = run_gyroflow(payload["video_path"], payload.get("settings_path"))
+    if output is None:
+        raise RuntimeError("gyroflow failed")
+    return {"output": str(output)}
+
+def _run_overlay(payload):
+    from gyroflow.interpolate_gcsv import interpolate_data_for_frames_from_video_path
+    from utils.edit_video import overlay_data_on_video
+    frame_data = interpolate_data_for_frames_from_video_path(payload["video_path"], payload["gcsv_path"])
+    if frame_data is None:
+        raise RuntimeError("could not interpolate gyro data")
+    return {"output": overlay_data_on_video(payload["video_path"], frame_data)}
+
+HANDLERS = {
+    "clips": _run_clips,
+    "stabilize": _run_stabilize,
+    "overlay": _run_overlay,
+}
+
+
+class Worker:
+    """
+    Pulls jobs from a JobStore and runs them with HANDLERS. While a job
+    runs, a background thread renews its lease every lease_s / 3 seconds.
+    SIGTERM/SIGINT finish the current job, then stop.
+    """
+    def __init__(self, store, worker_id=None, kinds=None, lease_s=120):
+        self.store = store
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.kinds = list(kinds) if kinds else list(HANDLERS)
+        self.lease_s = lease_s
+        self._stop = threading.Event()
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def _heartbeat(self, job_id, done):
+        while not done.wait(self.lease_s / 3):
+            if not self.store.heartbeat(job_id, self.worker_id, self.lease_s):
+                logger.warning(f"[{self.worker_id}] lost the lease of job {job_id}")
+                return
+
+    def run_one(self):
+        """Claims and runs one job. Returns False when the queue had nothing runnable."""
+        job = self.store.claim(self.worker_id, self.kinds, self.lease_s)
+        if job is None:
+            return False
+
+        logger.info(f"[{self.worker_id}] {job['kind']} job {job['id']} (attempt {job['attempts']})",
+                    extra={'event_type': 'JOB_START', 'data': {'job': job['id'], 'kind': job['kind']}})
+        done = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job["id"], done), daemon=True)
+        beat.start()
+        start = time.perf_counter()
+        try:
+            result = HANDLERS[job["kind"]](job["payload"])
+        except Exception as e:
+            done.set()
+            error = f"{type(e).__name__}: {e}"
+            self.store.fail(job["id"], self.worker_id, error)
+            logger.error(f"[{self.worker_id}] job {job['id']} failed: {error}\n{traceback.format_exc()}",
+                         extra={'event_type': 'JOB_FAILED', 'data': {'job': job['id'], 'kind': job['kind']}})
+        else:
+            done.set()
+            duration = time.perf_counter() - start
+            if self.store.complete(job["id"], self.worker_id, result):
+                logger.info(f"[{self.worker_id}] job {job['id']} done in {duration:.1f}s",
+                            extra={'event_type': 'JOB_DONE',
+                                   'data': {'job': job['id'], 'kind': job['kind'], 'duration_s': duration}})
+            else:
+                logger.warning(f"[{self.worker_id}] job {job['id']} finished after losing its lease; result dropped")
+        finally:
+            beat.join()
+        return True
+
+    def run(self, once=False, idle_sleep=2.0):
+        """Processes jobs until stopped; with once, until the queue is empty."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info(f"[{self.worker_id}] worker started for {', '.join(self.kinds)}")
+        while not self._stop.is_set():
+            if not self.run_one():
+                if once:
+                    break
+                self._stop.wait(idle_sleep)
+        logger.info(f"[{self.worker_id}] worker stopped")
+
+
+def get_job_store():
+    """The job store at render_queue.path, or None when the queue is disabled."""
+    if not config.get("render_queue.enabled", False):
+        return None
+    return JobStore(config.get("render_queue.path", os.path.expanduser("~/cache/render_queue.db")))
+
+def run_remote(kind, payload, dedupe_key=None):
+    """
+    Submits a job to the configured queue and waits for its result.
+    Used by the pipeline stages instead of running the work in-process.
+    """
+    store = get_job_store()
+    job_id = store.submit(kind, payload, max_attempts=int(config.get("render_queue.max_attempts", 3)),
+                          dedupe_key=dedupe_key)
+    print(f"  📨 Queued {kind} job {job_id} for {os.path.basename(payload['video_path'])}")
+    return store.wait(job_id, timeout=config.get("render_queue.wait_timeout_s"))
+
+
+def _worker_process(log_queue, db_file, kinds, lease_s, once, index):
+    configure_worker(log_queue)
+    Worker(JobStore(db_file), worker_id=f"{socket.gethostname()}:{os.getpid()}:{index}",
+           kinds=kinds, lease_s=lease_s).run(once=once)
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    import multiprocessing
+    from logger.log_listener import LogListener
+
+    parser = argparse.ArgumentParser(description="Render queue worker and status tool.")
+    parser.add_argument("command", choices=["worker", "status", "retry-failed"])
+    parser.add_argument("--db", default=config.get("render_queue.path", os.path.expanduser("~/cache/render_queue.db")),
+                        help="Job store shared by all workers.")
+    parser.add_argument("--kinds", default=",".join(HANDLERS), help="Job kinds this worker accepts.")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start on this machine.")
+    parser.add_argument("--lease", type=float, default=float(config.get("render_queue.lease_s", 120)))
+    parser.add_argument("--once", action="store_true", help="Exit when no job is runnable.")
+    args = parser.parse_args()
+
+    store = JobStore(args.db)
+    if args.command == "status":
+        for (kind, status), count in sorted(store.counts().items()):
+            print(f"{kind:<10} {status:<8} {count:>6}")
+    elif args.command == "retry-failed":
+        print(f"Re-queued {store.retry_failed()} failed jobs.")
+    else:
+        kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+        if args.processes <= 1:
+            Worker(store, kinds=kinds, lease_s=args.lease).run(once=args.once)
+        else:
+            # One listener owns the log files for all worker processes
+            with LogListener() as listener:
+                ctx = multiprocessing.get_context("spawn")
+                procs = []
+                for i in range(args.processes):
+                    p = ctx.Process(target=_worker_process,
+                                    args=(listener.queue, args.db, kinds, args.lease, args.once, i))
+                    p.start()
+                    procs.append(p)
+                try:
+                    for p in procs:
+                        p.join()
+                except KeyboardInterrupt:
+                    for p in procs:
+                        p.join()
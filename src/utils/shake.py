@@ -0,0 +1,148 @@
+"""Camera shake scoring from GCSV gyro data, to stabilize only the recordings that need it"""
+import argparse
+import json
+import os
+import numpy as np
+from scipy.signal import butter, sosfiltfilt
+from utils.config_manager import ConfigManager
+
+config = ConfigManager()
+
+
+def shake_settings():
+    """Metric settings from the 'shake' section of config.yaml (the shake task's parameters)."""
+    return {
+        "highpass_hz": float(config.get("shake.highpass_hz", 1.0)),
+        "window_s": float(config.get("shake.window_s", 1.0)),
+        "threshold_dps": float(config.get("shake.threshold_dps", 15.0)),
+    }
+
+
+def windowed_rms(x, window):
+    """RMS of consecutive non-overlapping windows of x (N x channels), summed over channels."""
+    n = len(x) // window
+    if n == 0:
+        return np.zeros(0)
+    blocks = x[:n * window].reshape(n, window, -1)
+    return np.sqrt((blocks ** 2).sum(axis=2).mean(axis=1))
+
+
+def shaky_segments(rms, window_s, threshold, pad_s=0.5):
+    """Windows above threshold merged into (start, end) segments, padded by pad_s."""
+    shaky = np.concatenate([[False], rms > threshold, [False]])
+    edges = np.flatnonzero(np.diff(shaky.astype(np.int8)))
+    segments = []
+    for start, end in zip(edges[::2] * window_s, edges[1::2] * window_s):
+        start, end = max(float(start) - pad_s, 0.0), float(end) + pad_s
+        if segments and start <= segments[-1][1]:
+            segments[-1][1] = end
+        else:
+            segments.append([start, end])
+    return segments
+
+
+def shake_metrics(data, highpass_hz=1.0, window_s=1.0, threshold_dps=15.0):
+    """
+    Shake of one recording from its gyro channels, all vectorized.
+
+    The angular rate is high-pass filtered (zero phase) to drop deliberate
+    motion such as turns and pans, then reduced to an RMS per window. The
+    acceleration jerk percentile is reported alongside.
+
+    :param data: CSVManager.data
+    :return: Dict with the score (95th percentile window RMS, deg/s), the
+             share of shaky windows, the shaky segments, jerk_p95 (g/s)
+             and the duration
+    """
+    t = data["time_s"].to_numpy()
+    duration = float(t[-1] - t[0]) if len(t) > 1 else 0.0
+    if duration <= 0:
+        return {"score": 0.0, "shaky_fraction": 0.0, "segments": [], "jerk_p95": 0.0, "duration": duration}
+    fs = (len(t) - 1) / duration
+
+    gyro = data[["rx_deg", "ry_deg", "rz_deg"]].to_numpy(dtype=float)
+    sos = butter(2, min(highpass_hz, fs / 2 * 0.9), btype="highpass", fs=fs, output="sos")
+    if len(gyro) > 3 * (2 * len(sos) + 1):
+        gyro = sosfiltfilt(sos, gyro, axis=0)
+    else:
+        gyro = gyro - gyro.mean(axis=0)
+
+    window = max(1, int(round(window_s * fs)))
+    rms = windowed_rms(gyro, window)
+    accel = data[["ax_g", "ay_g", "az_g"]].to_numpy(dtype=float)
+    jerk = np.linalg.norm(np.diff(accel, axis=0), axis=1) * fs
+
+    return {
+        "score": float(np.percentile(rms, 95)) if len(rms) else 0.0,
+        "shaky_fraction": float((rms > threshold_dps).mean()) if len(rms) else 0.0,
+        "segments": shaky_segments(rms, window / fs, threshold_dps),
+        "jerk_p95": float(np.percentile(jerk, 95)) if len(jerk) else 0.0,
+        "duration": duration,
+    }
+
+
+def needs_stabilization(metrics, min_shaky_fraction=None):
+    """
+    Policy: stabilize when at least min_shaky_fraction of the windows are
+    shaky (shake.min_shaky_fraction by default).
+    """
+    if min_shaky_fraction is None:
+        min_shaky_fraction = float(config.get("shake.min_shaky_fraction", 0.1))
+    return metrics["shaky_fraction"] >= min_shaky_fraction
+
+
+def score_gcsv(gcsv_path, settings=None):
+    """shake_metrics of a GCSV file, with the settings from config.yaml by default."""
+    from utils.manage_csv import CSVManager
+    return shake_metrics(CSVManager(gcsv_path).data, **(settings or shake_settings()))
+
+
+def stabilize_rate(store):
+    """
+    Seconds of gyroflow per second of footage, from the durations the task
+    store recorded for past stabilize runs and the cached probe durations.
+    None until something was stabilized.
+    """
+    from utils.media_probe import probe
+    compute, footage = 0.0, 0.0
+    for name, duration in store.durations("stabilize"):
+        video_path = name.split(":", 1)[1]
+        try:
+            video_duration = probe(video_path)["duration"]
+        except Exception:
+            continue
+        if video_duration:
+            compute += duration
+            footage += video_duration
+    return compute / footage if footage else None
+
+
+def skipped_report(skipped_metrics, rate=None):
+    """How much footage, and roughly how much gyroflow time, a policy saved."""
+    footage = sum(m["duration"] for m in skipped_metrics)
+    return {
+        "recordings": len(skipped_metrics),
+        "footage_s": round(footage, 1),
+        "compute_s": round(footage * rate, 1) if rate else None,
+    }
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score camera shake from GCSV gyro data.")
+    parser.add_argument("paths", nargs="+", help="GCSV files, or videos with a GCSV next to them.")
+    parser.add_argument("--json", action="store_true", help="Print the full metrics as JSON.")
+    args = parser.parse_args()
+
+    settings = shake_settings()
+    results = {}
+    for path in args.paths:
+        gcsv_path = path if path.lower().endswith(".gcsv") else os.path.splitext(path)[0] + ".gcsv"
+        metrics = score_gcsv(gcsv_path, settings)
+        results[path] = metrics
+        if not args.json:
+            verdict = "stabilize" if needs_stabilization(metrics) else "skip"
+            print(f"{verdict:<9} score {metrics['score']:6.1f} deg/s  shaky {metrics['shaky_fraction']:5.0%}  "
+                  f"jerk p95 {metrics['jerk_p95']:6.1f} g/s  {path}")
+    if args.json:
+        print(json.dumps(results, indent=2))
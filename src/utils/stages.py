@@ -0,0 +1,326 @@
+"""Pipeline tasks for each processing stage of a recording"""
+import argparse
+import json
+import os
+from functools import partial
+from pathlib import Path
+from utils.config_manager import ConfigManager
+from utils.pipeline import Task, TaskStore, Pipeline, SkipTask
+from utils.extract_audio_wav import extract_audio_ffmpeg
+from utils.manage_csv import CSVManager
+from utils.highlight_planner import plan_highlights
+from utils.shake import score_gcsv, shake_settings
+from utils.sync_offset import write_offset, sync_settings, sync_path
+from utils.loudness import analyze as analyze_loudness, clip_gains, loudness_settings, profile_path
+from utils.media_probe import probe
+from utils.render_queue import get_job_store, run_remote
+from utils.storage_manager import get_storage_manager
+from utils.edit_video import get_interval_clip, create_highlight_clips, join_clips, encoder_settings
+from gyroflow.run_gyroflow import run_gyroflow, stabilized_output_path
+
+config = ConfigManager()
+
+STAGES = ("ingest", "audio", "loudness", "sync", "peaks", "shake", "stabilize", "clips", "reel")
+RECORDING_STAGES = ("audio", "loudness", "sync", "peaks", "shake", "stabilize", "clips", "reel")
+
+def peak_params():
+    """Peak detection parameters from the 'peaks' section of config.yaml."""
+    return {
+        "kind": config.get("peaks.kind", "acceleration"),
+        "top_n": int(config.get("peaks.top_n", 5)),
+    }
+
+def clip_params():
+    """
+    Clip export parameters from config.yaml. The encoder settings are part of
+    the task signature, so changing the CRF or preset re-exports the clips.
+    """
+    return {
+        "clip_duration": [float(config.get("peaks.clip_before", 0.5)), float(config.get("peaks.clip_after", 1.5))],
+        "encoder": encoder_settings(),
+        "plan": planner_settings(),
+        "loudness": loudness_settings(),
+    }
+
+def planner_settings():
+    """The 'planner' section of config.yaml, or None when no target duration is set."""
+    target = config.get("planner.target_duration")
+    if not target:
+        return None
+    return {
+        "target_duration": float(target),
+        "min_gap": float(config.get("planner.min_gap", 1.0)),
+        "scales": [float(x) for x in config.get("planner.scales", [0.5, 1.0, 1.5, 2.0])],
+    }
+
+_store = None
+
+def create_pipeline():
+    """Returns an empty pipeline sharing the persistent task store."""
+    global _store
+    if _store is None:
+        pipeline_config = config.config.get("pipeline", {})
+        _store = TaskStore(pipeline_config.get("state_db", os.path.expanduser("~/cache/pipeline.db")))
+    return Pipeline(_store, storage=get_storage_manager())
+
+def stage_workers(overrides=None):
+    """
+    Worker counts from config.yaml, as accepted by Pipeline.run.
+
+    :param overrides: Optional dict of stage -> worker count taking precedence
+    """
+    workers = config.config.get("pipeline", {}).get("workers", 2)
+    if not isinstance(workers, dict):
+        workers = {"default": int(workers)}
+    workers = dict(workers)
+    workers.update(overrides or {})
+    return workers
+
+def recording_paths(video_path):
+    """Paths of every file derived from a recording."""
+    video_dir = os.path.dirname(video_path)
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    clips_dir = os.path.join(video_dir, "clips")
+    # A stabilized version keeps the raw recording's timeline, so it shares its
+    # gyro data, sync offset and audio analysis
+    source_name = base_name[:-len("_stabilized")] if base_name.endswith("_stabilized") else base_name
+    gcsv_path = os.path.join(video_dir, f"{source_name}.gcsv")
+    audio_path = os.path.join(video_dir, "audio", f"{source_name}.wav")
+    return {
+        "video": video_path,
+        "gcsv": gcsv_path,
+        "sync": sync_path(gcsv_path),
+        "audio": audio_path,
+        "loudness": profile_path(audio_path),
+        "peaks": os.path.join(video_dir, f"{base_name}_peaks.json"),
+        "shake": os.path.join(video_dir, f"{base_name}_shake.json"),
+        "stabilized": str(stabilized_output_path(video_path)),
+        "clips_dir": clips_dir,
+        "manifest": os.path.join(clips_dir, f"{base_name}_clips.json"),
+        "reel": os.path.join(clips_dir, f"{base_name}_highlights.mp4"),
+    }
+
+def is_derived_video(video_path):
+    """True for files the pipeline wrote itself: stabilized versions, clips and reels."""
+    path = Path(video_path)
+    return path.stem.endswith("_stabilized") or path.parent.name == "clips"
+
+# --- Stage actions ---
+
+def _extract_audio(video_path, audio_path):
+    os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+    if not extract_audio_ffmpeg(video_path, audio_path):
+        raise RuntimeError(f"audio extraction failed for {video_path}")
+
+def _analyze_loudness(audio_path, loudness_path):
+    if not os.path.exists(audio_path) and os.path.exists(loudness_path):
+        # The storage manager evicted the WAV; the profile is all the clips need
+        raise SkipTask("audio evicted, keeping the stored loudness profile")
+    analyze_loudness(audio_path, loudness_path)
+
+def _detect_peaks(gcsv_path, peaks_path, kind, top_n):
+    peaks = CSVManager(gcsv_path).detect_peaks(kind=kind, top_n=top_n, plot=False)
+    with open(peaks_path, 'w') as f:
+        json.dump([{"time": float(t), "value": float(v)} for t, v in peaks], f, indent=2)
+
+def _score_shake(gcsv_path, shake_path, **settings):
+    with open(shake_path, 'w') as f:
+        json.dump(score_gcsv(gcsv_path, settings), f, indent=2)
+
+def _stabilize(video_path):
+    if get_job_store() is not None:
+        run_remote("stabilize", {"video_path": video_path}, dedupe_key=f"stabilize:{video_path}")
+        return
+    if run_gyroflow(video_path) is None:
+        raise RuntimeError(f"stabilization failed for {video_path}")
+
+def _export_clips(video_path, peaks_path, clips_dir, manifest_path, clip_duration, encoder=None, plan=None,
+                  loudness=None, audio_path=None):
+    with open(peaks_path) as f:
+        peaks = [(p["time"], p["value"]) for p in json.load(f)]
+    peak_times = [t for t, _ in peaks]
+
+    clip_paths = []
+    if peak_times:
+        if plan:
+            # Only the windows that fit the reel are ever encoded
+            clips_duration = plan_highlights(
+                peaks, plan["target_duration"], tuple(clip_duration),
+                video_duration=probe(video_path)["duration"],
+                min_gap=plan["min_gap"], scales=plan["scales"]
+            )
+        else:
+            clips_duration = get_interval_clip(peak_times, clip_duration=tuple(clip_duration))
+        # One gain per window from the stored profile: no measuring pass at render time
+        gains = clip_gains(audio_path, clips_duration, loudness) if loudness and audio_path else None
+        if get_job_store() is not None:
+            clip_paths = run_remote("clips", {
+                "video_path": video_path,
+                "clips_duration": clips_duration,
+                "output_folder": clips_dir,
+                "encoder": encoder,
+                "gains": gains,
+            }, dedupe_key=f"clips:{video_path}")["clips"]
+        else:
+            clip_paths = create_highlight_clips(video_path, clips_duration, clips_dir, join=False, encoder=encoder,
+                                                gains=gains)
+    else:
+        print(f"  ⚠️  No peaks found for {video_path}, no clips exported.")
+
+    os.makedirs(clips_dir, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(clip_paths, f, indent=2)
+
+def _build_reel(manifest_path, reel_path, encoder=None):
+    with open(manifest_path) as f:
+        clip_paths = json.load(f)
+    if not clip_paths:
+        raise SkipTask("no clips to join")
+    join_clips(clip_paths, reel_path, encoder=encoder)
+
+# --- Task builders ---
+
+def add_ingest_tasks(pipeline, camera, base_path):
+    """Adds one copy task per recording found on the mounted camera."""
+    tasks = []
+    for base_name, file_paths in camera.list_recordings().items():
+        dest_dir = os.path.join(base_path, base_name)
+        tasks.append(pipeline.add(Task(
+            f"ingest:{dest_dir}",
+            "ingest",
+            partial(camera.copy_recording, base_name, file_paths, base_path),
+            inputs=file_paths,
+            outputs=[os.path.join(dest_dir, os.path.basename(p)) for p in file_paths]
+        )))
+    return tasks
+
+def add_recording_tasks(pipeline, video_path, stages=RECORDING_STAGES):
+    """
+    Adds the tasks of the given stages for one recording.
+    Dependencies are only declared between stages added together.
+    """
+    paths = recording_paths(video_path)
+    has_gcsv = os.path.exists(paths["gcsv"])
+    added = {}
+
+    def name(stage):
+        return f"{stage}:{video_path}"
+
+    def deps(*wanted):
+        return [name(s) for s in wanted if s in added]
+
+    # The raw recording's own tasks produce the audio and offset a stabilized version uses
+    owns_source = not Path(video_path).stem.endswith("_stabilized")
+
+    if "audio" in stages and owns_source:
+        added["audio"] = pipeline.add(Task(
+            name("audio"), "audio",
+            partial(_extract_audio, video_path, paths["audio"]),
+            inputs=[video_path],
+            outputs=[paths["audio"]]
+        ))
+
+    if "loudness" in stages and owns_source:
+        added["loudness"] = pipeline.add(Task(
+            name("loudness"), "loudness",
+            partial(_analyze_loudness, paths["audio"], paths["loudness"]),
+            inputs=[paths["audio"]],
+            outputs=[paths["loudness"]],
+            deps=deps("audio")
+        ))
+
+    if not has_gcsv:
+        if set(stages) - {"audio", "loudness"}:
+            print(f"  ⚠️  GCSV file not found: {paths['gcsv']}, skipping gyro stages.")
+        return list(added.values())
+
+    # Gyro stages read their times through the stored offset, so a new offset re-runs them
+    gyro_inputs = [paths["gcsv"], paths["sync"]] if config.get("sync.enabled", True) else [paths["gcsv"]]
+
+    if "sync" in stages and owns_source and config.get("sync.enabled", True):
+        params = sync_settings()
+        added["sync"] = pipeline.add(Task(
+            name("sync"), "sync",
+            partial(write_offset, video_path, paths["gcsv"], **params),
+            inputs=[video_path, paths["gcsv"]],
+            outputs=[paths["sync"]],
+            params=params
+        ))
+
+    if "peaks" in stages:
+        params = peak_params()
+        added["peaks"] = pipeline.add(Task(
+            name("peaks"), "peaks",
+            partial(_detect_peaks, paths["gcsv"], paths["peaks"], **params),
+            inputs=gyro_inputs,
+            outputs=[paths["peaks"]],
+            params=params,
+            deps=deps("sync")
+        ))
+
+    if "shake" in stages:
+        params = shake_settings()
+        added["shake"] = pipeline.add(Task(
+            name("shake"), "shake",
+            partial(_score_shake, paths["gcsv"], paths["shake"], **params),
+            inputs=gyro_inputs,
+            outputs=[paths["shake"]],
+            params=params,
+            deps=deps("sync")
+        ))
+
+    if "stabilize" in stages:
+        settings_path = Path(__file__).parent.parent / "gyroflow" / "settings.gyroflow"
+        added["stabilize"] = pipeline.add(Task(
+            name("stabilize"), "stabilize",
+            partial(_stabilize, video_path),
+            inputs=[video_path, paths["gcsv"], settings_path],
+            outputs=[paths["stabilized"]]
+        ))
+
+    if "clips" in stages:
+        params = clip_params()
+        added["clips"] = pipeline.add(Task(
+            name("clips"), "clips",
+            partial(_export_clips, video_path, paths["peaks"], paths["clips_dir"],
+                    paths["manifest"], audio_path=paths["audio"], **params),
+            inputs=[video_path, paths["peaks"]] + ([paths["loudness"]] if params["loudness"] else []),
+            outputs=[paths["manifest"]],
+            params=params,
+            deps=deps("peaks")
+        ))
+
+    if "reel" in stages:
+        params = {"encoder": encoder_settings()}
+        added["reel"] = pipeline.add(Task(
+            name("reel"), "reel",
+            partial(_build_reel, paths["manifest"], paths["reel"], **params),
+            inputs=[paths["manifest"]],
+            outputs=[paths["reel"]],
+            params=params,
+            deps=deps("clips")
+        ))
+
+    return list(added.values())
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    from main import list_videos
+
+    parser = argparse.ArgumentParser(description="Run or preview the per-recording pipeline stages.")
+    parser.add_argument("--stages", default="audio,loudness,sync,peaks,clips,reel",
+                        help=f"Comma-separated stages among {', '.join(RECORDING_STAGES)}.")
+    parser.add_argument("--workers", type=int, default=None, help="Overall worker count (default: from config.yaml).")
+    parser.add_argument("--dry-run", action="store_true", help="Only show which tasks would run.")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    pipeline = create_pipeline()
+    for video in list_videos(config.config.get("camera_path", "")):
+        add_recording_tasks(pipeline, video, stages)
+
+    workers = args.workers if args.workers else stage_workers()
+    results = pipeline.run(stages=stages, workers=workers, dry_run=args.dry_run)
+    if not args.dry_run:
+        for task_name, (status, duration) in results.items():
+            print(f"{status:>10} {duration:7.2f}s {task_name}")
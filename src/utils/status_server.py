@@ -0,0 +1,247 @@
+"""Local HTTP endpoint with the live pipeline status, as JSON and Prometheus text"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.config_manager import ConfigManager
+from utils.metrics import metrics, ErrorLogHandler
+from utils.render_queue import get_job_store
+from utils.storage_manager import get_storage_manager
+
+config = ConfigManager()
+
+# Loopback only: the status lists file paths and nothing here is authenticated
+HOST = "127.0.0.1"
+PREFIX = "actioncam"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def queue_depths():
+    """Render queue jobs per kind and status, or {} when the queue is disabled."""
+    store = get_job_store()
+    if store is None:
+        return {}
+    depths = {}
+    for (kind, status), count in store.counts().items():
+        depths.setdefault(kind, {})[status] = count
+    return depths
+
+
+def disk_usage():
+    """
+    Total, used and free bytes of the file systems holding the library and
+    the archive, plus the bytes the storage manager tracks per kind.
+    """
+    disks = {}
+    for name, path in (("camera_path", config.get("camera_path", "")),
+                       ("archive_path", config.get("storage.archive_path"))):
+        if path and os.path.isdir(path):
+            usage = shutil.disk_usage(path)
+            disks[name] = {"path": path, "total": usage.total, "used": usage.used, "free": usage.free}
+    storage = get_storage_manager()
+    return {"disks": disks, "tracked": storage.usage()["artifacts"] if storage is not None else []}
+
+
+def collect(registry=metrics):
+    """The registry's snapshot plus what is read from disk on each request."""
+    status = registry.snapshot()
+    for key, source in (("render_queue", queue_depths), ("disk", disk_usage)):
+        try:
+            status[key] = source()
+        except Exception as e:
+            # A locked or missing DB must not take the whole page down
+            status[key] = {"error": str(e)}
+    return status
+
+
+# --- Prometheus text format ---
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _number(value):
+    # Exact integers and shortest round-tripping floats; %g would truncate byte counts and timestamps
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _sample(name, labels, value):
+    label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return f"{PREFIX}_{name}{{{label_text}}} {_number(value)}" if labels else f"{PREFIX}_{name} {_number(value)}"
+
+
+def to_prometheus(status):
+    """Renders a collect() result in the Prometheus text exposition format."""
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+        lines.extend(_sample(name, labels, value) for labels, value in samples)
+
+    family("uptime_seconds", "gauge", "Seconds since the daemon started.", [({}, status["uptime_s"])])
+    family("phase_info", "gauge", "What main.py is doing.", [({"phase": status["phase"]}, 1)])
+    family("phase_seconds", "gauge", "Seconds spent in the current phase.", [({}, status["phase_s"])])
+    family("task_running_seconds", "gauge", "Age of every task currently running.",
+           [({"stage": r["stage"], "task": r["task"]}, r["running_s"]) for r in status["running"]])
+    family("tasks_pending", "gauge", "Tasks waiting in the current pipeline run.",
+           [({"stage": stage}, n) for stage, n in sorted(status["pending"].items())])
+    family("tasks_total", "counter", "Finished tasks by stage and status.",
+           [({"stage": stage, "status": s}, n)
+            for stage, counts in sorted(status["tasks"].items()) for s, n in sorted(counts.items())])
+
+    spans = sorted(status["spans"].items())
+    family("span_total", "counter", "Timed spans by stage.", [({"stage": s}, t["count"]) for s, t in spans])
+    family("span_failures_total", "counter", "Timed spans that failed.", [({"stage": s}, t["failed"]) for s, t in spans])
+    family("span_seconds_total", "counter", "Seconds spent in spans.", [({"stage": s}, t["seconds"]) for s, t in spans])
+    family("span_bytes_total", "counter", "Bytes processed in spans.", [({"stage": s}, t["bytes"]) for s, t in spans])
+    family("span_frames_total", "counter", "Video frames rendered in spans.",
+           [({"stage": s}, t["frames"]) for s, t in spans if t["frames"]])
+    family("span_megabytes_per_second", "gauge", "Recent throughput while working, in MB/s.",
+           [({"stage": s}, t["mb_per_s"]) for s, t in spans])
+    family("span_frames_per_second", "gauge", "Recent rendering speed while working, in frames/s.",
+           [({"stage": s}, t["frames_per_s"]) for s, t in spans])
+
+    caches = sorted(status["caches"].items())
+    family("cache_hits_total", "counter", "Cache lookups that hit.", [({"cache": c}, v["hits"]) for c, v in caches])
+    family("cache_misses_total", "counter", "Cache lookups that missed.", [({"cache": c}, v["misses"]) for c, v in caches])
+    family("cache_hit_ratio", "gauge", "Share of cache lookups that hit.", [({"cache": c}, v["hit_rate"]) for c, v in caches])
+
+    queue = status.get("render_queue", {})
+    if "error" not in queue:
+        family("render_queue_jobs", "gauge", "Render queue jobs by kind and status.",
+               [({"kind": kind, "status": s}, n)
+                for kind, counts in sorted(queue.items()) for s, n in sorted(counts.items())])
+
+    disk = status.get("disk", {})
+    if "error" not in disk:
+        disks = sorted(disk.get("disks", {}).items())
+        for field in ("total", "used", "free"):
+            family(f"disk_{field}_bytes", "gauge", f"{field.capitalize()} bytes of the file system.",
+                   [({"volume": name, "path": d["path"]}, d[field]) for name, d in disks])
+        family("storage_tracked_bytes", "gauge", "Bytes the storage manager tracks per kind and state.",
+               [({"kind": a["kind"], "state": a["state"]}, a["bytes"]) for a in disk.get("tracked", [])])
+
+    family("errors_total", "counter", "Errors recorded since the daemon started.", [({}, status["errors_total"])])
+    if status["errors"]:
+        family("last_error_timestamp_seconds", "gauge", "Time of the most recent error.",
+               [({}, status["errors"][-1]["time"])])
+    return "\n".join(lines) + "\n"
+
+
+# --- Server ---
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        status = collect(self.server.registry) if path in ("/", "/status", "/metrics") else None
+        if status is None:
+            self._send(404, "text/plain; charset=utf-8", "Not found. Try /metrics or /status.\n")
+        elif path == "/metrics":
+            self._send(200, PROMETHEUS_CONTENT_TYPE, to_prometheus(status))
+        else:
+            self._send(200, "application/json", json.dumps(status, indent=2))
+
+    def _send(self, code, content_type, text):
+        body = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # A scrape every few seconds would bury the pipeline's own output
+        pass
+
+
+class StatusServer:
+    """
+    Serves /metrics (Prometheus text) and /status (JSON) on HOST:port from
+    a daemon thread, so a stalled gyroflow job or a slow card reader shows
+    without tailing logs. While running, ERROR records of every Logger are
+    also kept as recent errors.
+    """
+    def __init__(self, port=None, registry=metrics):
+        self.port = int(port if port is not None else config.get("status_server.port", 9187))
+        self.registry = registry
+        self.registry.rate_window_s = float(config.get("status_server.rate_window_s", registry.rate_window_s))
+        self._server = None
+        self._thread = None
+        self._log_handler = ErrorLogHandler(registry)
+
+    def start(self):
+        """Starts serving; returns self, or None if the port is taken."""
+        try:
+            self._server = ThreadingHTTPServer((HOST, self.port), _Handler)
+        except OSError as e:
+            print(f"⚠️  Status server not started on {HOST}:{self.port}: {e}")
+            return None
+        self._server.daemon_threads = True
+        self._server.registry = self.registry
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="status-server", daemon=True)
+        self._thread.start()
+        logging.getLogger().addHandler(self._log_handler)
+        print(f"📊 Status on http://{HOST}:{self.port}/status and /metrics")
+        return self
+
+    def stop(self):
+        logging.getLogger().removeHandler(self._log_handler)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._thread.join()
+
+
+def fetch_status(port=None, timeout=5.0):
+    """The /status of the daemon running on this machine."""
+    port = int(port if port is not None else config.get("status_server.port", 9187))
+    with urllib.request.urlopen(f"http://{HOST}:{port}/status", timeout=timeout) as response:
+        return json.load(response)
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the status of the running pipeline daemon.")
+    parser.add_argument("--port", type=int, default=None, help="Status server port (default: from config.yaml).")
+    parser.add_argument("--json", action="store_true", help="Print the raw status JSON.")
+    args = parser.parse_args()
+
+    try:
+        status = fetch_status(args.port)
+    except OSError as e:
+        print(f"❌ No status server answering: {e}")
+        raise SystemExit(1)
+
+    if args.json:
+        print(json.dumps(status, indent=2))
+    else:
+        print(f"Phase: {status['phase']} for {status['phase_s']:.0f}s (up {status['uptime_s'] / 3600:.1f} h)")
+        for r in status["running"]:
+            print(f"  running {r['running_s']:>8.0f}s  [{r['stage']}] {r['task']}")
+        if status["pending"]:
+            print("  pending " + ", ".join(f"{s}: {n}" for s, n in sorted(status["pending"].items())))
+        for stage, t in sorted(status["spans"].items()):
+            rates = [f"{t['mb_per_s']:.1f} MB/s" if t["mb_per_s"] else "", f"{t['frames_per_s']:.1f} fps" if t["frames_per_s"] else ""]
+            print(f"  {stage:<18} {t['count']:>6} spans {t['failed']:>4} failed  {' '.join(r for r in rates if r)}")
+        for name, c in sorted(status["caches"].items()):
+            rate = f"{c['hit_rate']:.0%}" if c["hit_rate"] is not None else "-"
+            print(f"  cache {name:<14} {rate:>5} of {c['hits'] + c['misses']} lookups")
+        for kind, counts in sorted(status.get("render_queue", {}).items()):
+            if isinstance(counts, dict):
+                print(f"  queue {kind:<14} " + ", ".join(f"{s}: {n}" for s, n in sorted(counts.items())))
+        for name, d in sorted(status.get("disk", {}).get("disks", {}).items()):
+            print(f"  disk  {name:<14} {d['used'] / 1e9:.1f} of {d['total'] / 1e9:.1f} GB used ({d['used'] / d['total']:.0%})")
+        for e in status["errors"][-10:]:
+            print(f"  ❌ {time.strftime('%H:%M:%S', time.localtime(e['time']))} {e['source']}: {e['message']}")
@@ -0,0 +1,383 @@
+"""Tracks the files of every recording and keeps the ingest disk under its budget"""
+import argparse
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from utils.config_manager import ConfigManager
+
+config = ConfigManager()
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi')
+# Kinds the pipeline can produce again from the raw footage
+REGENERABLE = ("audio", "stabilized")
+
+
+def classify(path):
+    """Kind of a file inside a recording folder, from the layout recording_paths() uses."""
+    path = Path(path)
+    name = path.name.lower()
+    if path.parent.name == "audio" and name.endswith(".wav"):
+        return "audio"
+    if path.parent.name == "clips":
+        return "clips"
+    if path.stem.endswith("_stabilized") or name.endswith("_synchronized.gcsv"):
+        return "stabilized"
+    if name.endswith("_peaks.json"):
+        return "peaks"
+    if name.endswith(".gcsv") or name.endswith(VIDEO_EXTENSIONS):
+        return "raw"
+    return "other"
+
+
+def recording_of(path):
+    """Recording folder a file belongs to (the one holding the raw video)."""
+    path = Path(path)
+    if path.parent.name in ("audio", "clips"):
+        return str(path.parent.parent)
+    return str(path.parent)
+
+
+def _manifests(recording):
+    clips_dir = Path(recording) / "clips"
+    return list(clips_dir.glob("*_clips.json")) if clips_dir.is_dir() else []
+
+
+def is_finished(recording):
+    """A recording is finished once clips were exported for its raw video."""
+    for manifest in _manifests(recording):
+        stem = manifest.name[:-len("_clips.json")]
+        if not stem.endswith("_stabilized"):
+            return True
+    return False
+
+
+class StorageManager:
+    """
+    Index of every file under camera_path with its size and last use.
+
+    When the tracked files exceed budget_bytes, or the disk is fuller than
+    high_watermark, regenerable files of finished recordings are evicted
+    least recently used first until the disk is back under low_watermark.
+    Raw footage of recordings finished more than archive_after_days ago can
+    be moved to a slower archive_path.
+
+    Evicted and archived files are remembered, and the pipeline treats them
+    as present (see Pipeline.is_stale), so nothing is produced again unless
+    its inputs change or it is restored.
+
+    Stabilized outputs are hard links of stabilization cache entries; with
+    the cache given, evicting one also drops its entry, so the space is
+    actually freed.
+    """
+    def __init__(self, db_file, base_path, budget_bytes=None, high_watermark=0.9, low_watermark=0.8,
+                 evict=REGENERABLE, min_idle_hours=24, archive_path=None, archive_after_days=14,
+                 cache=None):
+        self.db_file = db_file
+        self.base_path = base_path
+        self.budget_bytes = budget_bytes
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.evict_kinds = [k for k in evict if k in REGENERABLE]
+        self.min_idle_s = min_idle_hours * 3600
+        self.archive_path = archive_path
+        self.archive_after_s = archive_after_days * 86400
+        self.cache = cache
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    path TEXT PRIMARY KEY,
+                    recording TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'present',
+                    archive_path TEXT,
+                    changed REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_state_used ON artifacts (state, last_used)")
+            self._retired = {r[0] for r in conn.execute("SELECT path FROM artifacts WHERE state != 'present'")}
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Tracking ---
+
+    def _row(self, path, last_used):
+        st = os.stat(path)
+        return (path, recording_of(path), classify(path), st.st_size, last_used, time.time())
+
+    def touch(self, paths):
+        """Records a use of the given files now; files that came back are present again."""
+        now = time.time()
+        root = os.path.join(os.path.abspath(self.base_path), "")
+        rows = []
+        for path in paths:
+            path = os.path.abspath(path)
+            # Files on the camera or in caches are not ours to manage
+            if path.startswith(root) and os.path.isfile(path):
+                rows.append(self._row(path, now))
+        if not rows:
+            return
+        with self._lock, self._connect() as conn:
+            conn.executemany('''
+                INSERT INTO artifacts (path, recording, kind, size, last_used, changed)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    size = excluded.size, last_used = excluded.last_used,
+                    state = 'present', archive_path = NULL, changed = excluded.changed
+            ''', rows)
+            self._retired.difference_update(r[0] for r in rows)
+
+    def scan(self):
+        """
+        Adds files not seen yet (their mtime counts as last use), refreshes
+        sizes and drops rows of files deleted by hand.
+        """
+        found = {}
+        for root, _, files in os.walk(self.base_path):
+            for f in files:
+                path = os.path.abspath(os.path.join(root, f))
+                found[path] = os.stat(path)
+        with self._lock, self._connect() as conn:
+            known = {r[0]: r[1] for r in conn.execute("SELECT path, state FROM artifacts")}
+            new_rows = [
+                (path, recording_of(path), classify(path), st.st_size, st.st_mtime, time.time())
+                for path, st in found.items() if path not in known
+            ]
+            conn.executemany('''
+                INSERT INTO artifacts (path, recording, kind, size, last_used, changed)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', new_rows)
+            conn.executemany(
+                "UPDATE artifacts SET size = ?, state = 'present', archive_path = NULL WHERE path = ?",
+                [(st.st_size, path) for path, st in found.items() if path in known]
+            )
+            gone = [path for path, state in known.items() if state == "present" and path not in found]
+            conn.executemany("DELETE FROM artifacts WHERE path = ?", [(p,) for p in gone])
+            self._retired.difference_update(found)
+        return len(new_rows), len(gone)
+
+    def is_retired(self, path):
+        """True for files this manager evicted or archived on purpose."""
+        return os.path.abspath(path) in self._retired
+
+    def usage(self):
+        """Tracked bytes per kind and state, plus the disk usage of base_path."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT kind, state, COUNT(*), COALESCE(SUM(size), 0) FROM artifacts GROUP BY kind, state"
+            ).fetchall()
+        disk = shutil.disk_usage(self.base_path)
+        return {
+            "artifacts": [{"kind": k, "state": s, "files": n, "bytes": b} for k, s, n, b in rows],
+            "disk": {"total": disk.total, "used": disk.used, "free": disk.free},
+        }
+
+    # --- Enforcement ---
+
+    def _tracked_bytes(self, conn):
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts WHERE state = 'present'").fetchone()[0]
+
+    def _over(self, tracked, disk, target_fraction):
+        if self.budget_bytes is not None and tracked > self.budget_bytes:
+            return True
+        return target_fraction is not None and disk.used / disk.total > target_fraction
+
+    def _retire(self, conn, path, state, archive_path=None):
+        conn.execute("UPDATE artifacts SET state = ?, archive_path = ?, changed = ? WHERE path = ?",
+                     (state, archive_path, time.time(), path))
+        self._retired.add(path)
+
+    def archive(self, dry_run=False):
+        """Moves raw footage of recordings finished long enough ago to archive_path."""
+        if not self.archive_path:
+            return []
+        cutoff = time.time() - self.archive_after_s
+        with self._connect() as conn:
+            rows = conn.execute('''
+                SELECT recording, MAX(last_used) FROM artifacts
+                WHERE state = 'present' GROUP BY recording
+            ''').fetchall()
+        moved = []
+        for recording, last_used in rows:
+            if last_used > cutoff or not is_finished(recording):
+                continue
+            with self._connect() as conn:
+                files = [r[0] for r in conn.execute(
+                    "SELECT path FROM artifacts WHERE recording = ? AND kind = 'raw' AND state = 'present'",
+                    (recording,))]
+            for path in files:
+                dst = os.path.join(self.archive_path, os.path.relpath(path, self.base_path))
+                moved.append((path, dst))
+                if dry_run:
+                    continue
+                try:
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    shutil.move(path, dst)
+                except OSError as e:
+                    print(f"❌ Error archiving {path}: {e}")
+                    moved.pop()
+                    continue
+                with self._lock, self._connect() as conn:
+                    self._retire(conn, path, "archived", dst)
+        return moved
+
+    def evict(self, dry_run=False):
+        """
+        Deletes regenerable files of finished recordings, least recently used
+        first, while the tracked bytes or the disk are over their limits.
+        Stabilization cache entries linked to an evicted file are dropped
+        with it; files with other hard links free nothing and are skipped.
+        """
+        if not self.evict_kinds:
+            return []
+        disk = shutil.disk_usage(self.base_path)
+        with self._connect() as conn:
+            tracked = self._tracked_bytes(conn)
+            if not self._over(tracked, disk, self.high_watermark):
+                return []
+            placeholders = ",".join("?" * len(self.evict_kinds))
+            rows = conn.execute(f'''
+                SELECT path, recording, size FROM artifacts
+                WHERE state = 'present' AND kind IN ({placeholders}) AND last_used < ?
+                ORDER BY last_used ASC
+            ''', (*self.evict_kinds, time.time() - self.min_idle_s)).fetchall()
+
+        used = disk.used
+        evicted = []
+        finished = {}
+        for path, recording, size in rows:
+            if not self._over(tracked, disk._replace(used=used), self.low_watermark):
+                break
+            if recording not in finished:
+                finished[recording] = is_finished(recording)
+            if not finished[recording]:
+                continue
+            try:
+                cached = self.cache.keys_linked_to(path) if self.cache is not None else []
+                if os.stat(path).st_nlink - len(cached) > 1:
+                    continue
+                if not dry_run:
+                    for key in cached:
+                        self.cache.remove(key)
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"❌ Error evicting {path}: {e}")
+                continue
+            if not dry_run:
+                with self._lock, self._connect() as conn:
+                    self._retire(conn, path, "evicted")
+            evicted.append(path)
+            tracked -= size
+            used -= size
+        return evicted
+
+    def enforce(self, dry_run=False):
+        """Scans base_path, archives finished raw footage, then evicts down to the limits."""
+        self.scan()
+        archived = self.archive(dry_run)
+        evicted = self.evict(dry_run)
+        if archived and not dry_run:
+            print(f"📦 Archived {len(archived)} raw files to {self.archive_path}")
+        if evicted and not dry_run:
+            print(f"🧹 Evicted {len(evicted)} regenerable files")
+        return {"archived": archived, "evicted": evicted}
+
+    def restore(self, recording):
+        """
+        Brings archived raw footage of a recording back, and forgets evicted
+        files so the pipeline produces them again.
+        """
+        recording = os.path.abspath(recording)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT path, state, archive_path FROM artifacts WHERE recording = ? AND state != 'present'",
+                (recording,)).fetchall()
+        for path, state, archive_path in rows:
+            if state == "archived" and archive_path and os.path.exists(archive_path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shutil.move(archive_path, path)
+                self.touch([path])
+                continue
+            with self._lock, self._connect() as conn:
+                conn.execute("DELETE FROM artifacts WHERE path = ?", (path,))
+                self._retired.discard(path)
+        return [r[0] for r in rows]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_storage_manager():
+    """The shared manager for camera_path, or None when storage.enabled is off."""
+    global _manager
+    if not config.get("storage.enabled", False):
+        return None
+    from gyroflow.run_gyroflow import get_stabilization_cache
+    with _manager_lock:
+        if _manager is None:
+            _manager = StorageManager(
+                config.get("storage.db", os.path.expanduser("~/cache/storage.db")),
+                config.get("camera_path", ""),
+                archive_path=config.get("storage.archive_path"),
+            )
+        _manager.cache = get_stabilization_cache()
+        # Limits are re-read so edits apply while running
+        _manager.budget_bytes = config.get("storage.budget_bytes")
+        _manager.high_watermark = config.get("storage.high_watermark")
+        _manager.low_watermark = config.get("storage.low_watermark", _manager.high_watermark)
+        _manager.evict_kinds = [k for k in config.get("storage.evict", list(REGENERABLE)) if k in REGENERABLE]
+        _manager.min_idle_s = float(config.get("storage.min_idle_hours", 24)) * 3600
+        _manager.archive_path = config.get("storage.archive_path")
+        _manager.archive_after_s = float(config.get("storage.archive_after_days", 14)) * 86400
+    return _manager
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and enforce the ingest disk budget.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="Tracked bytes per kind and disk usage.")
+    enforce_parser = sub.add_parser("enforce", help="Archive and evict down to the configured limits.")
+    enforce_parser.add_argument("--dry-run", action="store_true", help="Only list what would move or be deleted.")
+    restore_parser = sub.add_parser("restore", help="Bring a recording's files back.")
+    restore_parser.add_argument("recording", help="Recording folder under camera_path.")
+    args = parser.parse_args()
+
+    manager = get_storage_manager()
+    if manager is None:
+        print("❌ storage.enabled is off in config.yaml.")
+        raise SystemExit(1)
+
+    if args.command == "status":
+        manager.scan()
+        usage = manager.usage()
+        for row in sorted(usage["artifacts"], key=lambda r: (r["kind"], r["state"])):
+            print(f"{row['kind']:<11} {row['state']:<9} {row['files']:>6} files {row['bytes'] / 1e9:>9.2f} GB")
+        disk = usage["disk"]
+        print(f"Disk: {disk['used'] / 1e9:.1f} of {disk['total'] / 1e9:.1f} GB used ({disk['used'] / disk['total']:.0%})")
+    elif args.command == "enforce":
+        result = manager.enforce(dry_run=args.dry_run)
+        for src, dst in result["archived"]:
+            print(f"  archive {src} -> {dst}")
+        for path in result["evicted"]:
+            print(f"  evict   {path}")
+    elif args.command == "restore":
+        for path in manager.restore(args.recording):
+            print(f"  restored {path}")
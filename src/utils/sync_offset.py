@@ -0,0 +1,208 @@
+"""Gyro-to-video time offset from low-resolution optical flow, stored for every later stage"""
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
+from utils.config_manager import ConfigManager
+from utils.fingerprint import lagged_pearson
+
+config = ConfigManager()
+
+
+def sync_settings():
+    """Estimator settings from the 'sync' section of config.yaml (the sync task's parameters)."""
+    return {
+        "probe_s": float(config.get("sync.probe_s", 30.0)),
+        "rate_hz": float(config.get("sync.rate_hz", 30.0)),
+        "flow_width": int(config.get("sync.flow_width", 160)),
+        "max_offset_s": float(config.get("sync.max_offset_s", 5.0)),
+        "min_confidence": float(config.get("sync.min_confidence", 0.5)),
+    }
+
+
+def sync_path(gcsv_path):
+    """Sidecar holding the offset of a recording, next to its GCSV."""
+    return f"{os.path.splitext(gcsv_path)[0]}_sync.json"
+
+
+def load_offset(gcsv_path):
+    """
+    Seconds to subtract from GCSV times to get video times; 0.0 when the
+    recording was never synced or the estimate was not trusted.
+    """
+    try:
+        with open(sync_path(gcsv_path)) as f:
+            return float(json.load(f).get("offset_s", 0.0))
+    except (OSError, ValueError):
+        return 0.0
+
+
+def flow_rotation(video_path, start_s, duration_s, rate_hz=30.0, width=160):
+    """
+    Camera rotation rate seen in the video: dense optical flow between
+    frames downscaled to width pixels and decimated to about rate_hz.
+    Pan/tilt is the mean flow and roll the flow's rotation about the
+    image centre, both in radians-like units (flow / half width).
+
+    :return: (times in video seconds, rotation rate per second)
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError(f"could not open {video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, int(round(fps / rate_hz)))
+        cap.set(cv2.CAP_PROP_POS_MSEC, start_s * 1000.0)
+        first = int(round(start_s * fps))
+
+        times, rates = [], []
+        prev, prev_t, grid = None, None, None
+        for i in range(int(duration_s * fps)):
+            # grab() skips the colour conversion of frames that are dropped
+            if not cap.grab():
+                break
+            if i % step:
+                continue
+            ok, frame = cap.retrieve()
+            if not ok:
+                break
+            height = max(1, int(round(frame.shape[0] * width / frame.shape[1])))
+            gray = cv2.cvtColor(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA),
+                                cv2.COLOR_BGR2GRAY)
+            t = (first + i) / fps
+            if prev is not None:
+                flow = cv2.calcOpticalFlowFarneback(prev, gray, None, 0.5, 2, 9, 2, 5, 1.1, 0)
+                if grid is None:
+                    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+                    grid = (xs - width / 2, ys - height / 2)
+                    grid = (*grid, (grid[0]**2 + grid[1]**2).sum())
+                u, v = flow[..., 0], flow[..., 1]
+                pan, tilt = u.mean() / (width / 2), v.mean() / (width / 2)
+                roll = (grid[0] * v - grid[1] * u).sum() / grid[2]
+                rates.append(np.sqrt(pan**2 + tilt**2 + roll**2) / (t - prev_t))
+                times.append((t + prev_t) / 2)
+            prev, prev_t = gray, t
+        return np.asarray(times), np.asarray(rates)
+    finally:
+        cap.release()
+
+
+def _resample(t, x, grid, rate_hz):
+    """x on a uniform grid, box-averaged over one grid step first so vibration doesn't alias."""
+    source_hz = (len(t) - 1) / (t[-1] - t[0]) if len(t) > 1 and t[-1] > t[0] else rate_hz
+    window = int(source_hz / rate_hz)
+    if window > 1:
+        x = np.convolve(x, np.full(window, 1.0 / window), mode="same")
+    return np.interp(grid, t, x)
+
+
+def gyro_rate(data):
+    """(times, angular rate magnitude in deg/s) of CSVManager data."""
+    gyro = data[["rx_deg", "ry_deg", "rz_deg"]].to_numpy(dtype=float)
+    return data["time_s"].to_numpy(), np.sqrt((gyro**2).sum(axis=1))
+
+
+def probe_window(times, rate, duration_s, probe_s, step_s=1.0):
+    """
+    Start of the probe_s window of the recording where the gyro moves the
+    most: a featureless stretch correlates with anything.
+    """
+    if duration_s <= probe_s:
+        return 0.0
+    grid = np.arange(0.0, duration_s, step_s)
+    per_step = np.interp(grid, times, rate)
+    n = max(1, int(probe_s / step_s))
+    c1 = np.concatenate([[0.0], np.cumsum(per_step)])
+    c2 = np.concatenate([[0.0], np.cumsum(per_step**2)])
+    var = (c2[n:] - c2[:-n]) / n - ((c1[n:] - c1[:-n]) / n)**2
+    return float(grid[int(np.argmax(var))])
+
+
+def estimate_offset(flow_t, flow, gyro_t, gyro, rate_hz=30.0, max_offset_s=5.0):
+    """
+    Offset that best aligns the optical flow with the gyro: the peak of
+    their Pearson correlation over every lag up to max_offset_s, found in
+    near-linear time from one FFT correlation, refined to a fraction of a
+    sample with a parabola through the peak.
+
+    :return: (offset_s, correlation); gcsv time = video time + offset_s
+    """
+    if len(flow_t) < 10:
+        return 0.0, 0.0
+    flow_grid = np.arange(flow_t[0], flow_t[-1], 1.0 / rate_hz)
+    gyro_grid = np.arange(max(flow_grid[0] - max_offset_s, gyro_t[0]),
+                          min(flow_grid[-1] + max_offset_s, gyro_t[-1]), 1.0 / rate_hz)
+    if len(gyro_grid) < 10:
+        return 0.0, 0.0
+    a = _resample(gyro_t, gyro, gyro_grid, rate_hz)
+    b = _resample(flow_t, flow, flow_grid, rate_hz)
+
+    lags, r = lagged_pearson(a, b, len(a), int(len(b) * 0.8))
+    offsets = gyro_grid[0] + lags / rate_hz - flow_grid[0]
+    within = np.abs(offsets) <= max_offset_s
+    if not within.any():
+        return 0.0, 0.0
+    lags, r, offsets = lags[within], r[within], offsets[within]
+    best = int(np.argmax(r))
+    offset = offsets[best]
+    if 0 < best < len(r) - 1 and lags[best + 1] - lags[best - 1] == 2:
+        y0, y1, y2 = r[best - 1], r[best], r[best + 1]
+        curvature = y0 - 2 * y1 + y2
+        if curvature < 0:
+            offset += 0.5 * (y0 - y2) / curvature / rate_hz
+    return float(offset), float(r[best])
+
+
+def estimate(video_path, gcsv_path, probe_s=30.0, rate_hz=30.0, flow_width=160, max_offset_s=5.0,
+             min_confidence=0.5):
+    """
+    Offset of a recording, with its confidence and probe segment. Below
+    min_confidence the offset applied downstream stays 0.
+
+    :return: Dict with offset_s (applied), estimated_offset_s, confidence,
+             probe_start_s, probe_s and elapsed_s
+    """
+    from utils.manage_csv import CSVManager
+    from utils.media_probe import probe
+    start = time.perf_counter()
+    gyro_t, gyro = gyro_rate(CSVManager(gcsv_path, offset_s=0.0).data)
+    duration = probe(video_path)["duration"] or float(gyro_t[-1])
+
+    probe_start = probe_window(gyro_t, gyro, duration, probe_s)
+    flow_t, flow = flow_rotation(video_path, probe_start, min(probe_s, duration), rate_hz, flow_width)
+    offset, confidence = estimate_offset(flow_t, flow, gyro_t, gyro, rate_hz, max_offset_s)
+    return {
+        "offset_s": round(offset, 4) if confidence >= min_confidence else 0.0,
+        "estimated_offset_s": round(offset, 4),
+        "confidence": round(confidence, 3),
+        "probe_start_s": probe_start,
+        "probe_s": min(probe_s, duration),
+        "elapsed_s": round(time.perf_counter() - start, 2),
+    }
+
+
+def write_offset(video_path, gcsv_path, **settings):
+    """Estimates the offset of a recording and writes its sidecar."""
+    result = estimate(video_path, gcsv_path, **(settings or sync_settings()))
+    if result["offset_s"] == 0.0 and result["estimated_offset_s"] != 0.0:
+        print(f"⚠️  Low sync confidence ({result['confidence']:.2f}) for {video_path}, keeping the GCSV times.")
+    with open(sync_path(gcsv_path), 'w') as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate the time offset between videos and their GCSV gyro data.")
+    parser.add_argument("videos", nargs="+", help="Videos with a GCSV next to them.")
+    parser.add_argument("--write", action="store_true", help="Store the offsets for the pipeline stages.")
+    args = parser.parse_args()
+
+    settings = sync_settings()
+    for video in args.videos:
+        gcsv = os.path.splitext(video)[0] + ".gcsv"
+        result = write_offset(video, gcsv, **settings) if args.write else estimate(video, gcsv, **settings)
+        print(f"{result['estimated_offset_s']:+8.3f}s  confidence {result['confidence']:.2f}  "
+              f"(probe {result['probe_start_s']:.0f}s+{result['probe_s']:.0f}s, {result['elapsed_s']:.1f}s)  {video}")